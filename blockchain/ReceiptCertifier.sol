@@ -12,6 +12,8 @@ pragma solidity ^0.8.0;
  * - Store receipt certificate hashes on-chain
  * - Timestamp-based proof of existence
  * - Verification of certificate authenticity
+ * - Batch certification: one Merkle root for many receipts, with
+ *   per-receipt inclusion proofs (see batch_certify.py)
  * - Event emission for off-chain indexing
  */
 contract ReceiptCertifier {
@@ -33,6 +35,24 @@ contract ReceiptCertifier {
     // Counter for total certificates issued
     uint256 public totalCertificates;
     
+    // Structure to store a certified batch (Merkle root of many receipts)
+    struct Batch {
+        address certifier;        // Address that certified the batch
+        uint256 timestamp;        // Block timestamp when certified
+        uint256 size;             // Number of receipts under the root
+        bool exists;              // Flag to check if batch exists
+    }
+    
+    // Mapping from Merkle root to Batch struct
+    mapping(bytes32 => Batch) public batches;
+    
+    // Mapping to track batch roots by user address
+    mapping(address => bytes32[]) public userBatches;
+    
+    // Counters for batches and the receipts they contain
+    uint256 public totalBatches;
+    uint256 public totalBatchedReceipts;
+    
     // Events
     event ReceiptCertified(
         bytes32 indexed certificateId,
@@ -46,6 +66,13 @@ contract ReceiptCertifier {
         bool isValid
     );
     
+    event BatchCertified(
+        bytes32 indexed merkleRoot,
+        address indexed certifier,
+        uint256 size,
+        uint256 timestamp
+    );
+    
     /**
      * @dev Certify a receipt by storing its hash on-chain
      * @param _receiptHash SHA-256 hash of the receipt data
@@ -148,4 +175,103 @@ contract ReceiptCertifier {
         
         return false;
     }
+    
+    /**
+     * @dev Certify a batch of receipts by storing the root of their Merkle tree
+     * @param _merkleRoot Root over receiptLeaf() of every receipt in the batch
+     * @param _size Number of receipts in the batch
+     * 
+     * One transaction certifies the whole batch; each receipt is later
+     * proven with verifyInclusion(). Same access model as certifyReceipt().
+     */
+    function certifyBatch(bytes32 _merkleRoot, uint256 _size) external {
+        require(_size > 0, "Empty batch");
+        require(!batches[_merkleRoot].exists, "Batch already certified");
+        
+        batches[_merkleRoot] = Batch({
+            certifier: msg.sender,
+            timestamp: block.timestamp,
+            size: _size,
+            exists: true
+        });
+        
+        userBatches[msg.sender].push(_merkleRoot);
+        totalBatches++;
+        totalBatchedReceipts += _size;
+        
+        emit BatchCertified(_merkleRoot, msg.sender, _size, block.timestamp);
+    }
+    
+    /**
+     * @dev Merkle leaf of a receipt
+     * @param _receiptHash SHA-256 hash of the receipt data (as for certifyReceipt)
+     * @param _imageHash SHA-256 hash of the receipt image, or zero without image
+     * @return The leaf hash (0x00 prefix keeps leaves distinct from inner nodes)
+     */
+    function receiptLeaf(bytes32 _receiptHash, bytes32 _imageHash) 
+        public 
+        pure 
+        returns (bytes32) 
+    {
+        return sha256(abi.encodePacked(bytes1(0x00), _receiptHash, _imageHash));
+    }
+    
+    /**
+     * @dev Verify that a receipt is part of a certified batch
+     * @param _merkleRoot Root the receipt was certified under
+     * @param _receiptHash SHA-256 hash of the receipt data
+     * @param _imageHash SHA-256 hash of the receipt image, or zero without image
+     * @param _proof Sibling hashes from the leaf up to the root
+     * @return isValid True if the batch exists and the proof leads to its root
+     * @return certifier Address that certified the batch
+     * @return timestamp When the batch was certified
+     * 
+     * Inner nodes hash the sorted pair (0x01 || min || max), so the proof
+     * needs no left/right flags.
+     */
+    function verifyInclusion(
+        bytes32 _merkleRoot,
+        bytes32 _receiptHash,
+        bytes32 _imageHash,
+        bytes32[] calldata _proof
+    ) 
+        external 
+        view 
+        returns (
+            bool isValid,
+            address certifier,
+            uint256 timestamp
+        ) 
+    {
+        Batch memory batch = batches[_merkleRoot];
+        if (!batch.exists) {
+            return (false, address(0), 0);
+        }
+        
+        bytes32 node = receiptLeaf(_receiptHash, _imageHash);
+        for (uint i = 0; i < _proof.length; i++) {
+            bytes32 sibling = _proof[i];
+            node = node < sibling
+                ? sha256(abi.encodePacked(bytes1(0x01), node, sibling))
+                : sha256(abi.encodePacked(bytes1(0x01), sibling, node));
+        }
+        
+        if (node != _merkleRoot) {
+            return (false, address(0), 0);
+        }
+        return (true, batch.certifier, batch.timestamp);
+    }
+    
+    /**
+     * @dev Get all batch roots certified by a specific user
+     * @param _user Address of the user
+     * @return Array of Merkle roots
+     */
+    function getUserBatches(address _user) 
+        external 
+        view 
+        returns (bytes32[] memory) 
+    {
+        return userBatches[_user];
+    }
 }
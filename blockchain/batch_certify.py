@@ -0,0 +1,496 @@
+"""
+Batch receipt certification with Merkle roots
+
+certifyReceipt() costs one transaction per receipt, which is what makes
+back-certifying an archive slow and expensive. This tool certifies a whole
+batch of receipts with a single certifyBatch(root, size) transaction:
+
+- every receipt is hashed exactly like CertificateService.generateReceiptHash
+  (certificate_service.dart: canonical sorted-key JSON, SHA-256, 0x hex), and
+  its image file, when available, with SHA-256 of the raw bytes. Hashing
+  runs on a process pool
+- the leaves of a batch form a SHA-256 Merkle tree (the EVM has a SHA-256
+  precompile, so the contract verifies with the same hash):
+      leaf = sha256(0x00 || receiptHash || imageHash)   imageHash = 0x00..00 without image
+      node = sha256(0x01 || min(a, b) || max(a, b))      an odd last node moves up as is
+- only the root is submitted; each receipt gets an inclusion proof that
+  ReceiptCertifier.verifyInclusion() (or verify_proof() here) checks
+  against it
+- progress is recorded per batch, so an interrupted run resumes and never
+  submits a root twice
+
+Output (in --output):
+    batches.jsonl           one line per certified batch (root, size, chain id,
+                            contract, tx, gas)
+    proofs/<root>.jsonl     one line per receipt: id, hashes, leaf, proof
+
+The dump is a CSV export of the receipts table (database_schema.sql).
+Hashing needs only the standard library; submitting needs web3, and
+--eth-tester (in-memory chain) also needs eth-tester and py-solc-x, which
+installs the pinned solc (SOLC_VERSION) on first use (see requirements.txt).
+
+Usage:
+    python batch_certify.py --input receipts.csv --images-dir ./images --dry-run
+    python batch_certify.py --input receipts.csv --eth-tester
+    CERTIFIER_PRIVATE_KEY=0x... python batch_certify.py --input receipts.csv \\
+        --rpc-url https://rpc.example --contract 0xYourContract
+"""
+
+import os
+import csv
+import sys
+import json
+import time
+import hashlib
+import argparse
+from decimal import Decimal, ROUND_HALF_UP
+from datetime import datetime, timezone
+from urllib.parse import urlparse, unquote
+from concurrent.futures import ProcessPoolExecutor
+
+# Paths
+HERE = os.path.dirname(os.path.abspath(__file__))
+CONTRACT_PATH = os.path.join(HERE, 'ReceiptCertifier.sol')
+ABI_PATH = os.path.join(HERE, '..', 'assets', 'blockchain', 'ReceiptCertifier.json')
+OUTPUT_DIR = 'certification'
+
+# Configuration
+BATCH_SIZE = 4096          # receipts per Merkle root (proofs have log2(size) hashes)
+HASH_CHUNK_SIZE = 1024 * 1024
+VERIFY_SAMPLE = 3          # receipts per batch re-checked on-chain after submission
+BATCH_CERTIFIED_EVENT = 'BatchCertified(bytes32,address,uint256,uint256)'
+KEY_ENV = 'CERTIFIER_PRIVATE_KEY'
+SOLC_VERSION = '0.8.24'    # --eth-tester compiler, installed by py-solc-x on first use
+
+LEAF_PREFIX = b'\x00'
+NODE_PREFIX = b'\x01'
+ZERO_HASH = bytes(32)
+
+# ----------------------------------------------------------------------------
+# Receipt hashing (must match certificate_service.dart byte for byte)
+# ----------------------------------------------------------------------------
+
+def dart_fixed2(amount):
+    """double.toStringAsFixed(2): exact binary value, ties away from zero"""
+    return str(Decimal(float(amount)).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP))
+
+def dart_iso8601(value):
+    """
+    DateTime.parse(value).toIso8601String()
+
+    Timestamps with an offset become UTC with a trailing 'Z' (as Dart does
+    for Supabase timestamptz values); microseconds are printed only when
+    non-zero.
+    """
+    parsed = datetime.fromisoformat(value.strip())
+    suffix = ''
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc)
+        suffix = 'Z'
+    millis, micros = divmod(parsed.microsecond, 1000)
+    return (f'{parsed.year:04d}-{parsed:%m-%dT%H:%M:%S}.{millis:03d}'
+            f'{f"{micros:03d}" if micros else ""}{suffix}')
+
+def canonical_receipt_json(record):
+    """The JSON string generateReceiptHash() hashes (keys sorted, no spaces)"""
+    data = {
+        'id': record['id'],
+        'user_id': record.get('user_id'),
+        'merchant': record.get('merchant'),
+        'amount': dart_fixed2(record['amount']),
+        'date': dart_iso8601(record['date']),
+        'category': record.get('category'),
+        'ocr_text': record.get('ocr_text') or '',
+    }
+    # jsonEncode only escapes '"', '\\' and control characters
+    return json.dumps(dict(sorted(data.items())), ensure_ascii=False, separators=(',', ':'))
+
+def receipt_hash(record):
+    """0x-prefixed SHA-256 of the canonical receipt JSON"""
+    return '0x' + hashlib.sha256(canonical_receipt_json(record).encode('utf-8')).hexdigest()
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return '0x' + digest.hexdigest()
+
+def image_path(image_url, images_dir):
+    """
+    Local copy of a receipt image
+
+    Looks for the storage object path (bucket/user/file.jpg) under
+    images_dir, then for the bare file name.
+    """
+    if not image_url or not images_dir:
+        return None
+    url_path = unquote(urlparse(image_url).path)
+    object_path = url_path.split('/object/', 1)[-1]
+    if object_path.startswith(('public/', 'sign/', 'authenticated/')):
+        object_path = object_path.split('/', 1)[1]
+    for candidate in (object_path.lstrip('/'), os.path.basename(url_path)):
+        path = os.path.join(images_dir, candidate)
+        if os.path.isfile(path):
+            return path
+    return None
+
+def hash_receipt(job):
+    """
+    Receipt and image hash of one record (runs in a worker process)
+
+    Returns:
+        (receipt_hash, image_hash or None, error or None)
+    """
+    record, images_dir = job
+    try:
+        record_hash = receipt_hash(record)
+    except (KeyError, TypeError, ValueError) as e:
+        return None, None, f'invalid record: {e}'
+    path = image_path(record.get('image_url'), images_dir)
+    if record.get('image_url') and images_dir and path is None:
+        return record_hash, None, 'image not found'
+    try:
+        return record_hash, file_sha256(path) if path else None, None
+    except OSError as e:
+        return record_hash, None, str(e)
+
+# ----------------------------------------------------------------------------
+# Merkle tree (mirrors ReceiptCertifier.receiptLeaf / verifyInclusion)
+# ----------------------------------------------------------------------------
+
+def to_bytes32(value):
+    return bytes.fromhex(value[2:] if value.startswith('0x') else value)
+
+def to_hex(value):
+    return '0x' + value.hex()
+
+def leaf_hash(receipt_hash_hex, image_hash_hex=None):
+    image = to_bytes32(image_hash_hex) if image_hash_hex else ZERO_HASH
+    return hashlib.sha256(LEAF_PREFIX + to_bytes32(receipt_hash_hex) + image).digest()
+
+def node_hash(a, b):
+    return hashlib.sha256(NODE_PREFIX + min(a, b) + max(a, b)).digest()
+
+def build_tree(leaves):
+    """All levels of the tree, leaves first and the root last"""
+    if not leaves:
+        raise ValueError("Cannot build a Merkle tree without leaves")
+    levels = [list(leaves)]
+    while len(levels[-1]) > 1:
+        level = levels[-1]
+        levels.append([node_hash(level[i], level[i + 1]) if i + 1 < len(level) else level[i]
+                       for i in range(0, len(level), 2)])
+    return levels
+
+def merkle_proof(levels, index):
+    """Sibling hashes from a leaf up to the root (levels without a sibling are skipped)"""
+    proof = []
+    for level in levels[:-1]:
+        sibling = index ^ 1
+        if sibling < len(level):
+            proof.append(level[sibling])
+        index //= 2
+    return proof
+
+def verify_proof(leaf, proof, root):
+    node = leaf
+    for sibling in proof:
+        node = node_hash(node, sibling)
+    return node == root
+
+# ----------------------------------------------------------------------------
+# Contract access (web3 is only imported when submitting)
+# ----------------------------------------------------------------------------
+
+class CertifierContract:
+    """certifyBatch / batches / verifyInclusion of a deployed ReceiptCertifier"""
+
+    def __init__(self, w3, contract, account, private_key=None):
+        self.w3 = w3
+        self.contract = contract
+        self.account = account
+        self.private_key = private_key
+        self.chain_id = w3.eth.chain_id
+        self.address = contract.address
+
+    def is_certified(self, root):
+        return self.contract.functions.batches(root).call()[3]
+
+    def certify_batch(self, root, size):
+        """Submit a root and wait for it to be mined; returns (tx hash, gas used)"""
+        call = self.contract.functions.certifyBatch(root, size)
+        if self.private_key:
+            tx = call.build_transaction({
+                'from': self.account,
+                'nonce': self.w3.eth.get_transaction_count(self.account),
+            })
+            signed = self.w3.eth.account.sign_transaction(tx, self.private_key)
+            raw = getattr(signed, 'raw_transaction', None) or signed.rawTransaction
+            tx_hash = self.w3.eth.send_raw_transaction(raw)
+        else:
+            tx_hash = call.transact({'from': self.account})
+        receipt = self.w3.eth.wait_for_transaction_receipt(tx_hash)
+        if receipt['status'] != 1:
+            raise RuntimeError(f"certifyBatch reverted (tx {to_hex(bytes(tx_hash))})")
+        return to_hex(bytes(tx_hash)), receipt['gasUsed']
+
+    def find_certification(self, root):
+        """
+        (tx hash, gas used) of the certifyBatch that stored `root`, from its
+        BatchCertified event; (None, None) if the node can't return the log
+        """
+        try:
+            logs = self.w3.eth.get_logs({
+                'address': self.address,
+                'fromBlock': 0,
+                'topics': [to_hex(bytes(self.w3.keccak(text=BATCH_CERTIFIED_EVENT))), to_hex(root)],
+            })
+        except Exception as e:  # e.g. a provider that limits the block range
+            print(f"   - Could not look up the BatchCertified event: {e}")
+            return None, None
+        if not logs:
+            return None, None
+        tx_hash = logs[0]['transactionHash']
+        receipt = self.w3.eth.get_transaction_receipt(tx_hash)
+        return to_hex(bytes(tx_hash)), receipt['gasUsed']
+
+    def verify(self, root, receipt_hash_hex, image_hash_hex, proof):
+        is_valid, _, _ = self.contract.functions.verifyInclusion(
+            root, to_bytes32(receipt_hash_hex),
+            to_bytes32(image_hash_hex) if image_hash_hex else ZERO_HASH, proof
+        ).call()
+        return is_valid
+
+def connect_rpc(rpc_url, address, private_key):
+    """ReceiptCertifier deployed at `address`, signing with `private_key`"""
+    from web3 import Web3
+    w3 = Web3(Web3.HTTPProvider(rpc_url))
+    with open(ABI_PATH) as f:
+        abi = json.load(f)
+    account = w3.eth.account.from_key(private_key).address
+    contract = w3.eth.contract(address=Web3.to_checksum_address(address), abi=abi)
+    return CertifierContract(w3, contract, account, private_key)
+
+def connect_eth_tester(contract_path=CONTRACT_PATH, solc_version=SOLC_VERSION):
+    """
+    Fresh ReceiptCertifier on an in-memory eth-tester chain
+
+    The pinned solc is downloaded into ~/.solcx on the first run (the only
+    network access) and reused afterwards.
+    """
+    import solcx
+    from web3 import Web3, EthereumTesterProvider
+    solcx.install_solc(solc_version)
+    compiled = solcx.compile_files([contract_path], output_values=['abi', 'bin'],
+                                   solc_version=solc_version)
+    interface = next(v for k, v in compiled.items() if k.endswith(':ReceiptCertifier'))
+    w3 = Web3(EthereumTesterProvider())
+    account = w3.eth.accounts[0]
+    factory = w3.eth.contract(abi=interface['abi'], bytecode=interface['bin'])
+    receipt = w3.eth.wait_for_transaction_receipt(factory.constructor().transact({'from': account}))
+    contract = w3.eth.contract(address=receipt['contractAddress'], abi=interface['abi'])
+    print(f"   - Deployed ReceiptCertifier to eth-tester at {receipt['contractAddress']}")
+    return CertifierContract(w3, contract, account)
+
+# ----------------------------------------------------------------------------
+# Batch pipeline
+# ----------------------------------------------------------------------------
+
+def read_batches(path, batch_size=BATCH_SIZE):
+    """Stream a receipts CSV dump in lists of at most batch_size records"""
+    csv.field_size_limit(sys.maxsize)  # OCR text can exceed the 128 KB default
+    with open(path, newline='', encoding='utf-8') as f:
+        batch = []
+        for row in csv.DictReader(f):
+            batch.append({k: (v if v != '' else None) for k, v in row.items()})
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+def load_certified(output_dir):
+    """Batches recorded by earlier runs: root -> list of records (one per chain/contract)"""
+    path = os.path.join(output_dir, 'batches.jsonl')
+    certified = {}
+    if not os.path.exists(path):
+        return certified
+    with open(path) as f:
+        for record in map(json.loads, f):
+            if record.get('merkle_root'):
+                certified.setdefault(record['merkle_root'], []).append(record)
+    return certified
+
+def already_done(records, chain, root):
+    """
+    Whether a batch recorded by an earlier run can be skipped
+
+    A dry run skips any recorded root, so it never overwrites the proofs of
+    a submitted batch. Otherwise the root must have been recorded for this
+    chain and contract and still be there: a fresh --eth-tester chain, or
+    another --rpc-url/--contract, gets every batch again. The record's
+    tx_hash doesn't matter; it is None when the transaction was not found.
+    """
+    if chain is None:
+        return bool(records)
+    return any(
+        record.get('chain_id') == chain.chain_id and record.get('contract') == chain.address
+        for record in records
+    ) and chain.is_certified(to_bytes32(root))
+
+def write_proofs(path, entries):
+    with open(path + '.tmp', 'w') as f:
+        for entry in entries:
+            f.write(json.dumps(entry) + '\n')
+    os.replace(path + '.tmp', path)
+
+def build_batch(records, hashes):
+    """
+    Merkle tree and inclusion proofs of one batch
+
+    Args:
+        records: receipt dicts of the batch
+        hashes: hash_receipt() result per record
+
+    Returns:
+        (batch record or None if nothing could be hashed, proof entries, failed records)
+    """
+    entries, failed = [], []
+    for record, (record_hash, image_hash, error) in zip(records, hashes):
+        if record_hash is None or error:
+            failed.append({'receipt_id': record.get('id'), 'error': error})
+            continue
+        entries.append({'receipt_id': record['id'], 'receipt_hash': record_hash,
+                        'image_hash': image_hash, 'leaf': leaf_hash(record_hash, image_hash)})
+    if not entries:
+        return None, [], failed
+
+    levels = build_tree([entry['leaf'] for entry in entries])
+    root = to_hex(levels[-1][0])
+    for i, entry in enumerate(entries):
+        entry.update(leaf=to_hex(entry['leaf']), merkle_root=root,
+                     proof=[to_hex(node) for node in merkle_proof(levels, i)], tx_hash=None)
+
+    batch = {'merkle_root': root, 'size': len(entries),
+             'first_id': entries[0]['receipt_id'], 'last_id': entries[-1]['receipt_id'],
+             'chain_id': None, 'contract': None, 'tx_hash': None, 'gas_used': None,
+             'failed': len(failed)}
+    return batch, entries, failed
+
+def submit_batch(batch, entries, chain, verify_sample=VERIFY_SAMPLE):
+    """Certify a batch root on-chain and spot-check proofs with verifyInclusion"""
+    root = to_bytes32(batch['merkle_root'])
+    if chain.is_certified(root):  # submitted by a run that died before recording it
+        print(f"   - Root {batch['merkle_root'][:18]}... already on-chain, not resubmitting")
+        batch['tx_hash'], batch['gas_used'] = chain.find_certification(root)
+    else:
+        batch['tx_hash'], batch['gas_used'] = chain.certify_batch(root, batch['size'])
+    batch['chain_id'], batch['contract'] = chain.chain_id, chain.address
+
+    step = max(1, len(entries) // max(verify_sample, 1))
+    for entry in entries[::step][:verify_sample]:
+        if not chain.verify(root, entry['receipt_hash'], entry['image_hash'],
+                            [to_bytes32(node) for node in entry['proof']]):
+            raise RuntimeError(f"On-chain proof check failed for receipt {entry['receipt_id']}")
+    for entry in entries:
+        entry['tx_hash'] = batch['tx_hash']
+
+def certify_dump(path, output_dir=OUTPUT_DIR, images_dir=None, chain=None,
+                 batch_size=BATCH_SIZE, workers=None, verify_sample=VERIFY_SAMPLE):
+    """
+    Hash, batch and certify every receipt of a dump
+
+    Returns:
+        stats dict
+    """
+    os.makedirs(os.path.join(output_dir, 'proofs'), exist_ok=True)
+    certified = load_certified(output_dir)
+    stats = {'receipts': 0, 'certified': 0, 'skipped': 0, 'failed': 0, 'batches': 0,
+             'gas_used': 0, 'hash_seconds': 0.0}
+    start = time.time()
+
+    with ProcessPoolExecutor(max_workers=workers) as executor, \
+            open(os.path.join(output_dir, 'batches.jsonl'), 'a') as log, \
+            open(os.path.join(output_dir, 'failed.jsonl'), 'a') as failed_log:
+        for index, records in enumerate(read_batches(path, batch_size)):
+            stats['receipts'] += len(records)
+            hash_start = time.time()
+            jobs = [(record, images_dir) for record in records]
+            hashes = list(executor.map(hash_receipt, jobs, chunksize=max(1, len(jobs) // 64)))
+            stats['hash_seconds'] += time.time() - hash_start
+
+            # Batches are deterministic, so a recorded root means a finished batch
+            batch, entries, failed = build_batch(records, hashes)
+            if batch and already_done(certified.get(batch['merkle_root'], []), chain,
+                                      batch['merkle_root']):
+                stats['skipped'] += batch['size']
+                continue
+            if chain is not None and batch:
+                submit_batch(batch, entries, chain, verify_sample)
+
+            for item in failed:
+                failed_log.write(json.dumps(item) + '\n')
+            stats['failed'] += len(failed)
+            if batch is None:
+                continue
+            write_proofs(os.path.join(output_dir, 'proofs', f"{batch['merkle_root']}.jsonl"), entries)
+            batch['index'] = index
+            log.write(json.dumps(batch) + '\n')
+            log.flush()
+            stats['batches'] += 1
+            stats['certified'] += batch['size']
+            stats['gas_used'] += batch['gas_used'] or 0
+            print(f"   - Batch {index}: {batch['size']} receipts, root {batch['merkle_root'][:18]}..."
+                  + (f", tx {batch['tx_hash'][:18]}..., gas {batch['gas_used']}" if batch['tx_hash'] else ''))
+
+    elapsed = time.time() - start
+    stats['receipts_per_sec'] = stats['receipts'] / elapsed if elapsed > 0 else 0.0
+    return stats
+
+def main():
+    parser = argparse.ArgumentParser(description='Certify receipts in Merkle batches')
+    parser.add_argument('--input', required=True, help='CSV export of the receipts table')
+    parser.add_argument('--images-dir', help='Local copy of the receipt images (storage object paths)')
+    parser.add_argument('--output', default=OUTPUT_DIR, help='Batches, proofs and failures')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    parser.add_argument('--workers', type=int, default=None, help='Hashing processes (default: all cores)')
+    parser.add_argument('--verify-sample', type=int, default=VERIFY_SAMPLE,
+                        help='Proofs per batch re-checked with verifyInclusion after submitting')
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument('--dry-run', action='store_true', help='Only compute roots and proofs')
+    target.add_argument('--eth-tester', action='store_true',
+                        help='Deploy to an in-memory eth-tester chain and certify there')
+    target.add_argument('--rpc-url', help=f'JSON-RPC endpoint (signs with ${KEY_ENV})')
+    parser.add_argument('--contract', help='ReceiptCertifier address with --rpc-url')
+    args = parser.parse_args()
+    if args.rpc_url and not (args.contract and os.environ.get(KEY_ENV)):
+        parser.error(f'--rpc-url needs --contract and the {KEY_ENV} environment variable')
+
+    print("=" * 60)
+    print("Batch Receipt Certification")
+    print("=" * 60)
+
+    chain = None
+    if args.eth_tester:
+        chain = connect_eth_tester()
+    elif args.rpc_url:
+        chain = connect_rpc(args.rpc_url, args.contract, os.environ[KEY_ENV])
+
+    print(f"\n Certifying {args.input} in batches of {args.batch_size}...")
+    stats = certify_dump(args.input, args.output, args.images_dir, chain,
+                         args.batch_size, args.workers, args.verify_sample)
+
+    print(f"\n✅ {stats['certified']} receipts in {stats['batches']} batches "
+          f"({stats['receipts_per_sec']:.0f} receipts/sec)")
+    if stats['skipped']:
+        print(f"   - {stats['skipped']} already certified by an earlier run")
+    if stats['failed']:
+        print(f"❌ {stats['failed']} receipts could not be hashed, see {args.output}/failed.jsonl")
+    if stats['gas_used']:
+        print(f"   - Gas: {stats['gas_used']} total, "
+              f"{stats['gas_used'] / max(stats['certified'], 1):.0f} per receipt")
+    print(f"   Proofs: {os.path.join(args.output, 'proofs')}/<merkle root>.jsonl")
+
+if __name__ == '__main__':
+    main()
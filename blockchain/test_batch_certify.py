@@ -0,0 +1,146 @@
+"""
+On-chain checks of batch_certify.py against ReceiptCertifier.sol
+
+Deploys the contract to an in-memory eth-tester chain, certifies batches
+and checks inclusion proofs with verifyInclusion(). The pinned solc
+(batch_certify.SOLC_VERSION) is installed by py-solc-x on the first run;
+those tests are skipped if it cannot be downloaded. Resuming is also
+checked against a fake chain, which needs neither web3 nor network.
+
+Usage:
+    pip install -r blockchain/requirements.txt
+    python -m pytest blockchain/test_batch_certify.py
+"""
+
+import csv
+import json
+
+import pytest
+
+import batch_certify as bc
+
+FIELDS = ['id', 'user_id', 'merchant', 'amount', 'date', 'category', 'ocr_text', 'image_url']
+
+class FakeChain:
+    """In-memory stand-in for CertifierContract (roots and their tx hashes)"""
+
+    def __init__(self, logs=True):
+        self.chain_id, self.address = 1337, '0x' + 'ab' * 20
+        self.roots = {}
+        self.logs = logs
+        self.submitted = 0
+
+    def is_certified(self, root):
+        return root in self.roots
+
+    def certify_batch(self, root, size):
+        self.submitted += 1
+        self.roots[root] = '0x' + f'{len(self.roots) + 1:064x}'
+        return self.roots[root], 21000
+
+    def find_certification(self, root):
+        return (self.roots[root], 21000) if self.logs else (None, None)
+
+    def verify(self, root, receipt_hash_hex, image_hash_hex, proof):
+        return root in self.roots
+
+@pytest.fixture(scope='module')
+def solc():
+    pytest.importorskip('web3')
+    pytest.importorskip('eth_tester')
+    solcx = pytest.importorskip('solcx')
+    try:
+        solcx.install_solc(bc.SOLC_VERSION)
+    except Exception as e:  # first run without network
+        pytest.skip(f'solc {bc.SOLC_VERSION} could not be installed: {e}')
+
+@pytest.fixture
+def chain(solc):
+    return bc.connect_eth_tester()
+
+def make_receipts(count):
+    return [{'id': f'receipt-{i}', 'user_id': 'user-1', 'merchant': f'Shop {i % 3}',
+             'amount': f'{10 + i * 1.25:.2f}', 'date': f'2024-03-{i % 28 + 1:02d}T12:00:00+00:00',
+             'category': 'food', 'ocr_text': f'TOTAL {10 + i * 1.25:.2f}', 'image_url': ''}
+            for i in range(count)]
+
+def write_dump(path, count):
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, FIELDS)
+        writer.writeheader()
+        writer.writerows(make_receipts(count))
+    return str(path)
+
+def proof_bytes(entry):
+    return [bc.to_bytes32(node) for node in entry['proof']]
+
+def test_verify_inclusion(chain, tmp_path):
+    records = make_receipts(5)
+    records[0]['image_url'] = ('https://example.supabase.co/storage/v1/object/public/'
+                               'receipts/user-1/receipt-0.jpg')
+    (tmp_path / 'receipt-0.jpg').write_bytes(b'\xff\xd8 receipt image \xff\xd9')
+
+    hashes = [bc.hash_receipt((record, str(tmp_path))) for record in records]
+    batch, entries, failed = bc.build_batch(records, hashes)
+    assert not failed and entries[0]['image_hash']
+
+    # Checks every proof with verifyInclusion() after submitting
+    bc.submit_batch(batch, entries, chain, verify_sample=len(entries))
+    root = bc.to_bytes32(batch['merkle_root'])
+    assert chain.is_certified(root)
+    assert batch['tx_hash'] and batch['contract'] == chain.address
+
+    entry = entries[0]
+    receipt_hash, image_hash = bc.to_bytes32(entry['receipt_hash']), bc.to_bytes32(entry['image_hash'])
+    assert chain.contract.functions.receiptLeaf(receipt_hash, image_hash).call() == bc.to_bytes32(entry['leaf'])
+
+    is_valid, certifier, _ = chain.contract.functions.verifyInclusion(
+        root, receipt_hash, image_hash, proof_bytes(entry)).call()
+    assert is_valid and certifier == chain.account
+
+    # Tampered image, tampered proof, proof against another root
+    assert not chain.verify(root, entry['receipt_hash'], '0x' + '11' * 32, proof_bytes(entry))
+    tampered = proof_bytes(entry)
+    tampered[0] = bytes([tampered[0][0] ^ 1]) + tampered[0][1:]
+    assert not chain.verify(root, entry['receipt_hash'], entry['image_hash'], tampered)
+    assert not chain.verify(bytes(32), entry['receipt_hash'], entry['image_hash'], proof_bytes(entry))
+
+def test_rerun_skips_only_on_same_chain(solc, tmp_path):
+    dump = write_dump(tmp_path / 'receipts.csv', 10)
+    output = str(tmp_path / 'certification')
+
+    first = bc.connect_eth_tester()
+    stats = bc.certify_dump(dump, output, chain=first, batch_size=4, workers=1)
+    assert (stats['certified'], stats['batches'], stats['skipped']) == (10, 3, 0)
+
+    stats = bc.certify_dump(dump, output, chain=first, batch_size=4, workers=1)
+    assert (stats['certified'], stats['skipped']) == (0, 10)
+
+    # A fresh chain gets the same contract address but none of the roots
+    stats = bc.certify_dump(dump, output, chain=bc.connect_eth_tester(), batch_size=4, workers=1)
+    assert (stats['certified'], stats['skipped']) == (10, 0)
+
+@pytest.mark.parametrize('logs', [True, False])
+def test_rerun_after_unrecorded_submission(tmp_path, logs):
+    dump = write_dump(tmp_path / 'receipts.csv', 10)
+    chain = FakeChain(logs)
+    bc.certify_dump(dump, str(tmp_path / 'lost'), chain=chain, batch_size=4, workers=1)
+    assert chain.submitted == 3
+
+    # The roots are on-chain but this output has no record of them, like a
+    # run that died between submitting and writing batches.jsonl
+    output = str(tmp_path / 'certification')
+    stats = bc.certify_dump(dump, output, chain=chain, batch_size=4, workers=1)
+    assert (stats['certified'], stats['batches']) == (10, 3) and chain.submitted == 3
+
+    batches = list(bc.load_certified(output).items())
+    for root, (record,) in batches:
+        expected = chain.roots[bc.to_bytes32(root)] if logs else None
+        assert record['tx_hash'] == expected
+        with open(f'{output}/proofs/{root}.jsonl') as f:
+            assert all(json.loads(line)['tx_hash'] == expected for line in f)
+
+    # Recorded now, with or without the tx hash: nothing is redone
+    stats = bc.certify_dump(dump, output, chain=chain, batch_size=4, workers=1)
+    assert (stats['certified'], stats['batches'], stats['skipped']) == (0, 0, 10)
+    assert list(bc.load_certified(output).items()) == batches
@@ -0,0 +1,98 @@
+"""
+Single entry point for the training scripts
+
+    python -m training <command> [options]
+
+Each command runs the main() of one of the scripts in this directory with
+the remaining options, exactly as `python <script>.py [options]` would. A
+command's module is imported only when that command runs, so dataset steps
+(verify, organize, manifest, dedupe) never load TensorFlow or matplotlib.
+
+Commands run from the training directory, like the scripts themselves, so
+default paths such as ../dataset resolve from there. Relative paths given
+as options (--input ./photos, --output out.jsonl, ...) are first made
+absolute against the directory the command was started from. Paths inside
+a --file-list are used as written; prefer absolute ones there.
+
+Usage:
+    python -m training verify --full-decode
+    python -m training train --loader packed --fast
+    python -m training finetune --incremental
+    python -m training export --mode int8 --report
+    python -m training <command> --help
+"""
+
+import os
+import sys
+import importlib
+
+TRAINING_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# command -> (module, description)
+COMMANDS = {
+    'prepare': ('prepare_dataset', 'Organize receipts, download non-receipts, index, verify and pack'),
+    'organize': ('organize_images', 'Split downloaded non-receipt images into train/val'),
+    'verify': ('dataset_scanner', 'Scan the dataset for corrupt, unsupported or odd images'),
+    'manifest': ('dataset_manifest', 'Update or query the SQLite dataset manifest'),
+    'dedupe': ('near_duplicates', 'Find near-duplicate images and train/val leakage'),
+    'train': ('train_receipt_detector', 'Train the receipt detector and export it to TFLite'),
+    'finetune': ('quick_finetune', 'Fine-tune the saved model and export it to TFLite'),
+    'export': ('tflite_export', 'Convert a saved Keras model to TFLite'),
+    'bench': ('benchmark_tflite', 'Benchmark TFLite latency across thread counts'),
+    'classify': ('classify_images', 'Score a large image backlog with a saved model'),
+    'mine': ('mine_hard_negatives', 'Add receipt-like non-receipts from an image pool'),
+    'expenses': ('expense_classifier', 'Train or bulk-apply the expense category classifier'),
+}
+
+# Options that take a file or directory (across all commands)
+PATH_OPTIONS = (
+    '--input', '--file-list', '--output', '--model', '--dataset', '--source',
+    '--train-dir', '--val-dir', '--state', '--report', '--images', '--images-dir',
+    '--data-dir',
+)
+
+def resolve_paths(options, cwd):
+    """Make the relative values of PATH_OPTIONS absolute against `cwd`"""
+    resolved, expect_path = [], False
+    for option in options:
+        name, sep, value = option.partition('=')
+        if expect_path and not option.startswith('-'):
+            option = os.path.normpath(os.path.join(cwd, option))  # absolute values stay as they are
+        elif sep and value and name in PATH_OPTIONS:
+            option = f'{name}={os.path.normpath(os.path.join(cwd, value))}'
+        # A flag of the same name (export --report) is followed by another option or nothing
+        expect_path = option in PATH_OPTIONS
+        resolved.append(option)
+    return resolved
+
+def print_usage(out=sys.stdout):
+    print("usage: python -m training <command> [options]\n", file=out)
+    print("commands:", file=out)
+    for name, (module, description) in COMMANDS.items():
+        print(f"  {name:<10} {description} ({module}.py)", file=out)
+    print("\nRun 'python -m training <command> --help' for the options of a command.", file=out)
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv or argv[0] in ('-h', '--help'):
+        print_usage()
+        return 0
+    command, options = argv[0], argv[1:]
+    if command not in COMMANDS:
+        print(f"❌ Unknown command '{command}'\n", file=sys.stderr)
+        print_usage(sys.stderr)
+        return 2
+
+    # The scripts import each other as top-level modules and use paths
+    # relative to this directory
+    options = resolve_paths(options, os.getcwd())
+    sys.path.insert(0, TRAINING_DIR)
+    os.chdir(TRAINING_DIR)
+    sys.argv = [f'python -m training {command}'] + options
+
+    module = importlib.import_module(COMMANDS[command][0])
+    module.main()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,173 @@
+"""
+TFLite inference latency benchmark for receipt_detector.tflite
+
+Runs warmup + N timed invocations of an exported model for each
+combination of thread count and XNNPACK on/off, using real receipt images
+from dataset_small/ as input. Each configuration runs in a fresh process so
+peak RSS is measured per configuration.
+
+Usage:
+    python benchmark_tflite.py --model ../assets/tflite/receipt_detector.tflite \\
+        --output ../models/benchmark.json
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import multiprocessing
+
+import numpy as np
+from PIL import Image
+
+from dataset_manifest import IMAGE_EXTENSIONS
+
+# Defaults
+MODEL_PATH = '../assets/tflite/receipt_detector.tflite'
+IMAGES_DIR = '../dataset_small'
+WARMUP_RUNS = 10
+TIMED_RUNS = 200
+THREAD_COUNTS = (1, 2, 4)
+MAX_IMAGES = 32
+
+def load_images(images_dir, size, max_images=MAX_IMAGES):
+    """Load and resize up to max_images images as float [0, 1] arrays"""
+    paths = []
+    for root, _, files in sorted(os.walk(images_dir)):
+        paths += [os.path.join(root, f) for f in sorted(files)
+                  if f.lower().endswith(IMAGE_EXTENSIONS)]
+    if not paths:
+        raise FileNotFoundError(f"No images found in {images_dir}")
+
+    images = []
+    for path in paths[:max_images]:
+        img = Image.open(path).convert('RGB').resize((size[1], size[0]), Image.NEAREST)
+        images.append(np.asarray(img, dtype=np.float32)[None] / 255.0)
+    return images
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB"""
+    try:
+        import resource
+    except ImportError:
+        return None  # Windows
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KB, macOS reports bytes
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+def run_config(model_path, images_dir, threads, xnnpack, warmup, runs):
+    """Benchmark one (threads, xnnpack) configuration; runs in a child process"""
+    import tensorflow as tf
+    from tflite_export import quantize_input
+
+    # Peak RSS so far is the runtime itself; the rest is model + inference
+    baseline_rss = peak_rss_mb()
+
+    resolver = (tf.lite.experimental.OpResolverType.AUTO if xnnpack else
+                tf.lite.experimental.OpResolverType.BUILTIN_WITHOUT_DEFAULT_DELEGATES)
+    interpreter = tf.lite.Interpreter(
+        model_path=model_path,
+        num_threads=threads,
+        experimental_op_resolver_type=resolver
+    )
+    interpreter.allocate_tensors()
+    input_detail = interpreter.get_input_details()[0]
+
+    height, width = input_detail['shape'][1:3]
+    inputs = [quantize_input(img, input_detail)
+              for img in load_images(images_dir, (height, width))]
+
+    for i in range(warmup):
+        interpreter.set_tensor(input_detail['index'], inputs[i % len(inputs)])
+        interpreter.invoke()
+
+    latencies = []
+    start = time.perf_counter()
+    for i in range(runs):
+        interpreter.set_tensor(input_detail['index'], inputs[i % len(inputs)])
+        t0 = time.perf_counter()
+        interpreter.invoke()
+        latencies.append((time.perf_counter() - t0) * 1000)
+    total = time.perf_counter() - start
+
+    return {
+        'threads': threads,
+        'xnnpack': xnnpack,
+        'runs': runs,
+        'latency_ms_mean': float(np.mean(latencies)),
+        'latency_ms_p50': float(np.percentile(latencies, 50)),
+        'latency_ms_p90': float(np.percentile(latencies, 90)),
+        'latency_ms_p99': float(np.percentile(latencies, 99)),
+        'throughput_per_sec': runs / total,
+        'peak_rss_mb': peak_rss_mb(),
+        'runtime_rss_mb': baseline_rss,
+    }
+
+def benchmark(model_path, images_dir=IMAGES_DIR, threads=THREAD_COUNTS,
+              xnnpack=(True, False), warmup=WARMUP_RUNS, runs=TIMED_RUNS):
+    """
+    Benchmark every (threads, xnnpack) combination
+
+    Returns:
+        JSON-serializable dict with environment info and per-config results
+    """
+    ctx = multiprocessing.get_context('spawn')
+    results = []
+    for use_xnnpack in xnnpack:
+        for num_threads in threads:
+            with ctx.Pool(1) as pool:
+                result = pool.apply(
+                    run_config,
+                    (model_path, images_dir, num_threads, use_xnnpack, warmup, runs)
+                )
+            results.append(result)
+            print(f"   - threads={num_threads} xnnpack={'on ' if use_xnnpack else 'off'} "
+                  f"p50={result['latency_ms_p50']:.2f}ms p90={result['latency_ms_p90']:.2f}ms "
+                  f"p99={result['latency_ms_p99']:.2f}ms "
+                  f"{result['throughput_per_sec']:.1f}/s peak_rss={result['peak_rss_mb'] or 0:.0f}MB")
+
+    return {
+        'model': os.path.abspath(model_path),
+        'model_size_bytes': os.path.getsize(model_path),
+        'images_dir': os.path.abspath(images_dir),
+        'warmup': warmup,
+        'runs': runs,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'environment': {
+            'platform': platform.platform(),
+            'machine': platform.machine(),
+            'python': platform.python_version(),
+            'cpu_count': os.cpu_count(),
+        },
+        'results': results,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark TFLite inference latency')
+    parser.add_argument('--model', default=MODEL_PATH)
+    parser.add_argument('--images', default=IMAGES_DIR)
+    parser.add_argument('--warmup', type=int, default=WARMUP_RUNS)
+    parser.add_argument('--runs', type=int, default=TIMED_RUNS)
+    parser.add_argument('--threads', type=int, nargs='+', default=list(THREAD_COUNTS))
+    parser.add_argument('--xnnpack', choices=['on', 'off', 'both'], default='both')
+    parser.add_argument('--output', help='Write results as JSON to this path')
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("TFLite Inference Benchmark")
+    print("=" * 60)
+    print(f" Model: {args.model} ({os.path.getsize(args.model) / 2**20:.2f} MB)")
+
+    xnnpack = {'on': (True,), 'off': (False,), 'both': (True, False)}[args.xnnpack]
+    report = benchmark(args.model, args.images, args.threads, xnnpack, args.warmup, args.runs)
+
+    if args.output:
+        os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\n Results saved: {args.output}")
+
+if __name__ == '__main__':
+    main()
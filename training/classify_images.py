@@ -0,0 +1,259 @@
+"""
+Batched offline receipt classification
+
+Runs the receipt detector (TFLite or Keras) over a large directory tree or
+file list and writes one JSON line per image:
+
+    {"path": "...", "score": 0.97, "is_receipt": true}
+    {"path": "...", "error": "cannot identify image file"}
+
+- Paths are streamed, never listed up front
+- Decode + resize runs in a process pool (all cores by default) with a
+  bounded number of chunks in flight, so memory stays constant
+- Results are appended and flushed per batch; re-running with the same
+  --output skips every path already recorded, so a crash loses at most
+  the batches that were in flight
+
+Usage:
+    python classify_images.py --input /data/uploads --output results.jsonl
+    python classify_images.py --file-list paths.txt --model ../models/receipt_detector.h5
+"""
+
+import os
+import json
+import time
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+import numpy as np
+from PIL import Image
+
+from dataset_manifest import IMAGE_EXTENSIONS
+
+# Defaults
+MODEL_PATH = '../assets/tflite/receipt_detector.tflite'
+IMG_SIZE = 224
+BATCH_SIZE = 64
+THRESHOLD = 0.5
+
+def iter_directory(root, extensions=IMAGE_EXTENSIONS):
+    """Yield image paths under root without building the full list"""
+    stack = [root]
+    while stack:
+        current = stack.pop()
+        try:
+            entries = sorted(os.scandir(current), key=lambda e: e.name)
+        except OSError:
+            continue
+        subdirs = []
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                subdirs.append(entry.path)
+            elif entry.name.lower().endswith(extensions):
+                yield entry.path
+        stack.extend(reversed(subdirs))
+
+def iter_file_list(path):
+    """Yield paths from a text file, one per line"""
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield line
+
+def iter_chunks(paths, size, skip=None):
+    """Group paths into lists of `size`, dropping those in `skip`"""
+    chunk = []
+    for path in paths:
+        if skip and path in skip:
+            continue
+        chunk.append(path)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def load_chunk(paths, img_size=IMG_SIZE, fast_decode=False):
+    """
+    Decode and resize a chunk of images (runs in a worker process)
+
+    Returns:
+        (uint8 array of shape (n, img_size, img_size, 3), ok paths, errors)
+    """
+    images, ok, errors = [], [], []
+    for path in paths:
+        try:
+            with Image.open(path) as img:
+                if fast_decode:
+                    # Let the JPEG decoder downscale by 1/2..1/8 while decoding
+                    img.draft('RGB', (img_size, img_size))
+                img = img.convert('RGB').resize((img_size, img_size), Image.NEAREST)
+                images.append(np.asarray(img, dtype=np.uint8))
+            ok.append(path)
+        except Exception as e:
+            errors.append((path, str(e)))
+    batch = np.stack(images) if images else np.zeros((0, img_size, img_size, 3), np.uint8)
+    return batch, ok, errors
+
+class Classifier:
+    """Batch scorer for a .tflite or Keras (.h5/.keras) receipt detector"""
+
+    def __init__(self, model_path, num_threads=None):
+        import tensorflow as tf
+        self.is_tflite = model_path.endswith('.tflite')
+        if self.is_tflite:
+            self.interpreter = tf.lite.Interpreter(model_path=model_path, num_threads=num_threads)
+            self.interpreter.allocate_tensors()
+            self.input_detail = self.interpreter.get_input_details()[0]
+            self.output_detail = self.interpreter.get_output_details()[0]
+            self.batch_size = None
+            self.img_size = int(self.input_detail['shape'][1])
+        else:
+            self.model = tf.keras.models.load_model(model_path, compile=False)
+            self.img_size = int(self.model.input_shape[1])
+
+    def predict(self, images):
+        """Receipt probabilities for a uint8 batch"""
+        images = images.astype(np.float32) / 255.0
+        if not self.is_tflite:
+            return np.asarray(self.model.predict_on_batch(images)).reshape(-1)
+
+        from tflite_export import quantize_input, dequantize_output
+        if self.batch_size != len(images):
+            # Resize once per distinct batch size (only the last batch differs)
+            self.interpreter.resize_tensor_input(
+                self.input_detail['index'], [len(images), self.img_size, self.img_size, 3]
+            )
+            self.interpreter.allocate_tensors()
+            self.input_detail = self.interpreter.get_input_details()[0]
+            self.output_detail = self.interpreter.get_output_details()[0]
+            self.batch_size = len(images)
+        self.interpreter.set_tensor(self.input_detail['index'], quantize_input(images, self.input_detail))
+        self.interpreter.invoke()
+        output = self.interpreter.get_tensor(self.output_detail['index'])
+        return dequantize_output(output, self.output_detail).reshape(-1)
+
+def load_done_paths(output_path):
+    """
+    Paths already recorded in an existing output file
+
+    A partially written last line (crash mid-write) is cut off first.
+    """
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+
+    valid_bytes = 0
+    with open(output_path, 'rb') as f:
+        for line in f:
+            if not line.endswith(b'\n'):
+                break
+            try:
+                done.add(json.loads(line)['path'])
+            except (ValueError, KeyError):
+                break
+            valid_bytes += len(line)
+    if valid_bytes != os.path.getsize(output_path):
+        with open(output_path, 'r+b') as f:
+            f.truncate(valid_bytes)
+    return done
+
+def classify(paths, output_path, model_path=MODEL_PATH, batch_size=BATCH_SIZE,
+             workers=None, threshold=THRESHOLD, fast_decode=False):
+    """
+    Stream `paths` through the model and append results to output_path
+
+    Returns:
+        dict with 'classified', 'errors', 'skipped', 'seconds', 'images_per_sec'
+    """
+    workers = workers or os.cpu_count() or 1
+    done = load_done_paths(output_path)
+    if done:
+        print(f"   - Resuming: {len(done)} images already classified")
+
+    classifier = Classifier(model_path, num_threads=workers)
+    stats = {'classified': 0, 'errors': 0, 'skipped': len(done)}
+    max_in_flight = workers * 2
+    chunks = iter_chunks(paths, batch_size, skip=done)
+    batches = 0
+
+    start = time.perf_counter()
+    ctx = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=ctx) as executor, \
+            open(output_path, 'a') as out:
+        in_flight = set()
+        exhausted = False
+        while in_flight or not exhausted:
+            # Keep a bounded number of chunks decoding ahead of the model
+            while not exhausted and len(in_flight) < max_in_flight:
+                chunk = next(chunks, None)
+                if chunk is None:
+                    exhausted = True
+                else:
+                    in_flight.add(executor.submit(
+                        load_chunk, chunk, classifier.img_size, fast_decode))
+            if not in_flight:
+                break
+
+            finished, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in finished:
+                images, ok, errors = future.result()
+                lines = []
+                if len(ok):
+                    scores = classifier.predict(images)
+                    for path, score in zip(ok, scores):
+                        lines.append(json.dumps({
+                            'path': path,
+                            'score': round(float(score), 6),
+                            'is_receipt': bool(score >= threshold),
+                        }))
+                for path, error in errors:
+                    lines.append(json.dumps({'path': path, 'error': error}))
+                if lines:
+                    out.write('\n'.join(lines) + '\n')
+                    out.flush()
+                stats['classified'] += len(ok)
+                stats['errors'] += len(errors)
+
+                batches += 1
+                if batches % 50 == 0:
+                    processed = stats['classified'] + stats['errors']
+                    elapsed = time.perf_counter() - start
+                    print(f"     {processed} images ({processed / elapsed:.1f} images/sec)")
+
+    stats['seconds'] = time.perf_counter() - start
+    processed = stats['classified'] + stats['errors']
+    stats['images_per_sec'] = processed / stats['seconds'] if stats['seconds'] > 0 else 0.0
+    return stats
+
+def main():
+    parser = argparse.ArgumentParser(description='Classify a large set of images as receipt / not receipt')
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--input', help='Directory tree to scan')
+    source.add_argument('--file-list', help='Text file with one image path per line')
+    parser.add_argument('--output', required=True, help='JSONL results file (appended, resumable)')
+    parser.add_argument('--model', default=MODEL_PATH, help='.tflite, .h5 or .keras model')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    parser.add_argument('--workers', type=int, default=None, help='Decode processes (default: all cores)')
+    parser.add_argument('--threshold', type=float, default=THRESHOLD)
+    parser.add_argument('--fast-decode', action='store_true',
+                        help='Use reduced-size JPEG decoding (faster, slightly different pixels)')
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("Batch Receipt Classification")
+    print("=" * 60)
+
+    paths = iter_directory(args.input) if args.input else iter_file_list(args.file_list)
+    stats = classify(paths, args.output, args.model, args.batch_size,
+                     args.workers, args.threshold, args.fast_decode)
+
+    print(f"\n✅ {stats['classified']} classified, {stats['errors']} errors, "
+          f"{stats['skipped']} skipped in {stats['seconds']:.1f}s "
+          f"({stats['images_per_sec']:.1f} images/sec)")
+    print(f"   Results: {args.output}")
+
+if __name__ == '__main__':
+    main()
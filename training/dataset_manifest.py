@@ -0,0 +1,350 @@
+"""
+Persistent SQLite index of the dataset
+
+prepare_dataset.py (and organize_images.py) keep ../dataset/manifest.sqlite
+up to date; every script that lists a split through list_image_files
+(re-exported by input_pipeline) then reads it instead of walking the tree,
+which is slow on network filesystems with large datasets. This module does
+not import TensorFlow, so dataset tools that only list files start fast.
+
+    images  path (relative to the dataset dir), split, label, sha256,
+            size, mtime_ns, width, height, format, added_at, updated_at
+    dirs    mtime_ns of every split/class directory at the last update
+
+Updates are incremental: only files whose size or mtime changed are hashed
+and opened again. Adding, removing or renaming a file changes its
+directory's mtime, so a manifest that no longer matches the tree is
+detected with one stat per directory and the caller falls back to a walk.
+
+Usage:
+    python dataset_manifest.py --update
+    python dataset_manifest.py --split train --label receipt --since 2026-10-01
+"""
+
+import os
+import time
+import sqlite3
+import argparse
+import warnings
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+
+from file_organizer import MAX_WORKERS, file_sha256
+
+DATASET_DIR = '../dataset'
+MANIFEST_NAME = 'manifest.sqlite'
+SCHEMA_VERSION = 1
+
+# Same extensions flow_from_directory accepts; every script imports this list
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.ppm', '.tif', '.tiff')
+SKIP_DIRS = ('packed',)  # generated stores next to the splits
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS images (
+    path TEXT PRIMARY KEY,
+    split TEXT NOT NULL,
+    label TEXT NOT NULL,
+    sha256 TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    width INTEGER,
+    height INTEGER,
+    format TEXT,
+    added_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS images_split_label ON images (split, label);
+CREATE INDEX IF NOT EXISTS images_added_at ON images (added_at);
+CREATE INDEX IF NOT EXISTS images_sha256 ON images (sha256);
+CREATE TABLE IF NOT EXISTS dirs (
+    path TEXT PRIMARY KEY,
+    mtime_ns INTEGER NOT NULL
+);
+"""
+
+def manifest_path(dataset_dir=DATASET_DIR):
+    return os.path.join(dataset_dir, MANIFEST_NAME)
+
+def connect(dataset_dir=DATASET_DIR, create=True):
+    """
+    Open the manifest of a dataset directory
+
+    Returns None if it doesn't exist and create is False. A manifest with
+    another schema is recreated, or with create=False left alone (None is
+    returned, so read-only callers fall back to walking the directory).
+    """
+    path = manifest_path(dataset_dir)
+    if not create and not os.path.exists(path):
+        return None
+    conn = sqlite3.connect(path)
+    conn.row_factory = sqlite3.Row
+    if conn.execute('PRAGMA user_version').fetchone()[0] != SCHEMA_VERSION:
+        if not create:
+            conn.close()
+            return None
+        conn.executescript('DROP TABLE IF EXISTS images; DROP TABLE IF EXISTS dirs;')
+        conn.executescript(SCHEMA)
+        conn.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+        conn.commit()
+    return conn
+
+def _is_data_dir(name):
+    return not name.startswith('.') and name not in SKIP_DIRS
+
+def walk_dataset(dataset_dir):
+    """
+    Files and directories of all splits (dataset_dir/<split>/<class>/...)
+
+    Returns:
+        (list of (relative path, split, label), {relative dir: mtime_ns})
+    """
+    files, dirs = [], {}
+    for split in sorted(os.listdir(dataset_dir)):
+        split_dir = os.path.join(dataset_dir, split)
+        if not _is_data_dir(split) or not os.path.isdir(split_dir):
+            continue
+        dirs[split] = os.stat(split_dir).st_mtime_ns
+        for label in sorted(os.listdir(split_dir)):
+            class_dir = os.path.join(split_dir, label)
+            if not os.path.isdir(class_dir):
+                continue
+            for root, _, names in sorted(os.walk(class_dir)):
+                dirs[os.path.relpath(root, dataset_dir)] = os.stat(root).st_mtime_ns
+                for fname in sorted(names):
+                    if fname.lower().endswith(IMAGE_EXTENSIONS):
+                        files.append((os.path.relpath(os.path.join(root, fname), dataset_dir),
+                                      split, label))
+    return files, dirs
+
+def describe_file(path):
+    """Content hash, dimensions and format of one image (None for unreadable files)"""
+    width = height = image_format = None
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            with Image.open(path) as img:
+                width, height, image_format = img.width, img.height, img.format
+    except Exception:  # corrupt files are the scanner's job, still index them
+        pass
+    return file_sha256(path), width, height, image_format
+
+def _record_dirs(conn, dirs):
+    conn.execute('DELETE FROM dirs')
+    conn.executemany('INSERT INTO dirs (path, mtime_ns) VALUES (?, ?)', dirs.items())
+
+def update_manifest(dataset_dir=DATASET_DIR, max_workers=MAX_WORKERS):
+    """
+    Bring the manifest in line with the files on disk
+
+    Returns:
+        dict with added / changed / removed / unchanged counts
+    """
+    files, dirs = walk_dataset(dataset_dir)
+    conn = connect(dataset_dir)
+    known = {row['path']: (row['size'], row['mtime_ns'], row['split'], row['label'])
+             for row in conn.execute('SELECT path, size, mtime_ns, split, label FROM images')}
+
+    stats = {'added': 0, 'changed': 0, 'removed': 0, 'unchanged': 0}
+    todo = []
+    for rel_path, split, label in files:
+        stat = os.stat(os.path.join(dataset_dir, rel_path))
+        if known.get(rel_path) == (stat.st_size, stat.st_mtime_ns, split, label):
+            stats['unchanged'] += 1
+        else:
+            stats['changed' if rel_path in known else 'added'] += 1
+            todo.append((rel_path, split, label, stat))
+
+    # Hashing and header reads are I/O bound, so threads are enough
+    now = time.time()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        described = executor.map(lambda item: describe_file(os.path.join(dataset_dir, item[0])), todo)
+        for (rel_path, split, label, stat), (sha256, width, height, image_format) in zip(todo, described):
+            conn.execute(
+                'INSERT INTO images (path, split, label, sha256, size, mtime_ns, width, height, '
+                'format, added_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?) '
+                'ON CONFLICT (path) DO UPDATE SET split = excluded.split, label = excluded.label, '
+                'sha256 = excluded.sha256, size = excluded.size, mtime_ns = excluded.mtime_ns, '
+                'width = excluded.width, height = excluded.height, format = excluded.format, '
+                'updated_at = excluded.updated_at',
+                (rel_path, split, label, sha256, stat.st_size, stat.st_mtime_ns,
+                 width, height, image_format, now, now)
+            )
+
+    gone = set(known) - {rel_path for rel_path, _, _ in files}
+    conn.executemany('DELETE FROM images WHERE path = ?', ((path,) for path in gone))
+    stats['removed'] = len(gone)
+    _record_dirs(conn, dirs)
+    conn.commit()
+    conn.close()
+    return stats
+
+def remove_files(dataset_dir, paths):
+    """Drop files that were moved away (e.g. quarantined) and re-record their dirs"""
+    conn = connect(dataset_dir, create=False)
+    if conn is None:
+        return
+    rel_paths = [os.path.relpath(path, dataset_dir) for path in paths]
+    conn.executemany('DELETE FROM images WHERE path = ?', ((path,) for path in rel_paths))
+    for rel_dir in {os.path.dirname(path) for path in rel_paths}:
+        full_dir = os.path.join(dataset_dir, rel_dir)
+        if os.path.isdir(full_dir):
+            conn.execute('UPDATE dirs SET mtime_ns = ? WHERE path = ?',
+                         (os.stat(full_dir).st_mtime_ns, rel_dir))
+    conn.commit()
+    conn.close()
+
+def is_current(conn, dataset_dir, split=None):
+    """True if no recorded directory (of `split`) changed since the last update"""
+    rows = conn.execute('SELECT path, mtime_ns FROM dirs').fetchall()
+    if split is not None:
+        rows = [row for row in rows if row['path'].split(os.sep)[0] == split]
+    if not rows:
+        return False
+    for row in rows:
+        try:
+            if os.stat(os.path.join(dataset_dir, row['path'])).st_mtime_ns != row['mtime_ns']:
+                return False
+        except OSError:
+            return False
+    return True
+
+def list_split(split_dir):
+    """
+    (paths, labels, class_indices) of a split from its dataset's manifest
+
+    Same order and path strings as walking split_dir (classes sorted, then
+    directories, then file names). Returns None if there is no manifest or
+    it is out of date, so the caller can walk the directory instead.
+    """
+    split_dir = split_dir.rstrip(os.sep)
+    dataset_dir, split = os.path.split(split_dir)
+    conn = connect(dataset_dir or '.', create=False)
+    if conn is None:
+        return None
+    try:
+        if not is_current(conn, dataset_dir or '.', split):
+            return None
+        classes = sorted(parts[1] for parts in (row['path'].split(os.sep) for row in conn.execute(
+            'SELECT path FROM dirs')) if len(parts) == 2 and parts[0] == split)
+        conn.row_factory = None  # plain tuples, noticeably faster for large splits
+        rows = conn.execute('SELECT path, label FROM images WHERE split = ?', (split,)).fetchall()
+    except sqlite3.Error:
+        return None
+    finally:
+        conn.close()
+
+    class_indices = {name: i for i, name in enumerate(classes)}
+    # rel path within the split: <class>/<subdirs...>/<file>
+    entries = sorted(
+        (class_indices[label],) + os.path.split(rel_path) for rel_path, label in rows
+    )
+    paths = [os.path.join(dataset_dir, rel_dir, fname) for _, rel_dir, fname in entries]
+    labels = [label for label, _, _ in entries]
+    return paths, labels, class_indices
+
+def list_image_files(directory):
+    """
+    List images the same way flow_from_directory does
+
+    Classes are the sorted sub-directory names, so class indices match
+    the generator ({'not_receipt': 0, 'receipt': 1}). Read from the
+    dataset manifest when it is up to date, otherwise walks the directory.
+    """
+    listed = list_split(directory)
+    if listed is not None:
+        return listed
+
+    classes = sorted(
+        d for d in os.listdir(directory)
+        if os.path.isdir(os.path.join(directory, d))
+    )
+    class_indices = {name: i for i, name in enumerate(classes)}
+
+    paths, labels = [], []
+    for name in classes:
+        class_dir = os.path.join(directory, name)
+        for root, _, files in sorted(os.walk(class_dir)):
+            for fname in sorted(files):
+                if fname.lower().endswith(IMAGE_EXTENSIONS):
+                    paths.append(os.path.join(root, fname))
+                    labels.append(class_indices[name])
+
+    return paths, labels, class_indices
+
+def dataset_files(dataset_dir=DATASET_DIR):
+    """Paths of all indexed images, or None if the manifest is missing or stale"""
+    conn = connect(dataset_dir, create=False)
+    if conn is None:
+        return None
+    try:
+        if not is_current(conn, dataset_dir):
+            return None
+        return [os.path.join(dataset_dir, row['path'])
+                for row in conn.execute('SELECT path FROM images ORDER BY path')]
+    finally:
+        conn.close()
+
+def query(dataset_dir=DATASET_DIR, split=None, label=None, since=None):
+    """
+    Filtered rows of the manifest
+
+    Args:
+        split, label: exact matches (e.g. 'train', 'receipt')
+        since: datetime or unix time; only images first indexed after it
+
+    Returns:
+        list of dicts ordered by added_at
+    """
+    conn = connect(dataset_dir, create=False)
+    if conn is None:
+        return []
+    clauses, params = [], []
+    if split is not None:
+        clauses.append('split = ?')
+        params.append(split)
+    if label is not None:
+        clauses.append('label = ?')
+        params.append(label)
+    if since is not None:
+        clauses.append('added_at >= ?')
+        params.append(since.timestamp() if isinstance(since, datetime) else since)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+    try:
+        return [dict(row) for row in conn.execute(
+            f'SELECT * FROM images {where} ORDER BY added_at, path', params)]
+    finally:
+        conn.close()
+
+def main():
+    parser = argparse.ArgumentParser(description='Update or query the dataset manifest')
+    parser.add_argument('--dataset', default=DATASET_DIR)
+    parser.add_argument('--update', action='store_true', help='Sync the manifest with the files first')
+    parser.add_argument('--split')
+    parser.add_argument('--label')
+    parser.add_argument('--since', type=datetime.fromisoformat,
+                        help='Only images added on/after this date (YYYY-MM-DD[THH:MM])')
+    parser.add_argument('--count', action='store_true', help='Print counts instead of paths')
+    args = parser.parse_args()
+
+    if args.update:
+        stats = update_manifest(args.dataset)
+        print(f" Manifest updated: {', '.join(f'{v} {k}' for k, v in stats.items())}")
+
+    rows = query(args.dataset, args.split, args.label, args.since)
+    if args.count:
+        counts = {}
+        for row in rows:
+            key = f"{row['split']}/{row['label']}"
+            counts[key] = counts.get(key, 0) + 1
+        for key, count in sorted(counts.items()):
+            print(f"   - {key}: {count} images")
+        print(f"   Total: {len(rows)}")
+    else:
+        for row in rows:
+            added = datetime.fromtimestamp(row['added_at']).isoformat(timespec='seconds')
+            print(f"{added}  {row['width']}x{row['height']}  {row['path']}")
+
+if __name__ == '__main__':
+    main()
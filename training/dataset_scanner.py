@@ -0,0 +1,302 @@
+"""
+Parallel dataset integrity scanner
+
+Checks every image the training pipeline would read (all
+dataset_manifest.IMAGE_EXTENSIONS, not just *.jpg) on a process pool:
+
+- header: format, color mode and dimensions (cheap, no pixel data)
+- end marker: JPEG files must end with EOI, PNG files with IEND; a missing
+  marker (typical for an interrupted download) triggers a full decode
+- full decode: always with --full-decode, otherwise only when the header or
+  end marker looks wrong
+
+Reported issues:
+    corrupt       cannot be opened or decoded (crashes training mid-epoch)
+    unsupported   file type tf.io.decode_image can't read (TIFF, PPM, WebP, ...),
+                  judged by the file signature, as TF does
+    cmyk          CMYK JPEG (decodes, but colors may not match RGB training data)
+    grayscale     single-channel image (decoded fine, but worth knowing)
+    undersized    smaller than MIN_DIMENSION on a side
+
+Files with a fatal issue (corrupt, unsupported) can be moved to
+dataset/.quarantine/ with --quarantine. Results are cached by path, size and
+mtime in dataset/.verify/scan_cache.json, so re-verifying a large dataset only
+opens files that were added or changed, and the file list is read from the
+dataset manifest (dataset_manifest.py) instead of a directory walk.
+
+Usage:
+    python dataset_scanner.py --dataset ../dataset --quarantine
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import warnings
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+from dataset_manifest import IMAGE_EXTENSIONS, dataset_files, remove_files
+
+DATASET_DIR = '../dataset'
+SCAN_DIR = '.verify'  # cache and report, inside the dataset dir
+QUARANTINE_DIR = '.quarantine'
+SCAN_VERSION = 2  # 2: support decided by file signature (MPO was flagged unsupported)
+
+MIN_DIMENSION = 64
+FATAL_ISSUES = ('corrupt', 'unsupported')
+# File signatures tf.io.decode_image recognizes (it sniffs the header, so
+# e.g. multi-picture phone JPEGs, which PIL reports as 'MPO', decode fine)
+TF_SIGNATURES = (b'\xff\xd8\xff', b'\x89PNG\r\n\x1a\n', b'GIF87a', b'GIF89a', b'BM')
+END_MARKERS = {'JPEG': b'\xff\xd9', 'MPO': b'\xff\xd9', 'PNG': b'IEND'}
+MARKER_WINDOW = 1024  # bytes at the end of the file searched for the marker
+SIZE_BUCKETS = (64, 128, 224, 512, 1024, 2048)
+CHUNK_SIZE = 64
+
+def find_dataset_images(dataset_dir, extensions=IMAGE_EXTENSIONS):
+    """Images under dataset_dir, skipping hidden folders (.quarantine, .verify, ...)"""
+    found = []
+    for root, dirs, files in os.walk(dataset_dir):
+        dirs[:] = sorted(d for d in dirs if not d.startswith('.') and d != 'packed')
+        for fname in sorted(files):
+            if fname.lower().endswith(extensions):
+                found.append(os.path.join(root, fname))
+    return found
+
+def has_end_marker(path, image_format):
+    """True if the file ends the way a complete file of its format must"""
+    marker = END_MARKERS.get(image_format)
+    if marker is None:
+        return True
+    with open(path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        f.seek(max(0, f.tell() - MARKER_WINDOW))
+        return marker in f.read()
+
+def tf_decodable(path):
+    """True if the file starts with a signature tf.io.decode_image can decode"""
+    with open(path, 'rb') as f:
+        return f.read(8).startswith(TF_SIGNATURES)
+
+def check_image(path, full_decode=False, min_dimension=MIN_DIMENSION):
+    """
+    Inspect one image (runs in a worker process)
+
+    Returns:
+        dict with format, mode, width, height and a list of issues
+        (plus 'error' for corrupt files)
+    """
+    from PIL import Image
+
+    result = {'format': None, 'mode': None, 'width': 0, 'height': 0, 'issues': []}
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            with Image.open(path) as img:
+                result.update(format=img.format, mode=img.mode,
+                              width=img.width, height=img.height)
+                if full_decode or not has_end_marker(path, img.format):
+                    img.load()
+    except Exception as e:  # PIL raises many types for bad files
+        result['issues'].append('corrupt')
+        result['error'] = f'{type(e).__name__}: {e}'
+        return result
+
+    if not tf_decodable(path):
+        result['issues'].append('unsupported')
+    if result['mode'] == 'CMYK':
+        result['issues'].append('cmyk')
+    if result['mode'] in ('1', 'L', 'LA', 'I', 'I;16', 'F'):
+        result['issues'].append('grayscale')
+    if min(result['width'], result['height']) < min_dimension:
+        result['issues'].append('undersized')
+    return result
+
+def _check_chunk(paths, full_decode, min_dimension):
+    return [check_image(path, full_decode, min_dimension) for path in paths]
+
+def size_bucket(width, height, buckets=SIZE_BUCKETS):
+    """Histogram label for the shorter side, e.g. '224-511'"""
+    side = min(width, height)
+    lower = 0
+    for upper in buckets:
+        if side < upper:
+            return f'{lower}-{upper - 1}'
+        lower = upper
+    return f'{lower}+'
+
+def load_cache(path):
+    try:
+        with open(path) as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if cache.get('version') != SCAN_VERSION:
+        return {}
+    return cache.get('files', {})
+
+def save_cache(files, path):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump({'version': SCAN_VERSION, 'files': files}, f)
+    os.replace(tmp, path)
+
+def quarantine_file(path, dataset_dir, quarantine_dir, issues):
+    """Move a bad file out of the dataset, keeping its relative path"""
+    rel_path = os.path.relpath(path, dataset_dir)
+    target = os.path.join(quarantine_dir, rel_path)
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    shutil.move(path, target)
+    with open(os.path.join(quarantine_dir, 'quarantine.jsonl'), 'a') as f:
+        f.write(json.dumps({'path': rel_path, 'issues': issues,
+                            'time': time.strftime('%Y-%m-%dT%H:%M:%S')}) + '\n')
+    return target
+
+def scan_dataset(dataset_dir=DATASET_DIR, full_decode=False, min_dimension=MIN_DIMENSION,
+                 workers=None, quarantine=False):
+    """
+    Scan all images under dataset_dir
+
+    The file list comes from the dataset manifest when it is up to date.
+    The cache lives in dataset_dir/.verify/ and bad files are moved to
+    dataset_dir/.quarantine/ (and dropped from the manifest).
+
+    Returns:
+        report dict: counts per class folder, issue lists, format/mode/size
+        histograms and how many files were actually opened
+    """
+    cache_path = os.path.join(dataset_dir, SCAN_DIR, 'scan_cache.json')
+    quarantine_dir = os.path.join(dataset_dir, QUARANTINE_DIR)
+    paths = dataset_files(dataset_dir)
+    if paths is None:
+        paths = find_dataset_images(dataset_dir)
+    cache = load_cache(cache_path)
+    # --full-decode results can't be reused from a header-only scan
+    settings = {'full_decode': full_decode, 'min_dimension': min_dimension}
+
+    results, todo = {}, []
+    for path in paths:
+        key = os.path.abspath(path)
+        stat = os.stat(path)
+        stat_key = [stat.st_size, stat.st_mtime_ns]
+        cached = cache.get(key)
+        if cached and cached['stat'] == stat_key and (
+                cached['settings'] == settings or (cached['settings']['full_decode']
+                                                   and cached['settings']['min_dimension'] == min_dimension)):
+            results[path] = cached['result']
+        else:
+            todo.append((path, key, stat_key))
+
+    print(f"   - {len(paths)} images, {len(paths) - len(todo)} unchanged (cached), "
+          f"{len(todo)} to check")
+    if todo:
+        chunks = [todo[i:i + CHUNK_SIZE] for i in range(0, len(todo), CHUNK_SIZE)]
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(_check_chunk, [path for path, _, _ in chunk],
+                                       full_decode, min_dimension) for chunk in chunks]
+            for chunk, future in zip(chunks, futures):
+                for (path, key, stat_key), result in zip(chunk, future.result()):
+                    results[path] = result
+                    cache[key] = {'stat': stat_key, 'settings': settings, 'result': result}
+
+    # Forget files that are gone
+    live = {os.path.abspath(path) for path in paths}
+    cache = {key: value for key, value in cache.items() if key in live}
+
+    report = {
+        'dataset': os.path.abspath(dataset_dir),
+        'images': len(paths),
+        'checked': len(todo),
+        'counts': Counter(),
+        'issues': {},
+        'formats': Counter(),
+        'modes': Counter(),
+        'sizes': Counter(),
+        'quarantined': [],
+        'quarantine_dir': quarantine_dir,
+    }
+    for path in paths:
+        result = results[path]
+        # Count by <split>/<class>, including nested folders
+        rel_dir = os.sep.join(os.path.relpath(os.path.dirname(path), dataset_dir).split(os.sep)[:2])
+        report['counts'][rel_dir] += 1
+        report['formats'][result['format'] or 'unreadable'] += 1
+        report['modes'][result['mode'] or 'unreadable'] += 1
+        if result['width']:
+            report['sizes'][size_bucket(result['width'], result['height'])] += 1
+        for issue in result['issues']:
+            report['issues'].setdefault(issue, []).append(os.path.relpath(path, dataset_dir))
+
+        fatal = [issue for issue in result['issues'] if issue in FATAL_ISSUES]
+        if quarantine and fatal:
+            quarantine_file(path, dataset_dir, quarantine_dir, fatal)
+            report['quarantined'].append(os.path.relpath(path, dataset_dir))
+            report['counts'][rel_dir] -= 1
+            cache.pop(os.path.abspath(path), None)
+
+    if report['quarantined']:
+        remove_files(dataset_dir, [os.path.join(dataset_dir, rel_path)
+                                   for rel_path in report['quarantined']])
+    save_cache(cache, cache_path)
+    for key in ('counts', 'formats', 'modes', 'sizes'):
+        report[key] = dict(sorted(report[key].items()))
+    return report
+
+def print_report(report):
+    for folder, count in report['counts'].items():
+        print(f"   - {folder}: {count} images")
+
+    print(f"\n   Formats: {', '.join(f'{k} {v}' for k, v in report['formats'].items())}")
+    print(f"   Modes: {', '.join(f'{k} {v}' for k, v in report['modes'].items())}")
+    print(f"   Shorter side: {', '.join(f'{k}px {v}' for k, v in report['sizes'].items())}")
+
+    if not report['issues']:
+        print("\n✅ No problems found")
+    for issue, files in sorted(report['issues'].items()):
+        marker = '❌' if issue in FATAL_ISSUES else '⚠️'
+        print(f"\n{marker} {issue}: {len(files)} file(s)")
+        for rel_path in files[:5]:
+            print(f"     {rel_path}")
+        if len(files) > 5:
+            print(f"     ... and {len(files) - 5} more")
+    if report['quarantined']:
+        print(f"\n Quarantined {len(report['quarantined'])} file(s) to {report['quarantine_dir']}")
+
+def main():
+    parser = argparse.ArgumentParser(description='Check dataset images before training')
+    parser.add_argument('--dataset', default=DATASET_DIR)
+    parser.add_argument('--full-decode', action='store_true',
+                        help='Decode every image, not only ones with a suspicious header/end marker')
+    parser.add_argument('--min-dimension', type=int, default=MIN_DIMENSION)
+    parser.add_argument('--workers', type=int, default=None, help='Processes (default: all cores)')
+    parser.add_argument('--quarantine', action='store_true',
+                        help='Move corrupt and unsupported files to <dataset>/.quarantine')
+    parser.add_argument('--report', default=None,
+                        help='Full JSON report (default: <dataset>/.verify/scan_report.json)')
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("Dataset Integrity Scan")
+    print("=" * 60)
+
+    start = time.perf_counter()
+    report = scan_dataset(args.dataset, args.full_decode, args.min_dimension, args.workers,
+                          args.quarantine)
+    print(f"   - Scanned in {time.perf_counter() - start:.1f}s")
+    print_report(report)
+
+    report_path = args.report or os.path.join(args.dataset, SCAN_DIR, 'scan_report.json')
+    os.makedirs(os.path.dirname(report_path) or '.', exist_ok=True)
+    with open(report_path, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\n Report saved: {report_path}")
+
+    fatal = [issue for issue in FATAL_ISSUES if issue in report['issues']]
+    if fatal and not args.quarantine:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,278 @@
+"""
+Knowledge distillation into a tiny student receipt detector
+
+The fine-tuned MobileNetV2 (models/receipt_detector.h5, ~2.4M params) is
+the teacher; the student is a small separable-conv CNN (~30K params) at a
+lower input resolution, trained on a mix of the hard labels and the
+teacher's temperature-softened predictions:
+
+    loss = HARD_WEIGHT * BCE(label, sigmoid(z_s))
+         + (1 - HARD_WEIGHT) * T^2 * BCE(sigmoid(z_t / T), sigmoid(z_s / T))
+
+Teacher logits are computed once per split on the clean packed images and
+cached in models/distill_cache/ (keyed by the teacher file and the dataset
+files), so every student epoch only runs the student. Teacher and student
+read the packed stores at their own sizes, which list the images in the same
+order, so logits line up by index.
+
+The student is exported through train_receipt_detector.convert_to_tflite
+and compared side by side with the teacher (accuracy, latency, size).
+
+Usage:
+    python distill.py
+    python distill.py --img-size 96 --temperature 2 --tflite-mode int8
+"""
+
+import os
+import json
+import hashlib
+import argparse
+
+import numpy as np
+import tensorflow as tf
+from tensorflow.keras import layers
+from tensorflow.keras.models import Model, load_model
+from tensorflow.keras.callbacks import EarlyStopping, ReduceLROnPlateau
+
+import train_receipt_detector as trainer
+from input_pipeline import RANDOM_SEED, list_image_files, finalize_batches
+from packed_dataset import compute_fingerprint, load_packed_split, create_packed_dataset
+from file_organizer import file_sha256
+from tflite_export import EXPORT_MODES, convert_model, evaluate_tflite
+
+# Distillation configuration
+STUDENT_IMG_SIZE = 128
+STUDENT_EPOCHS = 30
+STUDENT_LEARNING_RATE = 0.002
+TEMPERATURE = 4.0
+HARD_WEIGHT = 0.3  # weight of the hard-label loss, the rest goes to the teacher
+
+# Paths
+TEACHER_PATH = trainer.MODEL_SAVE_PATH
+STUDENT_PATH = '../models/receipt_student.h5'
+STUDENT_TFLITE_PATH = '../models/receipt_student.tflite'
+LOGITS_CACHE_DIR = '../models/distill_cache'
+REPORT_PATH = '../models/distill_report.json'
+
+def create_student(img_size=STUDENT_IMG_SIZE, width=16):
+    """
+    Tiny CNN student
+
+    Conv stem + four separable conv blocks (stride 2 each), global average
+    pooling and a single logit. Returns (model, logits_model): `model` ends
+    in a sigmoid like the teacher and is the one exported; `logits_model`
+    shares its layers and is the one trained.
+    """
+    inputs = layers.Input(shape=(img_size, img_size, 3), name='image')
+    x = layers.Conv2D(width, 3, strides=2, padding='same', use_bias=False, name='stem')(inputs)
+    x = layers.BatchNormalization(name='stem_bn')(x)
+    x = layers.ReLU(6.0, name='stem_relu')(x)
+    for i, filters in enumerate((width * 2, width * 4, width * 8, width * 8)):
+        x = layers.SeparableConv2D(filters, 3, strides=2, padding='same', use_bias=False,
+                                   name=f'block{i + 1}_conv')(x)
+        x = layers.BatchNormalization(name=f'block{i + 1}_bn')(x)
+        x = layers.ReLU(6.0, name=f'block{i + 1}_relu')(x)
+    x = layers.GlobalAveragePooling2D(name='global_avg_pool')(x)
+    x = layers.Dropout(0.2, name='dropout')(x)
+    logits = layers.Dense(1, name='logits')(x)
+    output = layers.Activation('sigmoid', name='output', dtype='float32')(logits)
+
+    model = Model(inputs, output, name='receipt_student')
+    logits_model = Model(inputs, logits, name='receipt_student_logits')
+    return model, logits_model
+
+def teacher_logits(teacher, split_dir, teacher_hash, cache_dir=LOGITS_CACHE_DIR):
+    """
+    Teacher logits for every image of a split (clean, no augmentation), cached
+
+    Returns:
+        float32 array (N,) in list_image_files order
+    """
+    img_size = teacher.input_shape[1]
+    paths, labels, _ = list_image_files(split_dir)
+    key_source = json.dumps({
+        'teacher': teacher_hash,
+        'data': compute_fingerprint(paths, labels, img_size),
+    }, sort_keys=True)
+    key = hashlib.sha256(key_source.encode()).hexdigest()[:16]
+    split = os.path.basename(os.path.normpath(split_dir))
+    cache_path = os.path.join(cache_dir, f'{split}_{key}.npy')
+
+    if os.path.exists(cache_path):
+        print(f"   - {split}: cached teacher logits ({cache_path})")
+        return np.load(cache_path)
+
+    print(f"   - {split}: running the teacher on {len(paths)} images...")
+    ds, _ = create_packed_dataset(split_dir, trainer.BATCH_SIZE, img_size,
+                                  training=False, shuffle=False)
+    probs = teacher.predict(ds, verbose=0).ravel().astype(np.float64)
+    probs = np.clip(probs, 1e-7, 1 - 1e-7)
+    logits = (np.log(probs) - np.log1p(-probs)).astype(np.float32)
+
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_path = cache_path + '.tmp.npy'
+    np.save(tmp_path, logits)
+    os.replace(tmp_path, cache_path)
+    return logits
+
+def create_distill_dataset(split_dir, logits, batch_size, img_size, training=False):
+    """
+    Packed images at the student size with (label, teacher logit) targets
+
+    Targets are a (batch, 2) tensor: column 0 is the hard label, column 1 the
+    cached teacher logit.
+    """
+    images, labels, _ = load_packed_split(split_dir, img_size)
+    if len(labels) != len(logits):
+        raise ValueError(f"{split_dir}: {len(labels)} images but {len(logits)} teacher logits")
+    targets = np.stack([labels, logits], axis=1).astype(np.float32)
+
+    def gather(indices):
+        indices = np.sort(indices)
+        return np.asarray(images[indices]), targets[indices]
+
+    ds = tf.data.Dataset.range(len(labels))
+    if training:
+        ds = ds.shuffle(len(labels), seed=RANDOM_SEED, reshuffle_each_iteration=True)
+    ds = ds.batch(batch_size)
+    ds = ds.map(
+        lambda idx: tf.numpy_function(gather, [idx], (tf.uint8, tf.float32)),
+        num_parallel_calls=tf.data.AUTOTUNE,
+        deterministic=not training
+    )
+    ds = ds.map(lambda x, y: (
+        tf.ensure_shape(x, (None, img_size, img_size, 3)),
+        tf.ensure_shape(y, (None, 2))
+    ))
+    # Same augmentation and rescaling as training the teacher
+    return finalize_batches(ds, training)
+
+def distillation_loss(temperature=TEMPERATURE, hard_weight=HARD_WEIGHT):
+    """Keras loss on (label, teacher logit) targets and student logits"""
+    def loss(y_true, y_pred):
+        labels, teacher = y_true[:, :1], y_true[:, 1:]
+        hard = tf.keras.losses.binary_crossentropy(labels, y_pred, from_logits=True)
+        soft = tf.keras.losses.binary_crossentropy(
+            tf.sigmoid(teacher / temperature), y_pred / temperature, from_logits=True
+        )
+        return hard_weight * hard + (1 - hard_weight) * temperature ** 2 * soft
+    loss.__name__ = 'distillation_loss'
+    return loss
+
+def label_accuracy(y_true, y_pred):
+    """Accuracy of student logits against the hard labels"""
+    return tf.keras.metrics.binary_accuracy(y_true[:, :1], y_pred, threshold=0.0)
+
+def teacher_agreement(y_true, y_pred):
+    """How often student and teacher predict the same class"""
+    return tf.reduce_mean(tf.cast((y_true[:, 1:] > 0) == (y_pred > 0), tf.float32), axis=-1)
+
+def train_student(logits_model, train_ds, val_ds, epochs=STUDENT_EPOCHS,
+                  learning_rate=STUDENT_LEARNING_RATE, temperature=TEMPERATURE,
+                  hard_weight=HARD_WEIGHT):
+    """Fit the student on the cached teacher targets"""
+    logits_model.compile(
+        optimizer=tf.keras.optimizers.Adam(learning_rate=learning_rate),
+        loss=distillation_loss(temperature, hard_weight),
+        metrics=[label_accuracy, teacher_agreement]
+    )
+    return logits_model.fit(
+        train_ds,
+        epochs=epochs,
+        validation_data=val_ds,
+        callbacks=[
+            EarlyStopping(monitor='val_loss', patience=6, restore_best_weights=True, verbose=1),
+            ReduceLROnPlateau(monitor='val_loss', factor=0.5, patience=3, min_lr=1e-6, verbose=1)
+        ],
+        verbose=1
+    )
+
+def compare_models(entries, val_dir, report_path=REPORT_PATH):
+    """
+    Side-by-side accuracy/latency/size of exported TFLite models
+
+    Args:
+        entries: list of (name, keras model, tflite bytes)
+    """
+    report = {'val_dir': os.path.abspath(val_dir), 'models': {}}
+    for name, model, tflite_model in entries:
+        metrics = evaluate_tflite(tflite_model, val_dir, model.input_shape[1], num_threads=1)
+        metrics.update({
+            'params': model.count_params(),
+            'img_size': model.input_shape[1],
+            'size_bytes': len(tflite_model),
+        })
+        report['models'][name] = metrics
+
+    teacher = report['models']['teacher']
+    print(f"\n   {'model':<8} {'params':>10} {'input':>6} {'size MB':>8} {'accuracy':>9} {'ms/img':>7} {'speedup':>8}")
+    for name, metrics in report['models'].items():
+        speedup = teacher['latency_ms_mean'] / metrics['latency_ms_mean'] if metrics['latency_ms_mean'] else 0.0
+        metrics['speedup'] = round(speedup, 2)
+        print(f"   {name:<8} {metrics['params']:>10,} {metrics['img_size']:>6} "
+              f"{metrics['size_bytes'] / 2**20:>8.2f} {metrics['accuracy']:>9.4f} "
+              f"{metrics['latency_ms_mean']:>7.2f} {speedup:>7.1f}x")
+
+    os.makedirs(os.path.dirname(report_path) or '.', exist_ok=True)
+    with open(report_path, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\n Comparison saved: {report_path}")
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description='Distill the receipt detector into a tiny student')
+    parser.add_argument('--teacher', default=TEACHER_PATH)
+    parser.add_argument('--img-size', type=int, default=STUDENT_IMG_SIZE, help='Student input size')
+    parser.add_argument('--width', type=int, default=16, help='Filters in the student stem')
+    parser.add_argument('--epochs', type=int, default=STUDENT_EPOCHS)
+    parser.add_argument('--temperature', type=float, default=TEMPERATURE)
+    parser.add_argument('--hard-weight', type=float, default=HARD_WEIGHT,
+                        help='Weight of the hard-label loss (0 = teacher only)')
+    parser.add_argument(
+        '--tflite-mode', choices=EXPORT_MODES, default='dynamic',
+        help='TFLite quantization for the student and the teacher it is compared with'
+    )
+    parser.add_argument('--output', default=STUDENT_TFLITE_PATH, help='Student .tflite path')
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("Receipt Detector Distillation")
+    print("=" * 60)
+
+    if not os.path.exists(args.teacher):
+        raise SystemExit(f"❌ Teacher not found: {args.teacher} (run train_receipt_detector.py first)")
+
+    print(f"\n Loading teacher: {args.teacher}")
+    teacher = load_model(args.teacher)
+    teacher_hash = file_sha256(args.teacher)
+
+    print("\n Teacher logits:")
+    train_logits = teacher_logits(teacher, trainer.TRAIN_DIR, teacher_hash)
+    val_logits = teacher_logits(teacher, trainer.VAL_DIR, teacher_hash)
+
+    student, student_logits = create_student(args.img_size, args.width)
+    print(f"\n Student: {student.count_params():,} parameters at {args.img_size}x{args.img_size} "
+          f"(teacher: {teacher.count_params():,} at {teacher.input_shape[1]}x{teacher.input_shape[1]})")
+
+    train_ds = create_distill_dataset(trainer.TRAIN_DIR, train_logits, trainer.BATCH_SIZE,
+                                      args.img_size, training=True)
+    val_ds = create_distill_dataset(trainer.VAL_DIR, val_logits, trainer.BATCH_SIZE, args.img_size)
+
+    print(f"\n Distilling (T={args.temperature}, hard weight {args.hard_weight})...")
+    train_student(student_logits, train_ds, val_ds, args.epochs, STUDENT_LEARNING_RATE,
+                  args.temperature, args.hard_weight)
+
+    os.makedirs(os.path.dirname(STUDENT_PATH), exist_ok=True)
+    student.save(STUDENT_PATH)
+    print(f"✅ Student saved: {STUDENT_PATH}")
+
+    student_tflite = trainer.convert_to_tflite(student, args.tflite_mode, path=args.output)
+    teacher_tflite = convert_model(teacher, args.tflite_mode, trainer.VAL_DIR,
+                                   img_size=teacher.input_shape[1])
+
+    print("\n Teacher vs student (TFLite, 1 thread):")
+    compare_models([('teacher', teacher, teacher_tflite), ('student', student, student_tflite)],
+                   trainer.VAL_DIR)
+
+if __name__ == '__main__':
+    main()
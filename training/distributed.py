@@ -0,0 +1,200 @@
+"""
+Multi-worker data-parallel training (tf.distribute.MultiWorkerMirroredStrategy)
+
+Each machine runs the same training script with a TF_CONFIG describing the
+cluster and its own task, e.g. on worker 1 of 2:
+
+    TF_CONFIG='{"cluster": {"worker": ["host0:12345", "host1:12345"]},
+                "task": {"type": "worker", "index": 1}}' \\
+        python train_receipt_detector.py --loader packed
+
+- BATCH_SIZE stays the per-replica batch; each step processes
+  BATCH_SIZE x num_replicas_in_sync images across the cluster
+- Every worker reads only its shard of the files (sharded before decoding)
+  and runs the same number of steps, so no worker waits on a short shard
+- Only the chief writes the real checkpoint, TFLite model and plots;
+  other workers save to a throwaway temp directory
+- Saved run state (run_state.py) is not resumed: workers can't agree on
+  it, so a restarted multi-worker run trains from the start
+
+Without TF_CONFIG everything runs on the default single-process strategy.
+To try a cluster on one machine:
+
+    python distributed.py --workers 2 -- quick_finetune.py --loader packed
+"""
+
+import os
+import sys
+import json
+import math
+import socket
+import argparse
+import tempfile
+import subprocess
+import tensorflow as tf
+
+def get_tf_config():
+    """Parsed TF_CONFIG, or {} when it is not set"""
+    return json.loads(os.environ.get('TF_CONFIG') or '{}')
+
+def num_workers(tf_config=None):
+    """Number of training processes in the cluster (chief + workers)"""
+    cluster = (tf_config if tf_config is not None else get_tf_config()).get('cluster', {})
+    return len(cluster.get('chief', [])) + len(cluster.get('worker', []))
+
+def is_multi_worker():
+    """True if TF_CONFIG describes more than one training process"""
+    return num_workers() > 1
+
+def task_index():
+    """Position of this process among all training processes (chief first)"""
+    tf_config = get_tf_config()
+    task = tf_config.get('task', {})
+    has_chief = bool(tf_config.get('cluster', {}).get('chief'))
+    if task.get('type') == 'worker' and has_chief:
+        return task.get('index', 0) + 1
+    return task.get('index', 0)
+
+def is_chief():
+    """True for the process that owns checkpoints and exports"""
+    tf_config = get_tf_config()
+    task = tf_config.get('task', {})
+    if not task:
+        return True
+    if task.get('type') == 'chief':
+        return True
+    # Without an explicit chief, worker 0 plays that role
+    return task.get('type') == 'worker' and task.get('index', 0) == 0 \
+        and not tf_config.get('cluster', {}).get('chief')
+
+def _patch_keras_multi_worker():
+    """
+    Work around two Keras 3 issues with MultiWorkerMirroredStrategy in fit()
+
+    - the symbolic build passes the whole (x, y) batch of PerReplica values
+      to strategy.reduce(), which fails; only shapes are needed, so the
+      first local replica's batch is used instead
+    - metric logs (scalars) are reduced with axis=0, which fails for
+      0-d tensors; they are averaged across workers without an axis
+    """
+    try:
+        from keras.src.backend.tensorflow import trainer
+    except ImportError:
+        return
+    if getattr(trainer, '_multi_worker_patched', False):
+        return
+
+    symbolic_build = trainer.TensorFlowTrainer._maybe_symbolic_build
+    reduce_per_replica = trainer.reduce_per_replica
+
+    def _maybe_symbolic_build(self, iterator=None, data_batch=None):
+        if self._distribute_strategy is not None and iterator is not None:
+            for _, _, it in iterator:
+                data_batch = tf.nest.map_structure(
+                    lambda v: self.distribute_strategy.experimental_local_results(v)[0]
+                    if isinstance(v, tf.distribute.DistributedValues) else v,
+                    next(it)
+                )
+                break
+            iterator = None
+        return symbolic_build(self, iterator=iterator, data_batch=data_batch)
+
+    def _reduce_per_replica(values, strategy, reduction):
+        if reduction in ('auto', 'mean') and isinstance(
+                strategy, tf.distribute.MultiWorkerMirroredStrategy):
+            return tf.nest.map_structure(
+                lambda v: strategy.reduce('MEAN', v, axis=None), values)
+        return reduce_per_replica(values, strategy, reduction)
+
+    trainer.TensorFlowTrainer._maybe_symbolic_build = _maybe_symbolic_build
+    trainer.reduce_per_replica = _reduce_per_replica
+    trainer._multi_worker_patched = True
+
+def create_strategy():
+    """
+    MultiWorkerMirroredStrategy when TF_CONFIG lists several workers,
+    otherwise the default (single-process) strategy
+
+    Must be called before any other TensorFlow op runs.
+    """
+    if not is_multi_worker():
+        return tf.distribute.get_strategy()
+    _patch_keras_multi_worker()
+    strategy = tf.distribute.MultiWorkerMirroredStrategy()
+    print(f" Multi-worker training: worker {task_index() + 1}/{num_workers()}, "
+          f"{strategy.num_replicas_in_sync} replicas, chief={is_chief()}")
+    return strategy
+
+def shard_spec():
+    """(num_shards, index) for the input pipelines, or None for a single worker"""
+    if not is_multi_worker():
+        return None
+    return (num_workers(), task_index())
+
+def steps_for(samples, global_batch_size):
+    """Steps that cover a split once at the global batch size"""
+    return max(1, math.ceil(samples / global_batch_size))
+
+def worker_path(path):
+    """
+    Where this worker should write `path`
+
+    The chief writes the real file; other workers still have to save (the
+    save may involve collective ops) but write into a temp directory.
+    """
+    if is_chief():
+        return path
+    temp_dir = os.path.join(tempfile.gettempdir(), f'worker_{task_index()}')
+    os.makedirs(temp_dir, exist_ok=True)
+    return os.path.join(temp_dir, os.path.basename(path))
+
+def barrier(strategy):
+    """
+    Block until every worker reaches this point
+
+    Call at the end of training so other workers stay up while the chief
+    exports; otherwise the chief reports them as crashed.
+    """
+    if isinstance(strategy, tf.distribute.MultiWorkerMirroredStrategy):
+        strategy.reduce('SUM', strategy.run(lambda: tf.constant(1.0)), axis=None)
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('localhost', 0))
+        return s.getsockname()[1]
+
+def launch_local(num, script_args):
+    """
+    Run `python <script_args>` as `num` local workers with TF_CONFIG set
+
+    Returns:
+        Exit code (the first non-zero one, if any)
+    """
+    workers = [f'localhost:{_free_port()}' for _ in range(num)]
+    processes = []
+    for index in range(num):
+        env = dict(os.environ, TF_CONFIG=json.dumps({
+            'cluster': {'worker': workers},
+            'task': {'type': 'worker', 'index': index}
+        }))
+        processes.append(subprocess.Popen([sys.executable] + script_args, env=env))
+
+    codes = [p.wait() for p in processes]
+    return next((code for code in codes if code), 0)
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Run a training script as several local workers (for testing)')
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('script', nargs=argparse.REMAINDER,
+                        help='Script and its arguments, e.g. -- quick_finetune.py --loader packed')
+    args = parser.parse_args()
+    script = args.script[1:] if args.script[:1] == ['--'] else args.script
+    if not script:
+        parser.error('no training script given')
+
+    print(f" Launching {args.workers} local workers: {' '.join(script)}")
+    sys.exit(launch_local(args.workers, script))
+
+if __name__ == '__main__':
+    main()
@@ -3,12 +3,21 @@ Alternative dataset downloader using Pexels API (free, no rate limit issues)
 """
 
 import os
-import requests
-import time
-from pathlib import Path
+import json
+
+from image_downloader import (
+    MAX_WORKERS, REQUESTS_PER_SECOND, TIMEOUT,
+    TokenBucket, create_session, download_images
+)
 
 # Pexels API (free, get key from: https://www.pexels.com/api/)
 PEXELS_API_KEY = "YOUR_API_KEY_HERE"  # Get free key from pexels.com/api
+PEXELS_API_URL = "https://api.pexels.com/v1/search"
+
+# Paths
+DATASET_DIR = '../dataset'
+PEXELS_JOBS_PATH = f'{DATASET_DIR}/.downloads/pexels_jobs.json'
+PEXELS_MANIFEST_PATH = f'{DATASET_DIR}/.downloads/pexels_manifest.jsonl'
 
 # Or use this public dataset approach
 def download_from_public_datasets():
@@ -35,66 +44,97 @@ def download_from_public_datasets():
     print(f"   {os.path.abspath('../dataset/val/not_receipt/')}")
     print("=" * 60)
 
-def download_with_pexels(api_key, num_images=800):
+def collect_pexels_jobs(session, api_key, num_images, api_url=PEXELS_API_URL,
+                        jobs_path=PEXELS_JOBS_PATH):
     """
-    Download images using Pexels API
+    Page through the Pexels search API and build download jobs
+
+    The job list is saved to `jobs_path`, so a resumed run reuses the same
+    photos and the same train/val assignment without calling the API again.
+    The API key is sent with the search requests only.
     """
-    if api_key == "YOUR_API_KEY_HERE":
-        print("❌ Please add your Pexels API key")
-        print("   Get one free at: https://www.pexels.com/api/")
-        return
+    if os.path.exists(jobs_path):
+        with open(jobs_path) as f:
+            jobs = [tuple(job) for job in json.load(f)]
+        if len(jobs) >= num_images:
+            return jobs[:num_images]
     
-    headers = {"Authorization": api_key}
     queries = ['nature', 'people', 'animals', 'architecture', 'technology', 'food', 'city', 'abstract']
+    api_bucket = TokenBucket(rate=1.0)  # Pexels API: stay well under the hourly quota
+    seen = set()
+    jobs = []
     
-    os.makedirs('../dataset/train/not_receipt', exist_ok=True)
-    os.makedirs('../dataset/val/not_receipt', exist_ok=True)
-    
-    downloaded = 0
     for query in queries:
-        if downloaded >= num_images:
+        if len(jobs) >= num_images:
             break
-            
+        
         page = 1
-        while downloaded < num_images:
-            url = f"https://api.pexels.com/v1/search?query={query}&per_page=80&page={page}"
-            response = requests.get(url, headers=headers)
+        while len(jobs) < num_images:
+            api_bucket.acquire()
+            response = session.get(
+                api_url, params={'query': query, 'per_page': 80, 'page': page},
+                headers={'Authorization': api_key}, timeout=TIMEOUT
+            )
             
             if response.status_code != 200:
                 break
-                
-            data = response.json()
-            photos = data.get('photos', [])
             
+            photos = response.json().get('photos', [])
             if not photos:
                 break
-                
+            
             for photo in photos:
-                if downloaded >= num_images:
+                if len(jobs) >= num_images:
                     break
-                    
-                img_url = photo['src']['medium']
-                try:
-                    img_data = requests.get(img_url, timeout=10).content
-                    
-                    # 80% train, 20% val
-                    folder = 'train' if downloaded < num_images * 0.8 else 'val'
-                    filename = f'../dataset/{folder}/not_receipt/img_{downloaded:04d}.jpg'
-                    
-                    with open(filename, 'wb') as f:
-                        f.write(img_data)
-                    
-                    downloaded += 1
-                    if downloaded % 50 == 0:
-                        print(f"   Downloaded {downloaded}/{num_images}")
-                        
-                except Exception as e:
-                    print(f"   Error downloading image: {e}")
-                    
+                if photo['id'] in seen:
+                    continue
+                seen.add(photo['id'])
+                
+                # 80% train, 20% val
+                folder = 'train' if len(jobs) < num_images * 0.8 else 'val'
+                save_path = f'{DATASET_DIR}/{folder}/not_receipt/pexels_{photo["id"]}.jpg'
+                jobs.append((f'pexels-{photo["id"]}', photo['src']['medium'], save_path))
+            
             page += 1
-            time.sleep(1)  # Rate limiting
     
-    print(f"✅ Downloaded {downloaded} images")
+    os.makedirs(os.path.dirname(jobs_path), exist_ok=True)
+    with open(jobs_path, 'w') as f:
+        json.dump(jobs, f)
+    
+    return jobs
+
+def download_with_pexels(api_key, num_images=800, api_url=PEXELS_API_URL,
+                         max_workers=MAX_WORKERS, rate=REQUESTS_PER_SECOND):
+    """
+    Download images using Pexels API
+    
+    Downloads run concurrently on a pooled session and are recorded in
+    PEXELS_MANIFEST_PATH, so re-running after a failure only fetches what
+    is still missing.
+    """
+    if api_key == "YOUR_API_KEY_HERE":
+        print("❌ Please add your Pexels API key")
+        print("   Get one free at: https://www.pexels.com/api/")
+        return
+    
+    os.makedirs(f'{DATASET_DIR}/train/not_receipt', exist_ok=True)
+    os.makedirs(f'{DATASET_DIR}/val/not_receipt', exist_ok=True)
+    
+    # No session-wide Authorization header: the image downloads go to the
+    # Pexels CDN, which must not receive the API key
+    session = create_session(pool_size=max_workers)
+    try:
+        jobs = collect_pexels_jobs(session, api_key, num_images, api_url)
+        print(f"   Found {len(jobs)} photos, downloading with {max_workers} workers...")
+        stats = download_images(
+            jobs, PEXELS_MANIFEST_PATH, session=session,
+            max_workers=max_workers, rate=rate
+        )
+    finally:
+        session.close()
+    
+    print(f"✅ Downloaded {stats['downloaded'] + stats['skipped']} images")
+    return stats
 
 if __name__ == '__main__':
     print("=" * 60)
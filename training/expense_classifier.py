@@ -0,0 +1,446 @@
+"""
+Expense-category classifier trained on receipts.ocr_text
+
+Learns from an exported `receipts` dump (database_schema.sql) and re-scores
+it in bulk, producing category + category_confidence rows for re-import:
+
+- the dump (CSV, or Parquet with pyarrow installed) is read in fixed-size
+  chunks, so millions of rows never sit in memory at once
+- features are hashed word unigrams/bigrams of ocr_text plus merchant
+  words, in a fixed-size sparse space (no vocabulary to build or store),
+  log-scaled and L2-normalized per receipt
+- rows with manual_override = true are the gold labels; a stable hash of
+  the receipt id holds out VAL_FRACTION of them for the report
+- the model is a multinomial logistic regression fitted with L-BFGS on the
+  sparse matrix; scoring a chunk is one sparse x dense product + softmax
+- manually overridden rows are never re-scored, the user's choice stands
+
+Usage:
+    python expense_classifier.py train --input receipts.csv
+    python expense_classifier.py score --input receipts.csv --output scored.csv
+"""
+
+import os
+import re
+import csv
+import sys
+import json
+import time
+import zlib
+import argparse
+
+import numpy as np
+from scipy import sparse
+from scipy.optimize import minimize
+
+from file_organizer import stable_fraction
+
+# Paths
+MODEL_PATH = '../models/expense_classifier.npz'
+REPORT_PATH = '../models/expense_classifier_report.json'
+
+# Configuration
+N_FEATURES = 2 ** 18      # hashed feature space (power of two)
+CHUNK_SIZE = 50_000       # rows per streamed chunk
+L2 = 1e-4                 # weight decay
+MAX_ITER = 200            # L-BFGS iterations
+VAL_FRACTION = 0.1        # gold rows held out for the report
+SILVER_WEIGHT = 0.3       # weight of model-labelled rows with --silver-confidence
+RANDOM_SEED = 42
+
+# Columns of the receipts table used here
+ID_COLUMN = 'id'
+TEXT_COLUMN = 'ocr_text'
+MERCHANT_COLUMN = 'merchant'
+LABEL_COLUMN = 'category'
+CONFIDENCE_COLUMN = 'category_confidence'
+OVERRIDE_COLUMN = 'manual_override'
+COLUMNS = (ID_COLUMN, TEXT_COLUMN, MERCHANT_COLUMN, LABEL_COLUMN, CONFIDENCE_COLUMN, OVERRIDE_COLUMN)
+REQUIRED_COLUMNS = (ID_COLUMN, TEXT_COLUMN)
+
+WORD_RE = re.compile(r'[^\W\d_]{2,}')  # letters only: prices and dates don't generalize
+TRUE_VALUES = ('true', 't', '1', 'yes')
+
+def _is_parquet(path):
+    return path.lower().endswith(('.parquet', '.pq'))
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise SystemExit("❌ Parquet needs pyarrow (pip install pyarrow), or export the dump as CSV")
+    return pyarrow
+
+def read_chunks(path, chunk_size=CHUNK_SIZE):
+    """
+    Stream a receipts dump as dicts of column lists
+
+    Only COLUMNS are read; missing optional columns come back as None.
+
+    Yields:
+        {column: list of values} with at most chunk_size rows
+    """
+    if _is_parquet(path):
+        pyarrow = _import_pyarrow()
+        parquet = pyarrow.parquet.ParquetFile(path)
+        present = [c for c in COLUMNS if c in parquet.schema_arrow.names]
+        _check_columns(path, present)
+        for batch in parquet.iter_batches(batch_size=chunk_size, columns=present):
+            chunk = batch.to_pydict()
+            yield {c: chunk.get(c, [None] * batch.num_rows) for c in COLUMNS}
+        return
+
+    csv.field_size_limit(sys.maxsize)  # OCR text can exceed the 128 KB default
+    with open(path, newline='', encoding='utf-8') as f:
+        reader = csv.reader(f)
+        header = next(reader, [])
+        _check_columns(path, header)
+        positions = [(c, header.index(c) if c in header else None) for c in COLUMNS]
+        chunk = {c: [] for c in COLUMNS}
+        for row in reader:
+            for column, i in positions:
+                chunk[column].append(row[i] if i is not None and row[i] != '' else None)
+            if len(chunk[ID_COLUMN]) >= chunk_size:
+                yield chunk
+                chunk = {c: [] for c in COLUMNS}
+        if chunk[ID_COLUMN]:
+            yield chunk
+
+def _check_columns(path, present):
+    missing = [c for c in REQUIRED_COLUMNS if c not in present]
+    if missing:
+        raise ValueError(f"{path} has no {', '.join(missing)} column(s)")
+
+def is_true(value):
+    """manual_override as exported by CSV (t/true/1) or Parquet (bool)"""
+    if isinstance(value, str):
+        return value.strip().lower() in TRUE_VALUES
+    return bool(value)
+
+def tokenize(text, merchant=None):
+    """Word unigrams + bigrams of the OCR text and prefixed merchant words"""
+    words = WORD_RE.findall(text.lower()) if text else []
+    tokens = words + [f'{a} {b}' for a, b in zip(words, words[1:])]
+    if merchant:
+        tokens += [f'm:{word}' for word in WORD_RE.findall(merchant.lower())]
+    return tokens
+
+def featurize(texts, merchants=None, n_features=N_FEATURES):
+    """
+    Hashed sparse features of a batch of receipts
+
+    Each token is hashed once per batch (crc32, stable across runs and
+    processes); the top hash bit gives a sign so collisions cancel out
+    on average instead of piling up.
+
+    Returns:
+        float32 CSR matrix (len(texts), n_features), rows L2-normalized
+    """
+    merchants = merchants if merchants is not None else [None] * len(texts)
+    tokens, indptr = [], [0]
+    for text, merchant in zip(texts, merchants):
+        tokens.extend(tokenize(text, merchant))
+        indptr.append(len(tokens))
+
+    hashes = {token: zlib.crc32(token.encode()) for token in set(tokens)}
+    h = np.fromiter((hashes[token] for token in tokens), dtype=np.uint32, count=len(tokens))
+    data = np.where(h & 0x80000000, -1.0, 1.0).astype(np.float32)
+    indices = (h & (n_features - 1)).astype(np.int32)
+    X = sparse.csr_matrix((data, indices, np.array(indptr, dtype=np.int64)),
+                          shape=(len(texts), n_features))
+    X.sum_duplicates()
+    X.eliminate_zeros()
+
+    # Sublinear term frequency, then unit length per receipt
+    X.data = np.sign(X.data) * np.log1p(np.abs(X.data))
+    norms = np.sqrt(np.bincount(np.repeat(np.arange(X.shape[0]), np.diff(X.indptr)),
+                                weights=X.data ** 2, minlength=X.shape[0]))
+    X.data /= np.repeat(np.where(norms > 0, norms, 1.0), np.diff(X.indptr)).astype(np.float32)
+    return X
+
+def softmax(logits):
+    logits = logits - logits.max(axis=1, keepdims=True)
+    np.exp(logits, out=logits)
+    logits /= logits.sum(axis=1, keepdims=True)
+    return logits
+
+def collect_training_rows(path, silver_confidence=None, n_features=N_FEATURES,
+                          val_fraction=VAL_FRACTION, chunk_size=CHUNK_SIZE):
+    """
+    Featurize the labelled rows of a dump, split into train and val
+
+    Gold rows (manual_override) go to val with probability val_fraction
+    (stable per receipt id). With silver_confidence, rows the app labelled
+    with at least that confidence are added to train at SILVER_WEIGHT.
+
+    Returns:
+        dict with 'train' / 'val' (X, labels, weights) and row counts
+    """
+    parts = {'train': [], 'val': []}
+    stats = {'rows': 0, 'gold': 0, 'silver': 0}
+    for chunk in read_chunks(path, chunk_size):
+        stats['rows'] += len(chunk[ID_COLUMN])
+        rows = {'train': [], 'val': []}
+        for i, (receipt_id, label, override) in enumerate(
+                zip(chunk[ID_COLUMN], chunk[LABEL_COLUMN], chunk[OVERRIDE_COLUMN])):
+            if not label or (not chunk[TEXT_COLUMN][i] and not chunk[MERCHANT_COLUMN][i]):
+                continue
+            if is_true(override):
+                stats['gold'] += 1
+                split = 'val' if stable_fraction(str(receipt_id), RANDOM_SEED) < val_fraction else 'train'
+                rows[split].append((i, 1.0))
+            elif (silver_confidence is not None and chunk[CONFIDENCE_COLUMN][i] is not None
+                  and float(chunk[CONFIDENCE_COLUMN][i]) >= silver_confidence):
+                stats['silver'] += 1
+                rows['train'].append((i, SILVER_WEIGHT))
+
+        for split, selected in rows.items():
+            if not selected:
+                continue
+            index = [i for i, _ in selected]
+            X = featurize([chunk[TEXT_COLUMN][i] for i in index],
+                          [chunk[MERCHANT_COLUMN][i] for i in index], n_features)
+            parts[split].append((X, [chunk[LABEL_COLUMN][i] for i in index],
+                                 [weight for _, weight in selected]))
+
+    data = {}
+    for split, pieces in parts.items():
+        if pieces:
+            data[split] = (sparse.vstack([X for X, _, _ in pieces], format='csr'),
+                           [label for _, labels, _ in pieces for label in labels],
+                           np.concatenate([np.asarray(w, dtype=np.float64) for _, _, w in pieces]))
+    data['stats'] = stats
+    return data
+
+def fit(X, y, n_classes, weights=None, l2=L2, max_iter=MAX_ITER):
+    """
+    Multinomial logistic regression on a sparse matrix
+
+    Returns:
+        (W (n_features, n_classes), b (n_classes,)) as float32
+    """
+    n, n_features = X.shape
+    weights = np.ones(n) if weights is None else weights
+    weights = weights / weights.sum()
+    rows = np.arange(n)
+
+    def loss_and_grad(params):
+        W = params[:-n_classes].reshape(n_features, n_classes)
+        b = params[-n_classes:]
+        probs = softmax(X @ W + b)
+        loss = -(weights * np.log(probs[rows, y] + 1e-12)).sum() + 0.5 * l2 * (W * W).sum()
+        probs[rows, y] -= 1.0
+        probs *= weights[:, None]
+        grad_W = X.T @ probs + l2 * W
+        return loss, np.concatenate([grad_W.ravel(), probs.sum(axis=0)])
+
+    result = minimize(loss_and_grad, np.zeros(n_features * n_classes + n_classes),
+                      jac=True, method='L-BFGS-B', options={'maxiter': max_iter})
+    W = result.x[:-n_classes].reshape(n_features, n_classes).astype(np.float32)
+    return W, result.x[-n_classes:].astype(np.float32)
+
+def predict(model, X):
+    """(class indices, confidences) for a feature matrix"""
+    probs = softmax(np.asarray(X @ model['W']) + model['b'])
+    best = probs.argmax(axis=1)
+    return best, probs[np.arange(len(best)), best]
+
+def evaluate(model, X, labels):
+    """Accuracy and per-category recall on labelled rows"""
+    index = {name: i for i, name in enumerate(model['classes'])}
+    known = np.array([label in index for label in labels])
+    y = np.array([index.get(label, -1) for label in labels])
+    best, confidence = predict(model, X)
+    correct = (best == y) & known
+    per_class = {
+        name: {'support': int((y == i).sum()),
+               'recall': float(correct[y == i].mean()) if (y == i).any() else 0.0}
+        for i, name in enumerate(model['classes'])
+    }
+    return {
+        'samples': len(labels),
+        'accuracy': float(correct.mean()) if len(labels) else 0.0,
+        'mean_confidence': float(confidence.mean()) if len(labels) else 0.0,
+        'per_class': per_class,
+    }
+
+def save_model(model, path=MODEL_PATH):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path + '.tmp', 'wb') as f:
+        np.savez_compressed(f, W=model['W'], b=model['b'], classes=np.array(model['classes']),
+                            n_features=model['n_features'])
+    os.replace(path + '.tmp', path)
+
+def load_model(path=MODEL_PATH):
+    with np.load(path) as saved:
+        return {'W': saved['W'], 'b': saved['b'], 'classes': [str(c) for c in saved['classes']],
+                'n_features': int(saved['n_features'])}
+
+def train(path, model_path=MODEL_PATH, report_path=REPORT_PATH, silver_confidence=None,
+          n_features=N_FEATURES, l2=L2, max_iter=MAX_ITER, chunk_size=CHUNK_SIZE):
+    """
+    Train on the labelled rows of a dump and save the model + a JSON report
+
+    Returns:
+        report dict
+    """
+    start = time.time()
+    print(f"\n Reading labelled rows from {path}...")
+    data = collect_training_rows(path, silver_confidence, n_features, chunk_size=chunk_size)
+    stats = data['stats']
+    print(f"   - {stats['rows']} rows, {stats['gold']} manually labelled, {stats['silver']} silver")
+    if 'train' not in data:
+        raise SystemExit("❌ No labelled rows to train on (none with manual_override = true)")
+
+    X, labels, weights = data['train']
+    classes = sorted(set(labels))
+    index = {name: i for i, name in enumerate(classes)}
+    y = np.array([index[label] for label in labels])
+    print(f"\n Training on {X.shape[0]} rows, {len(classes)} categories, "
+          f"{X.nnz / max(X.shape[0], 1):.0f} features per receipt...")
+    W, b = fit(X, y, len(classes), weights, l2, max_iter)
+    model = {'W': W, 'b': b, 'classes': classes, 'n_features': n_features}
+    save_model(model, model_path)
+    print(f"✅ Model saved: {model_path}")
+
+    report = {
+        'input': os.path.abspath(path),
+        'data': stats,
+        'classes': classes,
+        'train_samples': X.shape[0],
+        'n_features': n_features,
+        'l2': l2,
+        'train_seconds': time.time() - start,
+    }
+    if 'val' in data:
+        report['val'] = evaluate(model, data['val'][0], data['val'][1])
+        print(f"   - Val accuracy: {report['val']['accuracy']:.4f} "
+              f"({report['val']['samples']} held-out manual labels)")
+
+    os.makedirs(os.path.dirname(report_path) or '.', exist_ok=True)
+    with open(report_path + '.tmp', 'w') as f:
+        json.dump(report, f, indent=2)
+    os.replace(report_path + '.tmp', report_path)
+    print(f" Report saved: {report_path}")
+    return report
+
+class _ResultWriter:
+    """Bulk writer for (id, category, category_confidence) as CSV or Parquet"""
+
+    def __init__(self, path):
+        self.path = path
+        self.tmp_path = path + '.tmp'
+        self.parquet = _is_parquet(path)
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        if self.parquet:
+            pyarrow = _import_pyarrow()
+            self.pyarrow = pyarrow
+            self.schema = pyarrow.schema([(ID_COLUMN, pyarrow.string()),
+                                          (LABEL_COLUMN, pyarrow.string()),
+                                          (CONFIDENCE_COLUMN, pyarrow.float64())])
+            self.writer = pyarrow.parquet.ParquetWriter(self.tmp_path, self.schema)
+        else:
+            self.file = open(self.tmp_path, 'w', newline='', encoding='utf-8')
+            self.writer = csv.writer(self.file)
+            self.writer.writerow((ID_COLUMN, LABEL_COLUMN, CONFIDENCE_COLUMN))
+
+    def write(self, ids, categories, confidences):
+        if self.parquet:
+            self.writer.write_table(self.pyarrow.table(
+                {ID_COLUMN: [str(i) for i in ids], LABEL_COLUMN: categories,
+                 CONFIDENCE_COLUMN: confidences}, schema=self.schema))
+        else:
+            self.writer.writerows(zip(ids, categories, (f'{c:.2f}' for c in confidences)))
+
+    def close(self):
+        (self.writer if self.parquet else self.file).close()
+        os.replace(self.tmp_path, self.path)
+
+    def abort(self):
+        (self.writer if self.parquet else self.file).close()
+        os.remove(self.tmp_path)
+
+def score(path, output_path, model_path=MODEL_PATH, chunk_size=CHUNK_SIZE):
+    """
+    Re-score every receipt of a dump that the user did not label by hand
+
+    Confidence is rounded to two decimals (category_confidence is
+    DECIMAL(3, 2)). The output replaces output_path only once complete.
+
+    Returns:
+        stats dict (scored, overridden, empty, rows/sec)
+    """
+    model = load_model(model_path)
+    classes = np.array(model['classes'])
+    stats = {'scored': 0, 'overridden': 0, 'empty': 0, 'changed': 0}
+    start = time.time()
+    writer = _ResultWriter(output_path)
+    try:
+        for chunk in read_chunks(path, chunk_size):
+            keep = []
+            for i, override in enumerate(chunk[OVERRIDE_COLUMN]):
+                if is_true(override):
+                    stats['overridden'] += 1
+                elif not chunk[TEXT_COLUMN][i] and not chunk[MERCHANT_COLUMN][i]:
+                    stats['empty'] += 1
+                else:
+                    keep.append(i)
+            if not keep:
+                continue
+            X = featurize([chunk[TEXT_COLUMN][i] for i in keep],
+                          [chunk[MERCHANT_COLUMN][i] for i in keep], model['n_features'])
+            best, confidence = predict(model, X)
+            categories = classes[best].tolist()
+            confidences = np.round(confidence, 2).tolist()
+            writer.write([chunk[ID_COLUMN][i] for i in keep], categories, confidences)
+            stats['changed'] += sum(category != chunk[LABEL_COLUMN][i]
+                                    for i, category in zip(keep, categories))
+            stats['scored'] += len(keep)
+            print(f"   - {stats['scored']} rows scored", end='\r')
+    except BaseException:
+        writer.abort()  # never leave a partial result next to a complete one
+        raise
+    writer.close()
+
+    elapsed = time.time() - start
+    stats['rows_per_sec'] = stats['scored'] / elapsed if elapsed > 0 else 0.0
+    return stats
+
+def main():
+    parser = argparse.ArgumentParser(description='Train or bulk-apply the expense category classifier')
+    parser.add_argument('action', choices=['train', 'score'])
+    parser.add_argument('--input', required=True, help='receipts dump (.csv or .parquet)')
+    parser.add_argument('--output', help='score: result file (.csv or .parquet)')
+    parser.add_argument('--model', default=MODEL_PATH)
+    parser.add_argument('--report', default=REPORT_PATH)
+    parser.add_argument('--silver-confidence', type=float, default=None,
+                        help='train: also learn from app-labelled rows with at least this confidence')
+    parser.add_argument('--l2', type=float, default=L2)
+    parser.add_argument('--max-iter', type=int, default=MAX_ITER)
+    parser.add_argument('--features', type=int, default=N_FEATURES,
+                        help='Hashed feature space size (power of two)')
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+    args = parser.parse_args()
+    if args.features & (args.features - 1):
+        parser.error('--features must be a power of two')
+    if args.action == 'score' and not args.output:
+        parser.error('score needs --output')
+
+    print("=" * 60)
+    print("Expense Category Classifier")
+    print("=" * 60)
+
+    if args.action == 'train':
+        train(args.input, args.model, args.report, args.silver_confidence,
+              args.features, args.l2, args.max_iter, args.chunk_size)
+    else:
+        print(f"\n Scoring {args.input} with {args.model}...")
+        stats = score(args.input, args.output, args.model, args.chunk_size)
+        print(f"\n✅ {stats['scored']} receipts scored ({stats['rows_per_sec']:.0f} rows/sec), "
+              f"{stats['changed']} with a different category")
+        print(f"   - Skipped: {stats['overridden']} manual overrides, {stats['empty']} without text")
+        print(f"   Results: {args.output}")
+
+if __name__ == '__main__':
+    main()
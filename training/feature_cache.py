@@ -0,0 +1,143 @@
+"""
+Cached MobileNetV2 embeddings for Phase 1 head training
+
+With the base model frozen, its output for a given image never changes, so
+Phase 1 only needs one forward pass per image (or per augmentation variant).
+The pooled 1280-d features are stored on disk and the Dense/Dropout/Dense
+head is trained on them directly.
+
+Cache entries are keyed by a hash of the base model weights, the
+preprocessing/augmentation settings and the source file fingerprint, so
+changing any of them produces a new entry instead of reusing stale features.
+"""
+
+import os
+import json
+import hashlib
+import numpy as np
+import tensorflow as tf
+from tensorflow.keras.layers import Input, Dense, Dropout
+from tensorflow.keras.models import Model
+
+import input_pipeline
+from input_pipeline import list_image_files
+from packed_dataset import compute_fingerprint
+
+FEATURE_CACHE_DIR = '../models/feature_cache'
+FEATURE_LAYER = 'global_avg_pool'
+HEAD_LAYERS = ('dense_128', 'dropout', 'output')
+
+def weights_fingerprint(model):
+    """Hash of all weight values of a model"""
+    digest = hashlib.sha256()
+    for weight in model.weights:
+        digest.update(weight.name.encode())
+        digest.update(np.ascontiguousarray(weight.numpy()).tobytes())
+    return digest.hexdigest()
+
+def preprocessing_config(img_size, augmented):
+    """Everything about preprocessing that changes the extracted features"""
+    config = {'img_size': img_size, 'rescale': 1. / 255, 'resize': 'nearest'}
+    if augmented:
+        config.update({
+            'rotation_range': input_pipeline.ROTATION_RANGE,
+            'shift_range': input_pipeline.SHIFT_RANGE,
+            'zoom_range': input_pipeline.ZOOM_RANGE,
+            'brightness_range': list(input_pipeline.BRIGHTNESS_RANGE),
+            'augmentation': 'fused_affine',
+            'seed': input_pipeline.RANDOM_SEED,
+        })
+    return config
+
+def create_feature_extractor(model):
+    """Frozen base model up to the pooled features"""
+    return Model(
+        inputs=model.input,
+        outputs=model.get_layer(FEATURE_LAYER).output,
+        name='feature_extractor'
+    )
+
+def create_head(input_dim, dense_units=128, dropout=0.5):
+    """Same head as create_model, as a standalone model on pooled features"""
+    inputs = Input(shape=(input_dim,), name='features')
+    x = Dense(dense_units, activation='relu', name='dense_128')(inputs)
+    x = Dropout(dropout, name='dropout')(x)
+    # Keep the sigmoid in float32 under mixed precision
+    output = Dense(1, activation='sigmoid', name='output', dtype='float32')(x)
+    return Model(inputs=inputs, outputs=output, name='receipt_head')
+
+def copy_head_weights(head, model):
+    """Copy trained head weights into the full model (matched by layer name)"""
+    for name in HEAD_LAYERS:
+        model.get_layer(name).set_weights(head.get_layer(name).get_weights())
+
+def extract_features(feature_model, dataset):
+    """Run the feature extractor once over a dataset"""
+    features, labels = [], []
+    for images, batch_labels in dataset:
+        features.append(feature_model(images, training=False).numpy())
+        labels.append(batch_labels.numpy())
+    return np.concatenate(features), np.concatenate(labels)
+
+def load_or_extract_features(feature_model, split_dir, make_dataset, img_size,
+                             batch_size, variants=0, weights_hash=None,
+                             cache_dir=FEATURE_CACHE_DIR):
+    """
+    Pooled features for a split, read from cache when the key matches
+
+    Args:
+        make_dataset: create_dataset or create_packed_dataset
+        variants: number of augmented copies added to the clean pass
+        weights_hash: precomputed weights_fingerprint(feature_model)
+
+    Returns:
+        (features, labels) with len = samples * (1 + variants)
+    """
+    if weights_hash is None:
+        weights_hash = weights_fingerprint(feature_model)
+
+    paths, labels, _ = list_image_files(split_dir)
+    data_hash = compute_fingerprint(paths, labels, img_size)
+
+    all_features, all_labels = [], []
+    for variant in range(variants + 1):
+        augmented = variant > 0
+        key_source = json.dumps({
+            'weights': weights_hash,
+            'data': data_hash,
+            'preprocessing': preprocessing_config(img_size, augmented),
+            'variant': variant,
+            # Features extracted under float16 differ from float32 ones
+            'dtype_policy': tf.keras.mixed_precision.global_policy().name,
+        }, sort_keys=True)
+        key = hashlib.sha256(key_source.encode()).hexdigest()[:16]
+        split = os.path.basename(os.path.normpath(split_dir))
+        cache_path = os.path.join(cache_dir, f'{split}_{key}.npz')
+
+        if os.path.exists(cache_path):
+            print(f"   - {split} variant {variant}: cached ({cache_path})")
+            with np.load(cache_path) as cached:
+                features, variant_labels = cached['features'], cached['labels']
+        else:
+            print(f"   - {split} variant {variant}: extracting features...")
+            # Each augmented variant gets its own augmentation seed
+            ds, _ = make_dataset(split_dir, batch_size, img_size, training=augmented,
+                                 shuffle=False, seed=input_pipeline.RANDOM_SEED + variant)
+            features, variant_labels = extract_features(feature_model, ds)
+            os.makedirs(cache_dir, exist_ok=True)
+            tmp_path = cache_path + '.tmp.npz'
+            np.savez(tmp_path, features=features, labels=variant_labels)
+            os.replace(tmp_path, cache_path)
+
+        all_features.append(features)
+        all_labels.append(variant_labels)
+
+    return np.concatenate(all_features), np.concatenate(all_labels)
+
+def create_feature_dataset(features, labels, batch_size, shuffle=False):
+    """Small in-memory tf.data pipeline over cached features"""
+    ds = tf.data.Dataset.from_tensor_slices((features, labels))
+    if shuffle:
+        ds = ds.shuffle(len(labels), seed=input_pipeline.RANDOM_SEED,
+                        reshuffle_each_iteration=True)
+    return ds.batch(batch_size).prefetch(tf.data.AUTOTUNE)
@@ -0,0 +1,223 @@
+"""
+Incremental, zero-copy file organizer
+Used by organize_images.py and prepare_dataset.organize_receipt_images
+
+- Places files with a hardlink or reflink when the filesystem allows it
+  (no data is duplicated) and falls back to a parallel copy otherwise
+- Remembers what it placed in a small JSON state file: a re-run skips every
+  file whose content hash and destination still match, so adding 100 new
+  images only touches those 100
+- Train/val assignment is a stable hash of the source path instead of a
+  seeded shuffle, so new files never move existing ones between splits
+"""
+
+import os
+import json
+import shutil
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Configuration
+MAX_WORKERS = min(32, (os.cpu_count() or 1) * 4)
+HASH_CHUNK_SIZE = 1024 * 1024
+
+# Placement modes, tried in order for 'auto'
+LINK_MODES = ('hardlink', 'reflink', 'symlink', 'copy')
+AUTO_MODES = ('hardlink', 'reflink', 'copy')
+
+def find_images(directory, extensions=None):
+    """All images under a directory, sorted for reproducibility"""
+    if extensions is None:
+        # Imported here: dataset_manifest imports this module
+        from dataset_manifest import IMAGE_EXTENSIONS as extensions
+    found = []
+    for root, _, files in os.walk(directory):
+        for fname in files:
+            if fname.lower().endswith(extensions):
+                found.append(os.path.join(root, fname))
+    return sorted(found)
+
+def stable_fraction(key, seed=42):
+    """Deterministic value in [0, 1) derived from a string"""
+    digest = hashlib.sha1(f'{seed}:{key}'.encode()).digest()
+    return int.from_bytes(digest[:8], 'big') / 2 ** 64
+
+def path_id(key):
+    """Short stable id for a path, used to build collision-free file names"""
+    return hashlib.sha1(key.encode()).hexdigest()[:12]
+
+def stable_split(paths, train_split=0.8, seed=42, key=None):
+    """
+    Split paths into (train, val) by a stable hash
+
+    Unlike shuffle-then-slice, adding files never changes the split of
+    files that were already there. Both lists are ordered by hash, so
+    taking the first N gives a stable random subset.
+    """
+    key = key or (lambda p: p)
+    ranked = sorted(paths, key=lambda p: stable_fraction(key(p), seed + 1))
+    train = [p for p in ranked if stable_fraction(key(p), seed) < train_split]
+    val = [p for p in ranked if stable_fraction(key(p), seed) >= train_split]
+    return train, val
+
+def file_sha256(path):
+    """SHA-256 of a file's content"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def _stat_key(path):
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+def _reflink(src, dst):
+    """Copy-on-write clone (Linux FICLONE: btrfs, XFS, ...)"""
+    try:
+        import fcntl
+    except ImportError:
+        raise OSError('reflink not supported on this platform')
+    FICLONE = 0x40049409
+    with open(src, 'rb') as s, open(dst, 'wb') as d:
+        try:
+            fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+        except OSError:
+            d.close()
+            os.remove(dst)
+            raise
+
+def place_file(src, dst, mode='auto'):
+    """
+    Put `src` at `dst` without copying data when possible
+
+    Returns:
+        The method actually used ('hardlink', 'reflink', 'symlink', 'copy')
+    """
+    modes = AUTO_MODES if mode == 'auto' else (mode,)
+    tmp = f'{dst}.tmp{threading.get_ident()}'
+
+    for method in modes:
+        try:
+            if os.path.lexists(tmp):
+                os.remove(tmp)
+            if method == 'hardlink':
+                os.link(src, tmp)
+            elif method == 'reflink':
+                _reflink(src, tmp)
+            elif method == 'symlink':
+                os.symlink(os.path.abspath(src), tmp)
+            else:
+                shutil.copy2(src, tmp)
+            os.replace(tmp, dst)
+            return method
+        except OSError:
+            if method == modes[-1]:
+                raise
+
+class OrganizeState:
+    """
+    JSON record of source hashes and placed files
+
+    sources: {src: [size, mtime_ns, sha256]}  (hash cache)
+    placed:  {dst: {'src', 'sha256', 'stat'}} (what we put where)
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.sources, self.placed = {}, {}
+        if path and os.path.exists(path):
+            try:
+                with open(path) as f:
+                    data = json.load(f)
+                self.sources = data.get('sources', {})
+                self.placed = data.get('placed', {})
+            except (OSError, ValueError):
+                pass  # Corrupt state just means a full re-check
+
+    def source_hash(self, src):
+        """Content hash of a source, reusing the cached value if unchanged"""
+        stat = _stat_key(src)
+        cached = self.sources.get(src)
+        if cached and cached[:2] == stat:
+            return cached[2]
+        sha = file_sha256(src)
+        with self.lock:
+            self.sources[src] = stat + [sha]
+        return sha
+
+    def is_current(self, src, dst, sha):
+        """True if dst already holds src's content"""
+        record = self.placed.get(dst)
+        if not record or record['sha256'] != sha or not os.path.exists(dst):
+            return False
+        if record['stat'] == _stat_key(dst):
+            return True
+        return file_sha256(dst) == sha
+
+    def record(self, src, dst, sha):
+        with self.lock:
+            self.placed[dst] = {'src': src, 'sha256': sha, 'stat': _stat_key(dst)}
+
+    def save(self):
+        if not self.path:
+            return
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump({'sources': self.sources, 'placed': self.placed}, f)
+        os.replace(tmp, self.path)
+
+def organize_files(pairs, state_path, mode='auto', max_workers=MAX_WORKERS, prune=True):
+    """
+    Place (src, dst) pairs incrementally and in parallel
+
+    Args:
+        pairs: list of (source path, destination path)
+        state_path: JSON file remembering hashes and placed files
+        mode: 'auto', 'hardlink', 'reflink', 'symlink' or 'copy'
+        prune: remove files this organizer placed earlier that are no
+               longer part of `pairs`
+
+    Returns:
+        dict of counts: skipped, removed and one entry per placement method
+    """
+    state = OrganizeState(state_path)
+    stats = {'skipped': 0, 'removed': 0}
+    stats_lock = threading.Lock()
+
+    def process(pair):
+        src, dst = pair
+        sha = state.source_hash(src)
+        if state.is_current(src, dst, sha):
+            result = 'skipped'
+        else:
+            os.makedirs(os.path.dirname(dst) or '.', exist_ok=True)
+            result = place_file(src, dst, mode)
+            state.record(src, dst, sha)
+        with stats_lock:
+            stats[result] = stats.get(result, 0) + 1
+
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            list(executor.map(process, pairs))
+
+        if prune:
+            wanted = {dst for _, dst in pairs}
+            for dst in list(state.placed):
+                if dst not in wanted:
+                    if os.path.lexists(dst):
+                        os.remove(dst)
+                        stats['removed'] += 1
+                    del state.placed[dst]
+    finally:
+        # Save even on failure so finished work is not redone
+        state.save()
+
+    return stats
+
+def format_stats(stats):
+    """One-line summary of organize_files() counts"""
+    return ', '.join(f'{key}: {value}' for key, value in sorted(stats.items()) if value)
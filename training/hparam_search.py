@@ -0,0 +1,303 @@
+"""
+Hyperparameter search for train_receipt_detector.py
+
+Searches the head (Dense width, dropout), both learning rates and the
+Phase 2 unfreeze depth with successive halving:
+
+- NUM_TRIALS random configs train for MIN_EPOCHS fine-tuning epochs, the
+  best 1/ETA continue to ETA x the epochs, and so on up to MAX_EPOCHS.
+  Promoted trials resume from their last checkpoint instead of restarting.
+- Trials run in a process pool; each process is limited to --threads
+  intra-op threads so trials don't fight over cores.
+- The expensive shared work happens once, before any trial starts: the
+  dataset is packed (trials mmap the same uint8 store), the frozen
+  MobileNetV2 features for the Phase 1 head are extracted once, and the
+  ImageNet base weights are saved for trials to load.
+- Results go to models/hparam_search/results.csv, and the best config is
+  written back into the constants of train_receipt_detector.py.
+
+Usage:
+    python hparam_search.py --trials 9 --workers 2
+"""
+
+import os
+import re
+import csv
+import math
+import time
+import random
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+# Search configuration
+SEARCH_DIR = '../models/hparam_search'
+TRAINING_SCRIPT = 'train_receipt_detector.py'
+NUM_TRIALS = 9
+ETA = 3
+MIN_EPOCHS = 1
+MAX_EPOCHS = 9
+HEAD_EPOCHS = 5
+FEATURE_VARIANTS = 2
+RANDOM_SEED = 42
+
+# Constant name in train_receipt_detector.py -> distribution
+SEARCH_SPACE = {
+    'LEARNING_RATE_INITIAL': ('log', 1e-4, 3e-3),
+    'LEARNING_RATE_FINETUNE': ('log', 1e-5, 3e-4),
+    'DENSE_UNITS': ('choice', [64, 128, 256]),
+    'DROPOUT': ('uniform', 0.2, 0.6),
+    'UNFREEZE_LAYERS': ('choice', [10, 20, 40, 60]),
+}
+
+def sample_config(rng, space=SEARCH_SPACE):
+    """Draw one config from the search space"""
+    config = {}
+    for name, (kind, *spec) in space.items():
+        if kind == 'log':
+            value = math.exp(rng.uniform(math.log(spec[0]), math.log(spec[1])))
+            config[name] = float(f'{value:.3g}')
+        elif kind == 'uniform':
+            config[name] = round(rng.uniform(spec[0], spec[1]), 2)
+        else:
+            config[name] = rng.choice(spec[0])
+    return config
+
+def rung_epochs(min_epochs=MIN_EPOCHS, max_epochs=MAX_EPOCHS, eta=ETA):
+    """Fine-tuning epochs per rung, e.g. [1, 3, 9]"""
+    epochs = [min_epochs]
+    while epochs[-1] * eta <= max_epochs:
+        epochs.append(epochs[-1] * eta)
+    return epochs
+
+def prepare_shared_data(settings):
+    """
+    One-time work shared by all trials
+
+    Returns:
+        dict of file paths (packed store is found by create_packed_dataset)
+    """
+    import train_receipt_detector as trainer
+    from packed_dataset import pack_split, create_packed_dataset
+    from feature_cache import create_feature_extractor, load_or_extract_features
+    from run_state import dataset_fingerprint
+
+    search_dir = settings['search_dir']
+    os.makedirs(search_dir, exist_ok=True)
+    img_size, batch_size = settings['img_size'], settings['batch_size']
+
+    print("\n📦 Preparing shared data...")
+    for split_dir in (settings['train_dir'], settings['val_dir']):
+        pack_split(split_dir, img_size)
+
+    model, base_model = trainer.create_model(img_size=img_size)
+    shared = {
+        'base_weights': os.path.join(search_dir, 'base.weights.h5'),
+        'data_key': dataset_fingerprint([settings['train_dir'], settings['val_dir']], img_size),
+    }
+    base_model.save_weights(shared['base_weights'])
+
+    feature_model = create_feature_extractor(model)
+    for split, split_dir, variants in (('train', settings['train_dir'], settings['feature_variants']),
+                                       ('val', settings['val_dir'], 0)):
+        features, labels = load_or_extract_features(
+            feature_model, split_dir, create_packed_dataset, img_size, batch_size, variants=variants
+        )
+        shared[f'{split}_features'] = os.path.join(search_dir, f'{split}_features.npy')
+        shared[f'{split}_labels'] = os.path.join(search_dir, f'{split}_labels.npy')
+        np.save(shared[f'{split}_features'], features)
+        np.save(shared[f'{split}_labels'], labels)
+    return shared
+
+def init_worker(threads):
+    """Limit each trial process to `threads` compute threads"""
+    os.environ['OMP_NUM_THREADS'] = str(threads)
+    import tensorflow as tf
+    tf.config.threading.set_intra_op_parallelism_threads(threads)
+    tf.config.threading.set_inter_op_parallelism_threads(1)
+
+def run_trial(trial_id, config, epochs, shared, settings):
+    """
+    Train one config up to `epochs` fine-tuning epochs (runs in a worker)
+
+    Phase 1 trains the head on the shared features; Phase 2 fine-tunes the
+    full model on the packed store and resumes from the trial's previous
+    rung, so promotion only pays for the extra epochs. The reported metrics
+    are those of epoch `epochs`, also when the trial already trained further.
+    """
+    import tensorflow as tf
+    import train_receipt_detector as trainer
+    from packed_dataset import create_packed_dataset
+    from feature_cache import create_head, copy_head_weights, create_feature_dataset
+    from run_state import TrainingRun, fit_resumable
+
+    start = time.perf_counter()
+    img_size, batch_size = settings['img_size'], settings['batch_size']
+    run = TrainingRun({'config': config, 'data': shared['data_key'], 'img_size': img_size,
+                       'batch_size': batch_size, 'head_epochs': settings['head_epochs']},
+                      runs_dir=os.path.join(settings['search_dir'], 'trials'))
+    head_stage = run.stage('head', {})
+    finetune_stage = run.stage('finetune', {})
+
+    model, base_model = trainer.create_model(config['DENSE_UNITS'], config['DROPOUT'],
+                                             weights=None, img_size=img_size)
+    base_model.load_weights(shared['base_weights'])
+    base_model.trainable = False
+
+    if head_stage.done:
+        head_stage.load_weights(model)
+    else:
+        train_x = np.load(shared['train_features'], mmap_mode='r')
+        train_y = np.load(shared['train_labels'])
+        val_x = np.load(shared['val_features'], mmap_mode='r')
+        val_y = np.load(shared['val_labels'])
+        head = create_head(train_x.shape[1], config['DENSE_UNITS'], config['DROPOUT'])
+        head.compile(
+            optimizer=tf.keras.optimizers.Adam(learning_rate=config['LEARNING_RATE_INITIAL']),
+            loss='binary_crossentropy', metrics=['accuracy']
+        )
+        head.fit(create_feature_dataset(np.asarray(train_x), train_y, batch_size, shuffle=True),
+                 epochs=settings['head_epochs'],
+                 validation_data=create_feature_dataset(np.asarray(val_x), val_y, batch_size),
+                 verbose=0)
+        copy_head_weights(head, model)
+        head_stage.complete(model=model)
+
+    base_model.trainable = True
+    for layer in base_model.layers[:-config['UNFREEZE_LAYERS']]:
+        layer.trainable = False
+    model.compile(
+        optimizer=tf.keras.optimizers.Adam(learning_rate=config['LEARNING_RATE_FINETUNE']),
+        loss='binary_crossentropy', metrics=['accuracy']
+    )
+    train_ds, _ = create_packed_dataset(settings['train_dir'], batch_size, img_size, training=True)
+    val_ds, _ = create_packed_dataset(settings['val_dir'], batch_size, img_size, training=False)
+    history = fit_resumable(model, finetune_stage, train_ds, epochs=epochs,
+                            validation_data=val_ds, verbose=0)
+
+    # A rerun of the search resumes trials that already trained past this
+    # rung; their history holds every epoch, so report the rung's own one
+    return {
+        'trial': trial_id,
+        'epochs': epochs,
+        **config,
+        'val_accuracy': history.history['val_accuracy'][epochs - 1],
+        'val_loss': history.history['val_loss'][epochs - 1],
+        'seconds': round(time.perf_counter() - start, 1),
+    }
+
+def successive_halving(configs, shared, settings, workers, threads, eta=ETA, epochs=None):
+    """
+    Run all rungs and return every trial result (one row per trial and rung)
+
+    Each rung keeps the best 1/eta trials by val accuracy (then val loss).
+    """
+    epochs = epochs or rung_epochs(eta=eta)
+    alive = list(range(len(configs)))
+    rows = []
+
+    ctx = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=ctx,
+                             initializer=init_worker, initargs=(threads,)) as executor:
+        for rung, rung_budget in enumerate(epochs):
+            print(f"\n Rung {rung}: {len(alive)} trials x {rung_budget} fine-tuning epochs")
+            futures = [executor.submit(run_trial, i, configs[i], rung_budget, shared, settings)
+                       for i in alive]
+            results = []
+            for future in as_completed(futures):
+                result = future.result()
+                result['rung'] = rung
+                results.append(result)
+                print(f"   - trial {result['trial']}: val_acc={result['val_accuracy']:.4f} "
+                      f"val_loss={result['val_loss']:.4f} ({result['seconds']}s)")
+            rows.extend(results)
+
+            results.sort(key=lambda r: (-r['val_accuracy'], r['val_loss']))
+            alive = [r['trial'] for r in results[:max(1, len(results) // eta)]]
+    return rows
+
+def write_results(rows, path):
+    """Write the results table as CSV"""
+    columns = ['trial', 'rung', 'epochs'] + list(SEARCH_SPACE) + ['val_accuracy', 'val_loss', 'seconds']
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=columns, extrasaction='ignore')
+        writer.writeheader()
+        for row in sorted(rows, key=lambda r: (r['rung'], -r['val_accuracy'])):
+            writer.writerow(row)
+
+def write_defaults(config, script_path=TRAINING_SCRIPT):
+    """
+    Replace `NAME = value` constants in the training script with `config`
+
+    Trailing comments on those lines are kept.
+    """
+    with open(script_path) as f:
+        source = f.read()
+    for name, value in config.items():
+        pattern = re.compile(rf'^({name} = )([^#\n]*?)(\s*#.*)?$', re.MULTILINE)
+        if not pattern.search(source):
+            raise ValueError(f"{name} not found in {script_path}")
+        source = pattern.sub(lambda m: f'{m.group(1)}{value!r}{m.group(3) or ""}', source, count=1)
+    with open(script_path, 'w') as f:
+        f.write(source)
+
+def main():
+    import train_receipt_detector as trainer
+
+    parser = argparse.ArgumentParser(description='Hyperparameter search for the receipt detector')
+    parser.add_argument('--trials', type=int, default=NUM_TRIALS)
+    parser.add_argument('--eta', type=int, default=ETA, help='Keep 1/eta trials per rung')
+    parser.add_argument('--min-epochs', type=int, default=MIN_EPOCHS)
+    parser.add_argument('--max-epochs', type=int, default=MAX_EPOCHS)
+    parser.add_argument('--head-epochs', type=int, default=HEAD_EPOCHS)
+    parser.add_argument('--workers', type=int, default=2, help='Trials running in parallel')
+    parser.add_argument('--threads', type=int, default=None,
+                        help='Threads per trial (default: cores / workers)')
+    parser.add_argument('--seed', type=int, default=RANDOM_SEED)
+    parser.add_argument('--search-dir', default=SEARCH_DIR)
+    parser.add_argument('--dry-run', action='store_true',
+                        help=f'Do not write the best config into {TRAINING_SCRIPT}')
+    args = parser.parse_args()
+    threads = args.threads or max(1, (os.cpu_count() or 1) // args.workers)
+
+    print("=" * 60)
+    print("Receipt Detector Hyperparameter Search")
+    print("=" * 60)
+
+    settings = {
+        'search_dir': args.search_dir,
+        'train_dir': trainer.TRAIN_DIR,
+        'val_dir': trainer.VAL_DIR,
+        'img_size': trainer.IMG_SIZE,
+        'batch_size': trainer.BATCH_SIZE,
+        'head_epochs': args.head_epochs,
+        'feature_variants': FEATURE_VARIANTS,
+    }
+    shared = prepare_shared_data(settings)
+
+    rng = random.Random(args.seed)
+    configs = [sample_config(rng) for _ in range(args.trials)]
+    epochs = rung_epochs(args.min_epochs, args.max_epochs, args.eta)
+    print(f"\n {args.trials} trials, rungs {epochs}, {args.workers} workers x {threads} threads")
+
+    rows = successive_halving(configs, shared, settings, args.workers, threads, args.eta, epochs)
+    results_path = os.path.join(args.search_dir, 'results.csv')
+    write_results(rows, results_path)
+    print(f"\n Results table saved: {results_path}")
+
+    final = [r for r in rows if r['rung'] == max(r['rung'] for r in rows)]
+    best = max(final, key=lambda r: (r['val_accuracy'], -r['val_loss']))
+    best_config = {name: best[name] for name in SEARCH_SPACE}
+    print(f"\n✅ Best: trial {best['trial']} val_acc={best['val_accuracy']:.4f}")
+    for name, value in best_config.items():
+        print(f"   - {name} = {value!r}")
+
+    if not args.dry_run:
+        write_defaults(best_config)
+        print(f" Defaults written to {TRAINING_SCRIPT}")
+
+if __name__ == '__main__':
+    main()
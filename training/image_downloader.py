@@ -0,0 +1,190 @@
+"""
+Concurrent, resumable image downloader
+Used by download_non_receipts.py and prepare_dataset.py
+
+- Thread pool with a bounded number of in-flight downloads
+- One pooled requests.Session (keep-alive connections are reused)
+- Token-bucket rate limiter shared by all workers
+- Retries with exponential backoff on connection errors and 429/5xx
+- Decode + resize to IMG_SIZE in the worker threads before writing
+- On-disk progress manifest, so an interrupted run resumes where it stopped
+"""
+
+import os
+import json
+import time
+import threading
+from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from PIL import Image
+
+# Configuration
+IMG_SIZE = 224
+MAX_WORKERS = 8
+REQUESTS_PER_SECOND = 10.0
+MAX_RETRIES = 4
+BACKOFF_FACTOR = 0.5
+TIMEOUT = 10
+JPEG_QUALITY = 95
+
+class TokenBucket:
+    """
+    Thread-safe token-bucket rate limiter
+
+    `rate` tokens are added per second up to `capacity`; acquire() blocks
+    until a token is available. rate <= 0 disables limiting.
+    """
+
+    def __init__(self, rate=REQUESTS_PER_SECOND, capacity=None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        if self.rate <= 0:
+            return
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+class DownloadManifest:
+    """
+    Append-only JSON-lines record of finished downloads
+
+    Each line is {"id": ..., "path": ..., "status": "ok" | "failed"}.
+    Only "ok" entries whose file still exists count as done.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.done = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # Partially written last line after a crash
+                    if entry.get('status') == 'ok':
+                        self.done[entry['id']] = entry['path']
+        dirname = os.path.dirname(path)
+        if dirname:
+            os.makedirs(dirname, exist_ok=True)
+
+    def is_done(self, job_id):
+        path = self.done.get(job_id)
+        return path is not None and os.path.exists(path)
+
+    def record(self, job_id, path, status, error=None):
+        entry = {'id': job_id, 'path': path, 'status': status}
+        if error:
+            entry['error'] = error
+        with self.lock:
+            if status == 'ok':
+                self.done[job_id] = path
+            with open(self.path, 'a') as f:
+                f.write(json.dumps(entry) + '\n')
+
+def create_session(pool_size=MAX_WORKERS, retries=MAX_RETRIES,
+                   backoff_factor=BACKOFF_FACTOR, headers=None):
+    """requests.Session with a connection pool sized for the thread pool"""
+    retry = Retry(
+        total=retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=('GET',),
+        respect_retry_after_header=True
+    )
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    if headers:
+        session.headers.update(headers)
+    return session
+
+def fetch_image(session, url, save_path, img_size=IMG_SIZE, bucket=None, timeout=TIMEOUT):
+    """Download one image, convert to RGB, resize and save as JPEG"""
+    if bucket is not None:
+        bucket.acquire()
+    response = session.get(url, timeout=timeout)
+    response.raise_for_status()
+
+    img = Image.open(BytesIO(response.content))
+    img = img.convert('RGB')
+    if img_size:
+        img = img.resize((img_size, img_size), Image.BILINEAR)
+
+    # Write to a temp file first so a crash never leaves a truncated image
+    tmp_path = save_path + '.part'
+    img.save(tmp_path, format='JPEG', quality=JPEG_QUALITY)
+    os.replace(tmp_path, save_path)
+    return len(response.content)
+
+def download_images(jobs, manifest_path, session=None, max_workers=MAX_WORKERS,
+                    rate=REQUESTS_PER_SECOND, img_size=IMG_SIZE, progress_every=50):
+    """
+    Download (job_id, url, save_path) jobs concurrently
+
+    Jobs already recorded as done in the manifest are skipped.
+
+    Returns:
+        dict with 'downloaded', 'skipped', 'failed', 'bytes', 'seconds'
+        and 'images_per_sec'
+    """
+    manifest = DownloadManifest(manifest_path)
+    bucket = TokenBucket(rate)
+    owns_session = session is None
+    if owns_session:
+        session = create_session(pool_size=max_workers)
+
+    pending = [job for job in jobs if not manifest.is_done(job[0])]
+    stats = {'downloaded': 0, 'skipped': len(jobs) - len(pending), 'failed': 0, 'bytes': 0}
+    if stats['skipped']:
+        print(f"   - Resuming: {stats['skipped']} already downloaded")
+
+    start = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {}
+            for job_id, url, save_path in pending:
+                os.makedirs(os.path.dirname(save_path) or '.', exist_ok=True)
+                future = executor.submit(fetch_image, session, url, save_path, img_size, bucket)
+                futures[future] = (job_id, save_path)
+
+            for future in as_completed(futures):
+                job_id, save_path = futures[future]
+                try:
+                    stats['bytes'] += future.result()
+                except Exception as e:
+                    stats['failed'] += 1
+                    manifest.record(job_id, save_path, 'failed', str(e))
+                    continue
+                stats['downloaded'] += 1
+                manifest.record(job_id, save_path, 'ok')
+                if progress_every and stats['downloaded'] % progress_every == 0:
+                    print(f"     Downloaded {stats['downloaded']}/{len(pending)}")
+    finally:
+        if owns_session:
+            session.close()
+
+    stats['seconds'] = time.perf_counter() - start
+    stats['images_per_sec'] = stats['downloaded'] / stats['seconds'] if stats['seconds'] > 0 else 0.0
+    print(f"   - {stats['downloaded']} downloaded, {stats['skipped']} skipped, "
+          f"{stats['failed']} failed in {stats['seconds']:.1f}s "
+          f"({stats['images_per_sec']:.1f} images/sec)")
+    return stats
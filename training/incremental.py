@@ -0,0 +1,118 @@
+"""
+Incremental fine-tuning support for quick_finetune.py
+
+After every accepted training run a manifest of the training images is
+written next to the model:
+
+    ../models/receipt_detector_manifest.json
+        model_sha256   hash of the model file the manifest belongs to
+        class_indices  {'not_receipt': 0, 'receipt': 1}
+        images         {relative path: [label, size, mtime_ns]}
+
+The next incremental run compares the train directory against it and
+fine-tunes only on new (or changed) images plus a small stratified replay
+sample of images the model has already seen, so it doesn't forget them.
+"""
+
+import os
+import json
+import random
+
+from input_pipeline import RANDOM_SEED, list_image_files
+from file_organizer import file_sha256
+
+MANIFEST_PATH = '../models/receipt_detector_manifest.json'
+REPLAY_RATIO = 2.0      # replayed old images per new image
+MIN_REPLAY = 64         # ... but at least this many
+
+def snapshot_split(split_dir):
+    """Current label, size and mtime of every image in a split"""
+    paths, labels, class_indices = list_image_files(split_dir)
+    images = {}
+    for path, label in zip(paths, labels):
+        stat = os.stat(path)
+        images[os.path.relpath(path, split_dir)] = [label, stat.st_size, stat.st_mtime_ns]
+    return {'class_indices': class_indices, 'images': images}
+
+def save_manifest(split_dir, model_path, manifest_path=MANIFEST_PATH, metrics=None):
+    """Record the images `model_path` has now been trained on"""
+    manifest = snapshot_split(split_dir)
+    manifest['model_sha256'] = file_sha256(model_path)
+    manifest['metrics'] = metrics or {}
+    os.makedirs(os.path.dirname(manifest_path) or '.', exist_ok=True)
+    tmp = manifest_path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(manifest, f)
+    os.replace(tmp, manifest_path)
+    print(f" Training manifest saved: {manifest_path} ({len(manifest['images'])} images)")
+
+def load_manifest(model_path, manifest_path=MANIFEST_PATH):
+    """
+    Manifest for the current model file
+
+    Returns None if there is none, it is unreadable or it was written for a
+    different model file (e.g. the model was replaced by a full training run
+    that didn't record one).
+    """
+    try:
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not os.path.exists(model_path) or manifest.get('model_sha256') != file_sha256(model_path):
+        return None
+    return manifest
+
+def stratified_sample(paths, labels, size, seed=RANDOM_SEED):
+    """Random subset of `size` items keeping the class proportions"""
+    if size >= len(paths):
+        return list(paths), list(labels)
+
+    by_class = {}
+    for path, label in zip(paths, labels):
+        by_class.setdefault(label, []).append(path)
+
+    rng = random.Random(seed)
+    sample_paths, sample_labels = [], []
+    for label, class_paths in sorted(by_class.items()):
+        count = max(1, round(size * len(class_paths) / len(paths)))
+        for path in rng.sample(class_paths, min(count, len(class_paths))):
+            sample_paths.append(path)
+            sample_labels.append(label)
+    return sample_paths, sample_labels
+
+def select_incremental(split_dir, manifest, replay_ratio=REPLAY_RATIO,
+                       min_replay=MIN_REPLAY, seed=RANDOM_SEED):
+    """
+    New images since the manifest plus a stratified replay sample
+
+    Returns:
+        None if the manifest can't be used (missing or classes changed),
+        else dict with 'paths', 'labels', 'new' and 'replay' counts
+    """
+    if manifest is None:
+        return None
+    current = snapshot_split(split_dir)
+    if current['class_indices'] != manifest['class_indices']:
+        return None
+
+    seen = manifest['images']
+    new_paths, new_labels, old_paths, old_labels = [], [], [], []
+    for rel_path, entry in sorted(current['images'].items()):
+        path = os.path.join(split_dir, rel_path)
+        if seen.get(rel_path) == entry:
+            old_paths.append(path)
+            old_labels.append(entry[0])
+        else:
+            new_paths.append(path)
+            new_labels.append(entry[0])
+
+    replay_size = max(min_replay, int(len(new_paths) * replay_ratio)) if new_paths else 0
+    replay_paths, replay_labels = stratified_sample(old_paths, old_labels, replay_size, seed)
+
+    return {
+        'paths': new_paths + replay_paths,
+        'labels': new_labels + replay_labels,
+        'new': len(new_paths),
+        'replay': len(replay_paths),
+    }
@@ -0,0 +1,332 @@
+"""
+tf.data input pipeline for the receipt detector
+Parallel replacement for ImageDataGenerator.flow_from_directory
+
+Produces the same class indices, rescaling and augmentation policy as the
+Keras generators, but decodes/resizes in parallel, caches decoded images,
+augments whole batches at once and prefetches the next batch while the
+model is training.
+"""
+
+import time
+import tensorflow as tf
+
+# File listing is TF-free and lives with the manifest; re-exported here
+from dataset_manifest import list_image_files
+
+# Configuration (kept in sync with train_receipt_detector.py)
+IMG_SIZE = 224
+BATCH_SIZE = 32
+RANDOM_SEED = 42
+
+# Augmentation policy (mirrors the training ImageDataGenerator)
+ROTATION_RANGE = 10       # degrees
+SHIFT_RANGE = 0.1         # fraction of width/height
+ZOOM_RANGE = 0.1          # +/- 10%
+BRIGHTNESS_RANGE = (0.8, 1.2)
+
+def decode_and_resize(path, label, img_size=IMG_SIZE):
+    """Read, decode and resize one image to uint8 (img_size, img_size, 3)"""
+    image = tf.io.read_file(path)
+    image = tf.io.decode_image(image, channels=3, expand_animations=False)
+    # 'nearest' matches the default interpolation of flow_from_directory
+    image = tf.image.resize(image, (img_size, img_size), method='nearest')
+    image = tf.cast(image, tf.uint8)
+    image.set_shape((img_size, img_size, 3))
+    return image, tf.cast(label, tf.float32)
+
+def random_affine_transforms(batch_size, height, width, seed,
+                             rotation_range=ROTATION_RANGE, shift_range=SHIFT_RANGE,
+                             zoom_range=ZOOM_RANGE):
+    """
+    Per-image rotation + shift + zoom as one projective transform each
+
+    Same ranges as ImageDataGenerator (rotation in degrees, shift as a
+    fraction of width/height, independent x/y zoom), drawn with stateless
+    RNG from `seed` (shape (2,) int). No horizontal flip: receipts have an
+    orientation.
+
+    Returns:
+        (batch_size, 8) transforms for ImageProjectiveTransformV3, mapping
+        output pixel coordinates to input coordinates
+    """
+    seeds = tf.random.experimental.stateless_split(seed, num=4)
+    angle = tf.random.stateless_uniform((batch_size,), seeds[0], -rotation_range, rotation_range)
+    angle = angle * (3.141592653589793 / 180.0)
+    shift = tf.random.stateless_uniform((batch_size, 2), seeds[1], -shift_range, shift_range)
+    zoom = tf.random.stateless_uniform((batch_size, 2), seeds[2], 1 - zoom_range, 1 + zoom_range)
+
+    width = tf.cast(width, tf.float32)
+    height = tf.cast(height, tf.float32)
+    cx, cy = (width - 1) / 2, (height - 1) / 2
+    cos, sin = tf.cos(angle), tf.sin(angle)
+    zx, zy = zoom[:, 0], zoom[:, 1]
+
+    # input = center + rotate(zoom(output - center)) + shift
+    a0, a1 = zx * cos, -zy * sin
+    b0, b1 = zx * sin, zy * cos
+    a2 = cx - a0 * cx - a1 * cy + shift[:, 0] * width
+    b2 = cy - b0 * cx - b1 * cy + shift[:, 1] * height
+    zeros = tf.zeros_like(angle)
+    return tf.stack([a0, a1, a2, b0, b1, b2, zeros, zeros], axis=1)
+
+def random_brightness(images, seed, brightness_range=BRIGHTNESS_RANGE):
+    """Scale each image in a batch by a random factor, clipped to [0, 255]"""
+    batch = tf.shape(images)[0]
+    factors = tf.random.stateless_uniform(
+        (batch, 1, 1, 1), seed, brightness_range[0], brightness_range[1]
+    )
+    return tf.clip_by_value(images * factors, 0.0, 255.0)
+
+def augment_batch(images, seed):
+    """
+    Batch-level augmentation with the same policy as the old generator
+
+    - Rotation: ±10 degrees
+    - Width/Height shift: 10%
+    - Zoom: 10%
+    - Brightness: x0.8-1.2 (multiplicative, like ImageDataGenerator)
+    - NO horizontal flip (receipts have orientation)
+
+    Rotation, shift and zoom are fused into a single bilinear warp with
+    nearest-edge fill (ImageDataGenerator's order=1, fill_mode='nearest'),
+    so each batch is resampled once instead of once per transform. The
+    result depends only on `images` and `seed`.
+
+    Args:
+        images: float32 (batch, height, width, 3) in [0, 255]
+        seed: int tensor of shape (2,)
+    """
+    shape = tf.shape(images)
+    transform_seed, brightness_seed = tf.unstack(tf.random.experimental.stateless_split(seed, num=2))
+    transforms = random_affine_transforms(shape[0], shape[1], shape[2], transform_seed)
+    images = tf.raw_ops.ImageProjectiveTransformV3(
+        images=images, transforms=transforms, output_shape=shape[1:3],
+        fill_value=0.0, interpolation='BILINEAR', fill_mode='NEAREST'
+    )
+    return random_brightness(images, brightness_seed)
+
+def create_dataset(directory, batch_size=BATCH_SIZE, img_size=IMG_SIZE,
+                   training=False, shuffle=None, cache=True, shard=None, repeat=False,
+                   seed=RANDOM_SEED):
+    """
+    Build a tf.data pipeline for one split
+
+    Pipeline: list files -> parallel decode/resize -> cache -> shuffle
+              -> batch -> augment (training only) -> rescale -> prefetch
+
+    Args:
+        directory: split directory with one sub-directory per class
+        training: apply augmentation
+        shuffle: shuffle each epoch (defaults to `training`)
+        cache: True for in-memory cache, a file path for an on-disk cache,
+               False to disable
+        shard: (num_shards, index) to read only this worker's files
+               (multi-worker training, see distributed.py)
+        repeat: repeat indefinitely (use with steps_per_epoch)
+        seed: shuffle and augmentation seed (see finalize_batches)
+
+    Returns:
+        (dataset, info) where info has 'samples' and 'class_indices'
+    """
+    paths, labels, class_indices = list_image_files(directory)
+    ds = create_dataset_from_files(paths, labels, batch_size, img_size, training,
+                                   shuffle, cache, shard, repeat, seed)
+
+    info = {'samples': len(paths), 'class_indices': class_indices}
+    return ds, info
+
+def create_dataset_from_files(paths, labels, batch_size=BATCH_SIZE, img_size=IMG_SIZE,
+                              training=False, shuffle=None, cache=True, shard=None,
+                              repeat=False, seed=RANDOM_SEED):
+    """
+    Same pipeline as create_dataset for an explicit list of files
+
+    Used when training on a subset of a split (e.g. incremental fine-tuning).
+    """
+    if shuffle is None:
+        shuffle = training
+
+    ds = tf.data.Dataset.from_tensor_slices((paths, labels))
+    if shard:
+        # Shard file names before decoding so each worker decodes only its part
+        ds = shard_dataset(ds, *shard)
+    ds = ds.map(
+        lambda p, l: decode_and_resize(p, l, img_size),
+        num_parallel_calls=tf.data.AUTOTUNE,
+        deterministic=not training
+    )
+
+    # Cache decoded uint8 images so later epochs skip JPEG decoding
+    if cache:
+        ds = ds.cache(cache if isinstance(cache, str) else '')
+
+    if shuffle:
+        ds = ds.shuffle(len(paths), seed=seed, reshuffle_each_iteration=True)
+
+    if repeat:
+        ds = ds.repeat()
+    ds = ds.batch(batch_size)
+    return finalize_batches(ds, training, seed)
+
+def shard_dataset(ds, num_shards, index):
+    """
+    Keep every num_shards-th element starting at index
+
+    Disables tf.distribute auto-sharding, which would otherwise shard the
+    already-sharded dataset a second time.
+    """
+    options = tf.data.Options()
+    options.experimental_distribute.auto_shard_policy = tf.data.experimental.AutoShardPolicy.OFF
+    return ds.shard(num_shards, index).with_options(options)
+
+def finalize_batches(ds, training, seed=RANDOM_SEED):
+    """
+    Augment (training only), rescale and prefetch batches of uint8 images
+
+    Shared by the directory pipeline and the packed-cache pipeline.
+    Augmentation lives in the tf.data graph, never in the model, so
+    evaluation, inference and TFLite export never see it. Every batch gets
+    its own seed from a `seed`-ed random stream that is redrawn each epoch:
+    reruns reproduce the same augmentation, epochs don't repeat it.
+    """
+    ds = ds.map(lambda x, y: (tf.cast(x, tf.float32), y),
+                num_parallel_calls=tf.data.AUTOTUNE)
+
+    if training:
+        seeds = tf.data.Dataset.random(seed=seed, rerandomize_each_iteration=True).batch(2)
+        ds = tf.data.Dataset.zip((ds, seeds)).map(
+            lambda batch, batch_seed: (augment_batch(batch[0], batch_seed), batch[1]),
+            num_parallel_calls=tf.data.AUTOTUNE
+        )
+
+    # Rescale to [0, 1] like ImageDataGenerator(rescale=1./255)
+    ds = ds.map(lambda x, y: (x / 255.0, y), num_parallel_calls=tf.data.AUTOTUNE)
+    return ds.prefetch(tf.data.AUTOTUNE)
+
+def measure_throughput(data, num_batches=None, epochs=2):
+    """
+    Iterate over a loader and report images/sec per epoch
+
+    Works with both tf.data datasets and Keras directory iterators.
+    """
+    if num_batches is None:
+        num_batches = len(data) if hasattr(data, '__len__') else None
+
+    results = []
+    for epoch in range(epochs):
+        images = 0
+        start = time.perf_counter()
+        for step, (x, _) in enumerate(data):
+            images += int(x.shape[0])
+            if num_batches is not None and step + 1 >= num_batches:
+                break
+        elapsed = time.perf_counter() - start
+        results.append(images / elapsed if elapsed > 0 else 0.0)
+        print(f"   - Epoch {epoch + 1}: {images} images in {elapsed:.2f}s "
+              f"({results[-1]:.1f} images/sec)")
+
+    return results
+
+def benchmark_augmentation(data_dir, batch_size=BATCH_SIZE, img_size=IMG_SIZE, num_batches=8,
+                           epochs=2):
+    """
+    Augmentation cost alone and inside the pipeline
+
+    1. The same decoded batches augmented by ImageDataGenerator (scipy,
+       one image at a time) and by augment_batch (one fused op per batch)
+    2. The tf.data pipeline with and without augmentation
+    """
+    from tensorflow.keras.preprocessing.image import ImageDataGenerator
+
+    ds, _ = create_dataset(data_dir, batch_size, img_size, training=False)
+    batches = [x.numpy() * 255.0 for x, _ in ds.take(num_batches)]
+    images = sum(len(batch) for batch in batches)
+
+    generator = ImageDataGenerator(
+        rotation_range=ROTATION_RANGE,
+        width_shift_range=SHIFT_RANGE,
+        height_shift_range=SHIFT_RANGE,
+        zoom_range=ZOOM_RANGE,
+        brightness_range=list(BRIGHTNESS_RANGE),
+        horizontal_flip=False,
+        fill_mode='nearest'
+    )
+    start = time.perf_counter()
+    for batch in batches:
+        for image in batch:
+            generator.random_transform(image)
+    scipy_rate = images / (time.perf_counter() - start)
+    print(f"   - ImageDataGenerator.random_transform: {scipy_rate:.1f} images/sec")
+
+    fused = tf.function(augment_batch)
+    tensors = [tf.constant(batch) for batch in batches]
+    fused(tensors[0], tf.constant([0, 0], tf.int64))  # trace once
+    start = time.perf_counter()
+    for i, batch in enumerate(tensors):
+        fused(batch, tf.constant([RANDOM_SEED, i], tf.int64)).numpy()
+    fused_rate = images / (time.perf_counter() - start)
+    print(f"   - augment_batch (fused, batched): {fused_rate:.1f} images/sec "
+          f"({fused_rate / scipy_rate:.1f}x)")
+
+    print("\n tf.data pipeline without augmentation:")
+    plain, _ = create_dataset(data_dir, batch_size, img_size, training=False, shuffle=True)
+    plain_rates = measure_throughput(plain, epochs=epochs)
+    print("\n tf.data pipeline with augmentation:")
+    augmented, _ = create_dataset(data_dir, batch_size, img_size, training=True)
+    augmented_rates = measure_throughput(augmented, epochs=epochs)
+    print(f"\n Augmentation keeps {augmented_rates[-1] / plain_rates[-1]:.0%} of pipeline "
+          f"throughput (last epoch)")
+
+    return {'scipy': scipy_rate, 'fused': fused_rate,
+            'pipeline_plain': plain_rates[-1], 'pipeline_augmented': augmented_rates[-1]}
+
+def main():
+    """Compare ImageDataGenerator and tf.data throughput on the train split"""
+    import argparse
+    from tensorflow.keras.preprocessing.image import ImageDataGenerator
+
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument('--data-dir', default='../dataset/train')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    parser.add_argument('--epochs', type=int, default=2)
+    parser.add_argument('--augmentation', action='store_true',
+                        help='Benchmark augmentation alone (scipy vs fused) and its pipeline cost')
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("Input Pipeline Benchmark")
+    print("=" * 60)
+
+    if args.augmentation:
+        print("\n Augmentation only:")
+        benchmark_augmentation(args.data_dir, args.batch_size, epochs=args.epochs)
+        return
+
+    print("\n ImageDataGenerator.flow_from_directory:")
+    generator = ImageDataGenerator(
+        rescale=1./255,
+        rotation_range=ROTATION_RANGE,
+        width_shift_range=SHIFT_RANGE,
+        height_shift_range=SHIFT_RANGE,
+        zoom_range=ZOOM_RANGE,
+        brightness_range=list(BRIGHTNESS_RANGE),
+        horizontal_flip=False,
+        fill_mode='nearest'
+    ).flow_from_directory(
+        args.data_dir,
+        target_size=(IMG_SIZE, IMG_SIZE),
+        batch_size=args.batch_size,
+        class_mode='binary',
+        shuffle=True
+    )
+    old = measure_throughput(generator, epochs=args.epochs)
+
+    print("\n tf.data pipeline:")
+    ds, _ = create_dataset(args.data_dir, batch_size=args.batch_size, training=True)
+    new = measure_throughput(ds, epochs=args.epochs)
+
+    print(f"\n Speedup (last epoch): {new[-1] / old[-1]:.2f}x")
+
+if __name__ == '__main__':
+    main()
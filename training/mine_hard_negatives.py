@@ -0,0 +1,205 @@
+"""
+Hard-negative mining from a large unlabeled image pool
+
+Non-receipts picked at random from a generic dump are mostly easy (trees,
+faces, food) and teach the model little. This command streams a pool that is
+known to contain no receipts through the current detector and adds the most
+receipt-like images (documents, menus, screens, ...) to
+dataset/train/not_receipt:
+
+- scoring reuses classify_images.classify: paths are streamed, decoding runs
+  in a process pool with a bounded number of batches in flight, and the
+  TFLite interpreter uses all cores. Scores are appended to a JSONL file
+  keyed by model and pool, so an interrupted scan resumes where it stopped
+- a size-K min-heap over the score stream keeps the top candidates in
+  constant memory, however large the pool
+- candidates that are near-duplicates of each other or of any image already
+  in the dataset (train or val) are dropped (near_duplicates.py)
+- picked images are hardlinked/copied into train/not_receipt and the
+  dataset manifest is updated; val is left alone so it keeps measuring the
+  real distribution
+
+Usage:
+    python mine_hard_negatives.py --input /data/image_pool --top-k 500
+    python mine_hard_negatives.py --input /data/image_pool --top-k 500 --dry-run
+"""
+
+import os
+import json
+import heapq
+import argparse
+
+from classify_images import (
+    MODEL_PATH, BATCH_SIZE, THRESHOLD, iter_directory, iter_file_list, classify
+)
+from file_organizer import file_sha256, path_id, organize_files, format_stats
+from near_duplicates import compute_hashes, find_clusters
+from dataset_manifest import list_image_files, update_manifest
+
+# Paths
+DATASET_DIR = '../dataset'
+TRAIN_DIR = os.path.join(DATASET_DIR, 'train', 'not_receipt')
+MINING_DIR = os.path.join(DATASET_DIR, '.mining')
+DEDUPE_CACHE_PATH = os.path.join(DATASET_DIR, '.dedupe', 'hash_cache.json')
+
+# Configuration
+TOP_K = 500
+OVERSAMPLE = 2  # candidates kept in the heap per requested image (dedupe drops some)
+
+def scores_path(model_path, source, mining_dir=MINING_DIR):
+    """Resumable score file for one (model, pool) pair"""
+    model_id = file_sha256(model_path)[:12]
+    return os.path.join(mining_dir, f'scores_{model_id}_{path_id(os.path.abspath(source))}.jsonl')
+
+def top_k_scores(path, k, max_score=None):
+    """
+    Highest-scoring images of a classify_images JSONL file
+
+    Streams the file through a min-heap of size k, so memory does not grow
+    with the pool.
+
+    Returns:
+        list of (score, path), highest first
+    """
+    heap = []
+    with open(path) as f:
+        for line in f:
+            record = json.loads(line)
+            score = record.get('score')
+            if score is None or (max_score is not None and score > max_score):
+                continue
+            if len(heap) < k:
+                heapq.heappush(heap, (score, record['path']))
+            elif score > heap[0][0]:
+                heapq.heapreplace(heap, (score, record['path']))
+    return sorted(heap, reverse=True)
+
+def dataset_images(dataset_dir=DATASET_DIR, splits=('train', 'val')):
+    """All images currently in the dataset (from the manifest when possible)"""
+    paths = []
+    for split in splits:
+        split_dir = os.path.join(dataset_dir, split)
+        if os.path.isdir(split_dir):
+            paths.extend(list_image_files(split_dir)[0])
+    return paths
+
+def drop_duplicates(candidates, existing, cache_path=DEDUPE_CACHE_PATH, workers=None):
+    """
+    Candidates that are neither near-duplicates of each other nor of the dataset
+
+    Args:
+        candidates: list of (score, path), highest first
+        existing: paths already in the dataset
+
+    Returns:
+        filtered list of (score, path), highest first
+    """
+    paths = [path for _, path in candidates] + existing
+    hashes = compute_hashes(paths, cache_path, workers)
+    keep = set()
+    for cluster in find_clusters(hashes):
+        if any(i >= len(candidates) for i in cluster):
+            continue  # already represented in the dataset
+        keep.add(min(cluster))  # candidates are sorted, lowest index = highest score
+    return [candidate for i, candidate in enumerate(candidates) if i in keep]
+
+def destination(src, train_dir=TRAIN_DIR):
+    """Stable, collision-free name for a mined image"""
+    return os.path.join(train_dir, f'hn_{path_id(os.path.abspath(src))}{os.path.splitext(src)[1].lower()}')
+
+def mine(paths, source, model_path=MODEL_PATH, top_k=TOP_K, max_score=None,
+         batch_size=BATCH_SIZE, workers=None, fast_decode=False, dry_run=False,
+         dataset_dir=DATASET_DIR, mode='auto'):
+    """
+    Score a pool, pick the top_k hardest negatives and add them to the dataset
+
+    Returns:
+        report dict (scan stats, picked images with scores)
+    """
+    mining_dir = os.path.join(dataset_dir, '.mining')
+    os.makedirs(mining_dir, exist_ok=True)
+    scores = scores_path(model_path, source, mining_dir)
+
+    print(f"\n Scoring pool with {model_path}...")
+    stats = classify(paths, scores, model_path, batch_size, workers, THRESHOLD, fast_decode)
+    print(f"   - {stats['classified']} scored, {stats['skipped']} already scored, "
+          f"{stats['errors']} unreadable ({stats['images_per_sec']:.1f} images/sec)")
+
+    # Widen the heap until enough candidates survive the dedupe (e.g. when
+    # earlier mining rounds already added the hardest ones)
+    existing = dataset_images(dataset_dir)
+    heap_size = top_k * OVERSAMPLE
+    while True:
+        candidates = top_k_scores(scores, heap_size, max_score)
+        print(f"\n Deduplicating {len(candidates)} candidates against the dataset...")
+        picked = drop_duplicates(candidates, existing,
+                                 os.path.join(dataset_dir, '.dedupe', 'hash_cache.json'), workers)[:top_k]
+        if len(picked) >= top_k or len(candidates) < heap_size:
+            break
+        heap_size *= 2
+    if picked:
+        print(f"   - Picked {len(picked)} images, scores {picked[-1][0]:.3f} .. {picked[0][0]:.3f}")
+
+    train_dir = os.path.join(dataset_dir, 'train', 'not_receipt')
+    report = {
+        'model': os.path.abspath(model_path),
+        'source': os.path.abspath(source),
+        'scan': stats,
+        'candidates': len(candidates),
+        'picked': [{'path': path, 'score': score, 'destination': destination(path, train_dir)}
+                   for score, path in picked],
+        'dry_run': dry_run,
+    }
+
+    if not dry_run and picked:
+        # prune=False: earlier mining rounds stay in the dataset
+        pairs = [(path, destination(path, train_dir)) for _, path in picked]
+        placed = organize_files(pairs, os.path.join(dataset_dir, '.organize', 'hard_negatives.json'),
+                                mode=mode, prune=False)
+        print(f"   - {format_stats(placed)}")
+        manifest_stats = update_manifest(dataset_dir)
+        print(f"   - Manifest: {manifest_stats['added']} added")
+
+    report_path = os.path.join(mining_dir, 'last_mining.json')
+    with open(report_path + '.tmp', 'w') as f:
+        json.dump(report, f, indent=2)
+    os.replace(report_path + '.tmp', report_path)
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description='Add the most receipt-like non-receipts to the training set')
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--input', help='Directory tree of images known to contain no receipts')
+    source.add_argument('--file-list', help='Text file with one image path per line')
+    parser.add_argument('--model', default=MODEL_PATH, help='.tflite, .h5 or .keras model')
+    parser.add_argument('--top-k', type=int, default=TOP_K, help='Images to add')
+    parser.add_argument('--max-score', type=float, default=None,
+                        help='Ignore images scored above this (guards against stray receipts in the pool)')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    parser.add_argument('--workers', type=int, default=None, help='Decode processes (default: all cores)')
+    parser.add_argument('--fast-decode', action='store_true',
+                        help='Use reduced-size JPEG decoding (faster, slightly different pixels)')
+    parser.add_argument('--dry-run', action='store_true', help='Only report what would be added')
+    parser.add_argument('--dataset', default=DATASET_DIR)
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("Hard-Negative Mining")
+    print("=" * 60)
+
+    paths = iter_directory(args.input) if args.input else iter_file_list(args.file_list)
+    report = mine(paths, args.input or args.file_list, args.model, args.top_k, args.max_score,
+                  args.batch_size, args.workers, args.fast_decode, args.dry_run, args.dataset)
+
+    for item in report['picked'][:10]:
+        print(f"     {item['score']:.3f}  {item['path']}")
+    if args.dry_run:
+        print(f"\n Dry run: {len(report['picked'])} images would be added to "
+              f"{os.path.join(args.dataset, 'train', 'not_receipt')}")
+    else:
+        print(f"\n✅ Added {len(report['picked'])} hard negatives to train/not_receipt")
+        print("📝 Next step: python quick_finetune.py --incremental")
+    print(f"   Report: {os.path.join(args.dataset, '.mining', 'last_mining.json')}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,241 @@
+"""
+Input resolution x width multiplier sweep with an accuracy/latency Pareto report
+
+Trains a head-only receipt detector for every combination of input size and
+MobileNetV2 alpha, exports each one to TFLite and measures:
+
+- val accuracy of the exported model (TFLite interpreter)
+- file size
+- interpreter latency (benchmark_tflite.py, fresh process per model)
+
+Every variant reads the packed store for its size and caches its pooled
+features (feature_cache.py), so re-running the sweep or adding a size only
+pays for what is new. The report lists all variants, marks the Pareto
+frontier (no other variant is both more accurate and faster) and picks the
+fastest variant within --max-accuracy-drop of the 224 / 1.0 baseline.
+
+Usage:
+    python model_sweep.py
+    python model_sweep.py --sizes 128 160 --alphas 0.5 0.75
+"""
+
+import os
+import json
+import argparse
+
+import tensorflow as tf
+from tensorflow.keras.callbacks import EarlyStopping
+
+import train_receipt_detector as trainer
+from packed_dataset import pack_split, create_packed_dataset
+from feature_cache import (
+    create_feature_extractor, create_head, copy_head_weights,
+    load_or_extract_features, create_feature_dataset
+)
+from tflite_export import EXPORT_MODES, convert_model, evaluate_tflite
+from benchmark_tflite import benchmark
+from run_state import dataset_fingerprint
+
+# Sweep configuration (sizes/alphas with ImageNet weights for MobileNetV2)
+SIZES = (96, 128, 160, 192, 224)
+ALPHAS = (0.35, 0.5, 0.75, 1.0)
+BASELINE = (224, 1.0)
+HEAD_EPOCHS = 10
+FEATURE_VARIANTS = 1
+LATENCY_THREADS = 1
+LATENCY_RUNS = 100
+MAX_ACCURACY_DROP = 0.01
+
+# Paths
+SWEEP_DIR = '../models/sweep'
+REPORT_PATH = os.path.join(SWEEP_DIR, 'sweep_report.json')
+
+def variant_name(img_size, alpha):
+    return f'{img_size}_{alpha:g}'
+
+def train_variant(img_size, alpha, head_epochs=HEAD_EPOCHS, variants=FEATURE_VARIANTS):
+    """
+    Head-only model for one (size, alpha) trained on cached features
+
+    Returns:
+        Keras model with the trained head
+    """
+    model, _ = trainer.create_model(img_size=img_size, alpha=alpha)
+    feature_model = create_feature_extractor(model)
+
+    train_x, train_y = load_or_extract_features(
+        feature_model, trainer.TRAIN_DIR, create_packed_dataset, img_size,
+        trainer.BATCH_SIZE, variants=variants
+    )
+    val_x, val_y = load_or_extract_features(
+        feature_model, trainer.VAL_DIR, create_packed_dataset, img_size, trainer.BATCH_SIZE
+    )
+
+    head = create_head(train_x.shape[1], trainer.DENSE_UNITS, trainer.DROPOUT)
+    head.compile(
+        optimizer=tf.keras.optimizers.Adam(learning_rate=trainer.LEARNING_RATE_INITIAL),
+        loss='binary_crossentropy',
+        metrics=['accuracy']
+    )
+    head.fit(
+        create_feature_dataset(train_x, train_y, trainer.BATCH_SIZE, shuffle=True),
+        epochs=head_epochs,
+        validation_data=create_feature_dataset(val_x, val_y, trainer.BATCH_SIZE),
+        callbacks=[EarlyStopping(monitor='val_loss', patience=3, restore_best_weights=True)],
+        verbose=0
+    )
+    copy_head_weights(head, model)
+    return model
+
+def measure_variant(model, img_size, alpha, mode, sweep_dir, threads, runs):
+    """Export one variant and measure accuracy, size and latency"""
+    tflite_model = convert_model(model, mode, trainer.VAL_DIR, img_size=img_size)
+    path = os.path.join(sweep_dir, f'receipt_detector_{variant_name(img_size, alpha)}_{mode}.tflite')
+    with open(path, 'wb') as f:
+        f.write(tflite_model)
+
+    accuracy = evaluate_tflite(tflite_model, trainer.VAL_DIR, img_size)['accuracy']
+    timing = benchmark(path, trainer.VAL_DIR, threads=(threads,), xnnpack=(True,), runs=runs)
+    latency = timing['results'][0]
+    return {
+        'img_size': img_size,
+        'alpha': alpha,
+        'mode': mode,
+        'path': path,
+        'size_bytes': len(tflite_model),
+        'params': model.count_params(),
+        'val_accuracy': accuracy,
+        'latency_ms_p50': latency['latency_ms_p50'],
+        'latency_ms_p90': latency['latency_ms_p90'],
+    }
+
+def pareto_frontier(rows):
+    """Rows no other row beats on both val accuracy and p50 latency"""
+    frontier = []
+    for row in rows:
+        dominated = any(
+            other['val_accuracy'] >= row['val_accuracy']
+            and other['latency_ms_p50'] <= row['latency_ms_p50']
+            and (other['val_accuracy'] > row['val_accuracy']
+                 or other['latency_ms_p50'] < row['latency_ms_p50'])
+            for other in rows
+        )
+        if not dominated:
+            frontier.append(row)
+    return sorted(frontier, key=lambda row: row['latency_ms_p50'])
+
+def load_report(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def save_report(report, path):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(report, f, indent=2)
+    os.replace(tmp, path)
+
+def summarize(rows, max_accuracy_drop=MAX_ACCURACY_DROP):
+    """Pareto frontier, speedups vs the baseline and the recommended variant"""
+    frontier = pareto_frontier(rows)
+    baseline = next((row for row in rows if (row['img_size'], row['alpha']) == BASELINE), None)
+    recommended = None
+    if baseline:
+        for row in rows:
+            row['speedup'] = round(baseline['latency_ms_p50'] / row['latency_ms_p50'], 2)
+        candidates = [row for row in frontier
+                      if row['val_accuracy'] >= baseline['val_accuracy'] - max_accuracy_drop]
+        recommended = candidates[0] if candidates else None
+    return frontier, baseline, recommended
+
+def print_table(rows, frontier):
+    print(f"\n   {'size':>5} {'alpha':>6} {'size MB':>8} {'accuracy':>9} {'p50 ms':>8} {'speedup':>8}")
+    for row in sorted(rows, key=lambda r: (r['img_size'], r['alpha'])):
+        marker = ' *' if row in frontier else ''
+        print(f"   {row['img_size']:>5} {row['alpha']:>6g} {row['size_bytes'] / 2**20:>8.2f} "
+              f"{row['val_accuracy']:>9.4f} {row['latency_ms_p50']:>8.2f} "
+              f"{row.get('speedup', 0):>7.2f}x{marker}")
+    print("   (* = Pareto frontier)")
+
+def main():
+    parser = argparse.ArgumentParser(description='Input size x MobileNetV2 alpha sweep')
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(SIZES))
+    parser.add_argument('--alphas', type=float, nargs='+', default=list(ALPHAS))
+    parser.add_argument('--head-epochs', type=int, default=HEAD_EPOCHS)
+    parser.add_argument('--feature-variants', type=int, default=FEATURE_VARIANTS,
+                        help='Augmented copies of the training set to embed per variant')
+    parser.add_argument('--tflite-mode', choices=EXPORT_MODES, default='dynamic')
+    parser.add_argument('--threads', type=int, default=LATENCY_THREADS,
+                        help='Interpreter threads for the latency measurement')
+    parser.add_argument('--runs', type=int, default=LATENCY_RUNS)
+    parser.add_argument('--max-accuracy-drop', type=float, default=MAX_ACCURACY_DROP,
+                        help='Accuracy a recommended variant may lose against 224 / 1.0')
+    parser.add_argument('--output', default=REPORT_PATH)
+    args = parser.parse_args()
+    sweep_dir = os.path.dirname(args.output) or '.'
+    os.makedirs(sweep_dir, exist_ok=True)
+
+    print("=" * 60)
+    print("Resolution x Width Sweep")
+    print("=" * 60)
+
+    # Results are reused while the dataset and training settings stay the same
+    settings = {
+        'dataset': dataset_fingerprint([trainer.TRAIN_DIR, trainer.VAL_DIR], trainer.IMG_SIZE),
+        'head_epochs': args.head_epochs,
+        'feature_variants': args.feature_variants,
+        'head': [trainer.DENSE_UNITS, trainer.DROPOUT, trainer.LEARNING_RATE_INITIAL],
+        'tflite_mode': args.tflite_mode,
+        'threads': args.threads,
+    }
+    previous = load_report(args.output)
+    done = {}
+    if previous and previous.get('settings') == settings:
+        done = {variant_name(row['img_size'], row['alpha']): row for row in previous['variants']}
+
+    rows = []
+    for img_size in args.sizes:
+        for split_dir in (trainer.TRAIN_DIR, trainer.VAL_DIR):
+            pack_split(split_dir, img_size)
+        for alpha in args.alphas:
+            name = variant_name(img_size, alpha)
+            if name in done and os.path.exists(done[name]['path']):
+                print(f"\n Variant {name}: already measured")
+                rows.append(done[name])
+                continue
+
+            print(f"\n Variant {name}: training head...")
+            model = train_variant(img_size, alpha, args.head_epochs, args.feature_variants)
+            row = measure_variant(model, img_size, alpha, args.tflite_mode, sweep_dir,
+                                  args.threads, args.runs)
+            print(f"   - accuracy {row['val_accuracy']:.4f}, {row['size_bytes'] / 2**20:.2f} MB, "
+                  f"p50 {row['latency_ms_p50']:.2f}ms")
+            rows.append(row)
+            save_report({'settings': settings, 'variants': rows}, args.output)
+            tf.keras.backend.clear_session()
+
+    frontier, baseline, recommended = summarize(rows, args.max_accuracy_drop)
+    print_table(rows, frontier)
+    save_report({
+        'settings': settings,
+        'variants': rows,
+        'pareto_frontier': [variant_name(row['img_size'], row['alpha']) for row in frontier],
+        'baseline': variant_name(*BASELINE) if baseline else None,
+        'recommended': variant_name(recommended['img_size'], recommended['alpha']) if recommended else None,
+    }, args.output)
+    print(f"\n Report saved: {args.output}")
+
+    if recommended:
+        print(f"\n✅ Fastest within {args.max_accuracy_drop:.1%} of the baseline: "
+              f"IMG_SIZE = {recommended['img_size']}, ALPHA = {recommended['alpha']:g} "
+              f"({recommended['speedup']:.1f}x faster, accuracy {recommended['val_accuracy']:.4f} "
+              f"vs {baseline['val_accuracy']:.4f})")
+        print("   Set these in train_receipt_detector.py and retrain to fine-tune it.")
+    elif not baseline:
+        print(f"\n Baseline {variant_name(*BASELINE)} not in the sweep, no recommendation")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,339 @@
+"""
+Perceptual-hash near-duplicate detection
+
+SROIE and scraped photo sets contain re-encoded, resized and re-saved
+copies of the same image. Left in, they waste epoch time and leak into
+validation when the copies land in different splits. This module:
+
+- computes a 256-bit pHash (16x16 low-frequency DCT signs) per image on a
+  process pool, with JPEGs decoded at reduced scale (PIL draft mode);
+  hashes are cached by path, size and mtime
+- finds all pairs within PHASH_DISTANCE bits with a multi-index hash:
+  each hash is split into d // 2 + 1 chunks, and by the pigeonhole principle
+  a pair within d bits matches on one chunk up to a single flipped bit, so
+  only images sharing such a chunk key are compared (one vectorized sort
+  per chunk bit) instead of every pair
+- groups the pairs into clusters (union-find)
+- keeps one representative per cluster (largest resolution), or all members
+  with --keep-duplicates, and keys the train/val split by the cluster so a
+  cluster never spans both splits
+
+A 64-bit pHash/dHash is too coarse for receipts: two different receipts from
+the same shop (same layout, white paper) come within 2-4 bits of each other,
+while 256-bit pHashes of distinct SROIE receipts stay 34+ bits apart and
+re-encoded or resized copies within ~6.
+
+Usage:
+    python near_duplicates.py --source /path/to/images   # report clusters
+    python near_duplicates.py --check                    # leakage in ../dataset
+"""
+
+import os
+import json
+import argparse
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+from dataset_manifest import list_image_files
+
+DATASET_DIR = '../dataset'
+CACHE_PATH = os.path.join(DATASET_DIR, '.dedupe', 'hash_cache.json')
+REPORT_PATH = os.path.join(DATASET_DIR, '.dedupe', 'leakage_report.json')
+CACHE_VERSION = 1
+
+HASH_SIZE = 16                    # HASH_SIZE**2 = 256-bit pHash
+HASH_BYTES = HASH_SIZE ** 2 // 8
+PHASH_DISTANCE = 20               # max differing bits for a near-duplicate
+MAX_CHUNK_BITS = 32
+CHUNK_SIZE = 64
+
+# DCT-II basis for the pHash input (4x the hash size, as in the usual pHash)
+_DCT_SIZE = 4 * HASH_SIZE
+_DCT = np.cos(np.pi * (2 * np.arange(_DCT_SIZE)[None, :] + 1)
+              * np.arange(_DCT_SIZE)[:, None] / (2 * _DCT_SIZE))
+_POPCOUNT = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint16)
+
+def image_hash(path):
+    """
+    pHash and original size of one image (runs in a worker process)
+
+    Returns:
+        (hash as HASH_BYTES bytes, width, height), or None if unreadable
+    """
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            with Image.open(path) as img:
+                width, height = img.size
+                # JPEG: decode straight to a small grayscale image
+                img.draft('L', (2 * _DCT_SIZE, 2 * _DCT_SIZE))
+                gray = img.convert('L')
+    except Exception:  # unreadable files are the scanner's job
+        return None
+
+    pixels = np.asarray(gray.resize((_DCT_SIZE, _DCT_SIZE), Image.BILINEAR), dtype=np.float64)
+    low = (_DCT @ pixels @ _DCT.T)[:HASH_SIZE, :HASH_SIZE]
+    return np.packbits(low > np.median(low)).tobytes(), width, height
+
+def _hash_chunk(paths):
+    return [image_hash(path) for path in paths]
+
+def hamming(a, b):
+    """Differing bits between two hashes (bytes)"""
+    return int(_POPCOUNT[np.bitwise_xor(np.frombuffer(a, np.uint8), np.frombuffer(b, np.uint8))].sum())
+
+def load_cache(path):
+    try:
+        with open(path) as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return cache.get('files', {}) if cache.get('version') == CACHE_VERSION else {}
+
+def save_cache(files, path):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump({'version': CACHE_VERSION, 'files': files}, f)
+    os.replace(tmp, path)
+
+def compute_hashes(paths, cache_path=CACHE_PATH, workers=None):
+    """
+    Hashes of many images, reusing cached values for unchanged files
+
+    Returns:
+        list aligned with paths of (hash bytes, width, height) or None
+    """
+    cache = load_cache(cache_path) if cache_path else {}
+    results, todo = [None] * len(paths), []
+    for i, path in enumerate(paths):
+        stat = os.stat(path)
+        stat_key = [stat.st_size, stat.st_mtime_ns]
+        cached = cache.get(os.path.abspath(path))
+        if cached and cached[:2] == stat_key:
+            results[i] = cached[2] and (bytes.fromhex(cached[2]), cached[3], cached[4])
+        else:
+            todo.append((i, stat_key))
+
+    if todo:
+        chunks = [todo[i:i + CHUNK_SIZE] for i in range(0, len(todo), CHUNK_SIZE)]
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            hashed = executor.map(_hash_chunk, [[paths[i] for i, _ in chunk] for chunk in chunks])
+            for chunk, chunk_hashes in zip(chunks, hashed):
+                for (i, stat_key), value in zip(chunk, chunk_hashes):
+                    results[i] = value
+                    cache[os.path.abspath(paths[i])] = stat_key + (
+                        [None, 0, 0] if value is None else [value[0].hex(), value[1], value[2]])
+
+    if cache_path:
+        save_cache(cache, cache_path)
+    return results
+
+class MultiIndexHash:
+    """
+    All pairs of hashes within a Hamming radius
+
+    The hash bits are split into radius // 2 + 1 chunks (at most 32 bits
+    wide), so by the pigeonhole principle any pair within the radius agrees
+    on some chunk up to one flipped bit. For each chunk and bit, the chunk
+    values with that bit cleared are sorted, and only neighbours with equal
+    keys are compared: one sort per pass instead of N**2 comparisons.
+
+    Args:
+        hashes: uint8 array (N, HASH_BYTES), one packed hash per row
+        radius: max differing bits of a returned pair
+    """
+
+    def __init__(self, hashes, radius):
+        self.hashes = hashes
+        self.radius = radius
+        bits = hashes.shape[1] * 8
+        # More (narrower) chunks than needed are fine; wider ones overflow int64
+        num_chunks = max(radius // 2 + 1, -(-bits // MAX_CHUNK_BITS))
+        self.chunk_radius = radius // num_chunks  # 0 or 1
+        bounds = np.linspace(0, bits, num_chunks + 1).astype(int)
+        self.chunks = []
+        for lo, hi in zip(bounds[:-1], bounds[1:]):
+            chunk_bits = np.unpackbits(hashes[:, lo // 8:(hi + 7) // 8], axis=1)
+            chunk_bits = chunk_bits[:, lo % 8:lo % 8 + hi - lo]
+            values = chunk_bits.astype(np.int64) @ (1 << np.arange(hi - lo, dtype=np.int64))
+            self.chunks.append((hi - lo, values))
+
+    def distances(self, a, b):
+        """Hamming distances between rows a[i] and b[i]"""
+        return _POPCOUNT[np.bitwise_xor(self.hashes[a], self.hashes[b])].sum(axis=1)
+
+    def pairs(self):
+        """
+        Yield (i, j) index arrays (i < j) of all pairs within radius
+
+        A pair may be yielded more than once (it can match on several chunks).
+        """
+        for width, values in self.chunks:
+            masks = [~(1 << bit) for bit in range(width)] if self.chunk_radius else [-1]
+            for mask in masks:
+                keys = values & mask
+                order = np.argsort(keys, kind='stable')
+                keys = keys[order]
+                # Equal keys form runs; pair every element with the ones
+                # `step` places further along while still in the same run
+                step = 1
+                while step < len(keys):
+                    same = np.nonzero(keys[step:] == keys[:-step])[0]
+                    if not len(same):
+                        break
+                    left, right = order[same], order[same + step]
+                    close = self.distances(left, right) <= self.radius
+                    if close.any():
+                        yield np.minimum(left, right)[close], np.maximum(left, right)[close]
+                    step += 1
+
+def find_clusters(hashes, distance=PHASH_DISTANCE):
+    """
+    Group near-duplicate images
+
+    Args:
+        hashes: list of (hash bytes, ...) or None (unreadable, never grouped)
+
+    Returns:
+        list of clusters (lists of indices into hashes), singletons included
+    """
+    parent = list(range(len(hashes)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    def union(i, j):
+        parent[find(i)] = find(j)
+
+    valid = [i for i, value in enumerate(hashes) if value is not None]
+    if valid:
+        packed = np.frombuffer(b''.join(hashes[i][0] for i in valid), np.uint8).reshape(-1, HASH_BYTES)
+        # Identical hashes (exact and trivial copies) are grouped without a search
+        unique, first, inverse = np.unique(packed, axis=0, return_index=True, return_inverse=True)
+        inverse = inverse.ravel()
+        for position, group in enumerate(inverse):
+            union(valid[position], valid[first[group]])
+        for left, right in MultiIndexHash(unique, distance).pairs():
+            for a, b in zip(left.tolist(), right.tolist()):
+                union(valid[first[a]], valid[first[b]])
+
+    clusters = {}
+    for i in range(len(hashes)):
+        clusters.setdefault(find(i), []).append(i)
+    return list(clusters.values())
+
+def _representative(cluster, paths, hashes):
+    """Largest resolution, then largest file, then first path"""
+    def rank(i):
+        value = hashes[i]
+        area = value[1] * value[2] if value else 0
+        return (-area, -os.path.getsize(paths[i]), paths[i])
+    return min(cluster, key=rank)
+
+def dedupe_paths(paths, keep_duplicates=False, cache_path=CACHE_PATH, workers=None,
+                 distance=PHASH_DISTANCE):
+    """
+    Collapse near-duplicates before splitting
+
+    Returns:
+        kept: paths to organize (one per cluster, or all with keep_duplicates)
+        group_of: {path: representative path}, to use as the split key
+        clusters: list of [representative, duplicates...] with >1 member
+    """
+    hashes = compute_hashes(paths, cache_path, workers)
+    kept, group_of, clusters = [], {}, []
+    for cluster in find_clusters(hashes, distance):
+        rep = paths[_representative(cluster, paths, hashes)]
+        members = sorted(paths[i] for i in cluster)
+        for path in members:
+            group_of[path] = rep
+        if len(members) > 1:
+            clusters.append([rep] + [path for path in members if path != rep])
+        kept.extend(members if keep_duplicates else [rep])
+    return sorted(kept), group_of, clusters
+
+def check_leakage(dataset_dir=DATASET_DIR, splits=('train', 'val'), cache_path=CACHE_PATH,
+                  workers=None, distance=PHASH_DISTANCE):
+    """
+    Near-duplicate clusters of an organized dataset
+
+    Returns:
+        report dict with all clusters and the ones spanning several splits
+    """
+    paths, where = [], []
+    for split in splits:
+        split_paths, labels, class_indices = list_image_files(os.path.join(dataset_dir, split))
+        names = {index: name for name, index in class_indices.items()}
+        paths.extend(split_paths)
+        where.extend(f'{split}/{names[label]}' for label in labels)
+
+    hashes = compute_hashes(paths, cache_path, workers)
+    clusters = [cluster for cluster in find_clusters(hashes, distance) if len(cluster) > 1]
+
+    def describe(cluster):
+        return [{'path': os.path.relpath(paths[i], dataset_dir), 'folder': where[i]} for i in cluster]
+
+    leaking = [cluster for cluster in clusters
+               if len({where[i].split('/')[0] for i in cluster}) > 1]
+    return {
+        'images': len(paths),
+        'clusters': len(clusters),
+        'duplicate_images': sum(len(cluster) - 1 for cluster in clusters),
+        'leaking_clusters': [describe(cluster) for cluster in leaking],
+        'all_clusters': [describe(cluster) for cluster in clusters],
+        'distance': distance,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='Find near-duplicate images')
+    parser.add_argument('--source', help='Report near-duplicate clusters in a folder of images')
+    parser.add_argument('--check', action='store_true',
+                        help='Report clusters spanning train and val in --dataset')
+    parser.add_argument('--dataset', default=DATASET_DIR)
+    parser.add_argument('--distance', type=int, default=PHASH_DISTANCE,
+                        help=f'Max differing pHash bits (of {HASH_SIZE ** 2})')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--output', default=None,
+                        help='Leakage report (default: <dataset>/.dedupe/leakage_report.json)')
+    args = parser.parse_args()
+    if not args.source and not args.check:
+        parser.error('pass --source DIR or --check')
+
+    cache_path = os.path.join(args.dataset, '.dedupe', 'hash_cache.json')
+    if args.source:
+        from file_organizer import find_images
+        paths = find_images(args.source)
+        print(f" Hashing {len(paths)} images from {args.source}...")
+        kept, _, clusters = dedupe_paths(paths, cache_path=cache_path, workers=args.workers,
+                                         distance=args.distance)
+        print(f"   - {len(clusters)} near-duplicate clusters, "
+              f"{len(paths) - len(kept)} duplicates would be dropped")
+        for cluster in clusters[:10]:
+            print(f"     {cluster[0]} <- {', '.join(os.path.basename(p) for p in cluster[1:])}")
+
+    if args.check:
+        print(f" Checking {args.dataset} for train/val leakage...")
+        report = check_leakage(args.dataset, cache_path=cache_path, workers=args.workers,
+                               distance=args.distance)
+        output = args.output or os.path.join(args.dataset, '.dedupe', 'leakage_report.json')
+        os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+        with open(output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"   - {report['clusters']} clusters ({report['duplicate_images']} duplicate images)")
+        if report['leaking_clusters']:
+            print(f"❌ {len(report['leaking_clusters'])} cluster(s) span several splits:")
+            for cluster in report['leaking_clusters'][:10]:
+                print(f"     {', '.join(member['path'] for member in cluster)}")
+        else:
+            print("✅ No near-duplicates shared between splits")
+        print(f" Report saved: {output}")
+
+if __name__ == '__main__':
+    main()
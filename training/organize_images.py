@@ -1,54 +1,107 @@
 """
 Organize extracted non-receipt images into dataset structure
+
+Files are hardlinked/reflinked when possible (copied otherwise), and
+re-runs only touch new or changed images. Near-duplicates are dropped
+(near_duplicates.py) before the split.
+
+Usage:
+    python organize_images.py --source ~/Downloads/extracted_images/images
 """
 
 import os
-import shutil
-import random
+import argparse
 from pathlib import Path
 
+from file_organizer import (
+    MAX_WORKERS, LINK_MODES, find_images, stable_split, path_id,
+    organize_files, format_stats
+)
+from dataset_manifest import update_manifest
+from near_duplicates import dedupe_paths
+
 # Paths
-EXTRACTED_DIR = r'C:\Users\FerraaSara\Downloads\extracted_images\images'
-TRAIN_DIR = r'../dataset/train/not_receipt'
-VAL_DIR = r'../dataset/val/not_receipt'
-
-# Create directories
-os.makedirs(TRAIN_DIR, exist_ok=True)
-os.makedirs(VAL_DIR, exist_ok=True)
-
-# Get all images
-all_images = list(Path(EXTRACTED_DIR).glob('**/*.jpg')) + \
-             list(Path(EXTRACTED_DIR).glob('**/*.jpeg')) + \
-             list(Path(EXTRACTED_DIR).glob('**/*.png'))
-
-print(f"Found {len(all_images)} images")
-
-# Shuffle
-random.seed(42)
-random.shuffle(all_images)
-
-# Split 80/20
-split_idx = int(len(all_images) * 0.8)
-train_images = all_images[:split_idx]
-val_images = all_images[split_idx:]
-
-# Copy to dataset
-print(f"Copying {len(train_images)} images to train...")
-for i, img_path in enumerate(train_images):
-    if i >= 778:  # Match number of receipt images
-        break
-    dest = os.path.join(TRAIN_DIR, f'img_{i:04d}{img_path.suffix}')
-    shutil.copy(img_path, dest)
-    if (i + 1) % 100 == 0:
-        print(f"  Copied {i + 1}/{min(778, len(train_images))}")
-
-print(f"Copying {len(val_images)} images to val...")
-for i, img_path in enumerate(val_images):
-    if i >= 195:  # Match number of receipt images
-        break
-    dest = os.path.join(VAL_DIR, f'img_{i:04d}{img_path.suffix}')
-    shutil.copy(img_path, dest)
-
-print("\n✅ Dataset organized!")
-print(f"  Train not_receipt: {len(os.listdir(TRAIN_DIR))}")
-print(f"  Val not_receipt: {len(os.listdir(VAL_DIR))}")
+DATASET_DIR = '../dataset'
+TRAIN_DIR = os.path.join(DATASET_DIR, 'train', 'not_receipt')
+VAL_DIR = os.path.join(DATASET_DIR, 'val', 'not_receipt')
+STATE_PATH = os.path.join(DATASET_DIR, '.organize', 'not_receipt.json')
+DEDUPE_CACHE_PATH = os.path.join(DATASET_DIR, '.dedupe', 'hash_cache.json')
+
+# Configuration
+TRAIN_SPLIT = 0.8
+RANDOM_SEED = 42
+
+def count_receipts(split):
+    """Number of receipt images in a split (used as the default cap)"""
+    receipt_dir = os.path.join(DATASET_DIR, split, 'receipt')
+    return len(find_images(receipt_dir)) if os.path.isdir(receipt_dir) else None
+
+def parse_args():
+    """Parse command line options"""
+    parser = argparse.ArgumentParser(description='Organize non-receipt images into the dataset')
+    parser.add_argument('--source', required=True,
+                        help='Directory with extracted non-receipt images (searched recursively)')
+    parser.add_argument('--train-dir', default=TRAIN_DIR)
+    parser.add_argument('--val-dir', default=VAL_DIR)
+    parser.add_argument('--max-train', type=int, default=None,
+                        help='Cap on train images (default: number of train receipts)')
+    parser.add_argument('--max-val', type=int, default=None,
+                        help='Cap on val images (default: number of val receipts)')
+    parser.add_argument('--no-cap', action='store_true', help='Use every source image')
+    parser.add_argument('--mode', default='auto',
+                        choices=('auto',) + LINK_MODES)
+    parser.add_argument('--workers', type=int, default=MAX_WORKERS)
+    parser.add_argument('--state', default=STATE_PATH)
+    parser.add_argument('--keep-duplicates', action='store_true',
+                        help='Keep near-duplicates (still placed in the same split)')
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+
+    # Get all images
+    all_images = find_images(args.source)
+    print(f"Found {len(all_images)} images")
+
+    images, group_of, clusters = dedupe_paths(all_images, args.keep_duplicates, DEDUPE_CACHE_PATH)
+    print(f"  {len(clusters)} near-duplicate clusters, {len(all_images) - len(images)} duplicates dropped")
+
+    # Stable 80/20 split keyed by the cluster's representative (path
+    # relative to the source), so near-duplicates share a split
+    train_images, val_images = stable_split(
+        images, TRAIN_SPLIT, RANDOM_SEED,
+        key=lambda p: os.path.relpath(group_of[p], args.source)
+    )
+
+    # Match number of receipt images unless told otherwise
+    max_train, max_val = args.max_train, args.max_val
+    if not args.no_cap:
+        max_train = max_train if max_train is not None else count_receipts('train')
+        max_val = max_val if max_val is not None else count_receipts('val')
+    train_images = train_images[:max_train] if max_train is not None else train_images
+    val_images = val_images[:max_val] if max_val is not None else val_images
+
+    def destination(img_path, dest_dir):
+        # Name derived from the source path, so it is stable across runs
+        rel = os.path.relpath(img_path, args.source)
+        suffix = Path(img_path).suffix.lower()
+        return os.path.join(dest_dir, f'img_{path_id(rel)}{suffix}')
+
+    pairs = [(p, destination(p, args.train_dir)) for p in train_images]
+    pairs += [(p, destination(p, args.val_dir)) for p in val_images]
+
+    print(f"Placing {len(train_images)} train / {len(val_images)} val images...")
+    stats = organize_files(pairs, args.state, mode=args.mode, max_workers=args.workers)
+    print(f"  {format_stats(stats)}")
+
+    # Keep the manifest the training scripts read in sync
+    dataset_dir = os.path.dirname(os.path.dirname(os.path.abspath(args.train_dir)))
+    stats = update_manifest(dataset_dir)
+    print(f"  Manifest: {stats['added']} added, {stats['removed']} removed")
+
+    print("\n✅ Dataset organized!")
+    print(f"  Train not_receipt: {len(os.listdir(args.train_dir))}")
+    print(f"  Val not_receipt: {len(os.listdir(args.val_dir))}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,236 @@
+"""
+Pre-resized packed dataset cache
+Stores each split once as a uint8 memory-mapped .npy at IMG_SIZE
+
+Layout (one directory per split and image size):
+    ../dataset/packed/train_224/images.npy  (N, IMG_SIZE, IMG_SIZE, 3) uint8
+    ../dataset/packed/train_224/labels.npy  (N,) float32
+    ../dataset/packed/train_224/meta.json   fingerprint + class indices
+
+Training reads images.npy with mmap, so JPEG decoding and resizing happen
+once at pack time instead of every epoch. The store is rebuilt whenever the
+source files (paths, sizes, mtimes) or IMG_SIZE change. Rebuilds hold a
+'<store>.lock' file lock, and under multi-worker training only the chief
+packs (see pack_before_training).
+"""
+
+import os
+import json
+import shutil
+import hashlib
+import tempfile
+import contextlib
+import numpy as np
+import tensorflow as tf
+
+from input_pipeline import (
+    IMG_SIZE, BATCH_SIZE, RANDOM_SEED,
+    list_image_files, decode_and_resize, shard_dataset, finalize_batches
+)
+from distributed import barrier, is_chief
+
+PACKED_DIRNAME = 'packed'
+PACK_FORMAT_VERSION = 1
+
+def packed_split_dir(split_dir, img_size=IMG_SIZE, packed_dir=None):
+    """
+    Location of the packed store for a split directory
+
+    Defaults to a 'packed' folder next to the split (e.g. ../dataset/packed),
+    outside the class folders so flow_from_directory never sees it.
+    """
+    split_dir = os.path.normpath(split_dir)
+    if packed_dir is None:
+        packed_dir = os.path.join(os.path.dirname(split_dir), PACKED_DIRNAME)
+    return os.path.join(packed_dir, f'{os.path.basename(split_dir)}_{img_size}')
+
+def compute_fingerprint(paths, labels, img_size):
+    """Hash of the file list, sizes, mtimes, labels and target size"""
+    digest = hashlib.sha256()
+    digest.update(f'v{PACK_FORMAT_VERSION}:{img_size}\n'.encode())
+    for path, label in zip(paths, labels):
+        stat = os.stat(path)
+        digest.update(f'{path}\0{label}\0{stat.st_size}\0{stat.st_mtime_ns}\n'.encode())
+    return digest.hexdigest()
+
+def read_meta(store_dir):
+    """Load meta.json of a packed store, or None if missing/corrupt"""
+    try:
+        with open(os.path.join(store_dir, 'meta.json')) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def pack_split(split_dir, img_size=IMG_SIZE, packed_dir=None, force=False):
+    """
+    Decode, resize and write one split to a memory-mapped .npy store
+
+    Skips the work if an up-to-date store already exists.
+
+    Returns:
+        Path of the store directory
+    """
+    store_dir = packed_split_dir(split_dir, img_size, packed_dir)
+    paths, labels, class_indices = list_image_files(split_dir)
+    fingerprint = compute_fingerprint(paths, labels, img_size)
+
+    meta = read_meta(store_dir)
+    if not force and meta and meta.get('fingerprint') == fingerprint:
+        print(f"   - {store_dir}: up to date ({meta['samples']} images)")
+        return store_dir
+
+    with pack_lock(store_dir):
+        # Another process may have packed it while we waited for the lock
+        meta = read_meta(store_dir)
+        if not force and meta and meta.get('fingerprint') == fingerprint:
+            print(f"   - {store_dir}: up to date ({meta['samples']} images)")
+            return store_dir
+
+        print(f"   - Packing {len(paths)} images from {split_dir} -> {store_dir}")
+
+        # Write into a temp directory of our own and swap in at the end, so an
+        # interrupted run never leaves a half-written store that looks valid
+        tmp_dir = tempfile.mkdtemp(prefix=os.path.basename(store_dir) + '.',
+                                   dir=os.path.dirname(store_dir))
+        try:
+            write_store(tmp_dir, split_dir, paths, labels, class_indices, fingerprint, img_size)
+            shutil.rmtree(store_dir, ignore_errors=True)
+            os.replace(tmp_dir, store_dir)
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+    return store_dir
+
+@contextlib.contextmanager
+def pack_lock(store_dir):
+    """
+    Exclusive lock on a store while it is rebuilt
+
+    Uses a '<store>.lock' file next to the store; a no-op on platforms
+    without fcntl (Windows).
+    """
+    try:
+        import fcntl
+    except ImportError:
+        yield
+        return
+    os.makedirs(os.path.dirname(store_dir), exist_ok=True)
+    with open(store_dir + '.lock', 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def write_store(out_dir, split_dir, paths, labels, class_indices, fingerprint, img_size):
+    """Decode and resize `paths` into images.npy, labels.npy and meta.json"""
+    images = np.lib.format.open_memmap(
+        os.path.join(out_dir, 'images.npy'), mode='w+',
+        dtype=np.uint8, shape=(len(paths), img_size, img_size, 3)
+    )
+
+    # Parallel decode/resize, written back in order
+    ds = tf.data.Dataset.from_tensor_slices((paths, labels))
+    ds = ds.map(lambda p, l: decode_and_resize(p, l, img_size),
+                num_parallel_calls=tf.data.AUTOTUNE)
+    ds = ds.batch(256).prefetch(tf.data.AUTOTUNE)
+
+    offset = 0
+    for batch, _ in ds:
+        batch = batch.numpy()
+        images[offset:offset + len(batch)] = batch
+        offset += len(batch)
+    images.flush()
+    del images
+
+    np.save(os.path.join(out_dir, 'labels.npy'), np.asarray(labels, dtype=np.float32))
+
+    with open(os.path.join(out_dir, 'meta.json'), 'w') as f:
+        json.dump({
+            'version': PACK_FORMAT_VERSION,
+            'fingerprint': fingerprint,
+            'img_size': img_size,
+            'samples': len(paths),
+            'class_indices': class_indices,
+            'source': os.path.abspath(split_dir),
+        }, f, indent=2)
+
+def load_packed_split(split_dir, img_size=IMG_SIZE, packed_dir=None):
+    """
+    Open a packed split with mmap, (re)building it first if it is stale
+
+    Returns:
+        (images, labels, meta) where images is a read-only np.memmap
+    """
+    store_dir = pack_split(split_dir, img_size, packed_dir)
+    images = np.load(os.path.join(store_dir, 'images.npy'), mmap_mode='r')
+    labels = np.load(os.path.join(store_dir, 'labels.npy'))
+    return images, labels, read_meta(store_dir)
+
+def create_packed_dataset(split_dir, batch_size=BATCH_SIZE, img_size=IMG_SIZE,
+                          training=False, shuffle=None, packed_dir=None,
+                          shard=None, repeat=False, seed=RANDOM_SEED):
+    """
+    tf.data pipeline over a packed split
+
+    Only shuffled indices flow through tf.data; each batch is gathered
+    straight from the memory-mapped array, so nothing is decoded and the
+    full split is never loaded into memory.
+
+    Returns:
+        (dataset, info) like input_pipeline.create_dataset
+        (`shard`, `repeat` and `seed` work the same way too)
+    """
+    if shuffle is None:
+        shuffle = training
+
+    images, labels, meta = load_packed_split(split_dir, img_size, packed_dir)
+    num_samples = len(labels)
+
+    def gather(indices):
+        # Sorted indices keep mmap reads sequential within a batch
+        indices = np.sort(indices)
+        return np.asarray(images[indices]), labels[indices]
+
+    ds = tf.data.Dataset.range(num_samples)
+    if shard:
+        ds = shard_dataset(ds, *shard)
+    if shuffle:
+        ds = ds.shuffle(num_samples, seed=seed, reshuffle_each_iteration=True)
+    if repeat:
+        ds = ds.repeat()
+    ds = ds.batch(batch_size)
+    ds = ds.map(
+        lambda idx: tf.numpy_function(gather, [idx], (tf.uint8, tf.float32)),
+        num_parallel_calls=tf.data.AUTOTUNE,
+        deterministic=not training
+    )
+    ds = ds.map(lambda x, y: (
+        tf.ensure_shape(x, (None, img_size, img_size, 3)),
+        tf.ensure_shape(y, (None,))
+    ))
+    ds = finalize_batches(ds, training, seed)
+
+    info = {'samples': num_samples, 'class_indices': meta['class_indices']}
+    return ds, info
+
+def pack_dataset(dataset_dir='../dataset', img_size=IMG_SIZE, packed_dir=None):
+    """Pack the train and val splits of a dataset directory"""
+    print(f"\n📦 Packing dataset at {img_size}x{img_size}...")
+    for split in ('train', 'val'):
+        split_dir = os.path.join(dataset_dir, split)
+        if os.path.isdir(split_dir):
+            pack_split(split_dir, img_size, packed_dir)
+    print("✅ Packed dataset ready")
+
+def pack_before_training(split_dirs, strategy, img_size=IMG_SIZE, packed_dir=None):
+    """
+    Bring the packed stores of `split_dirs` up to date before training
+
+    Under multi-worker training only the chief packs; the other workers wait
+    at a barrier and then find the stores up to date (with shared storage)
+    instead of all rebuilding the same store at once.
+    """
+    if is_chief():
+        for split_dir in split_dirs:
+            pack_split(split_dir, img_size, packed_dir)
+    barrier(strategy)
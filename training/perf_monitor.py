@@ -0,0 +1,248 @@
+"""
+Training performance instrumentation: input stall vs compute
+
+Keras fetches each batch inside the compiled train step, so a slow epoch
+looks the same whether the loader or the model is the bottleneck. This
+module separates the two:
+
+- TimedInput appends an in-graph timestamp stage to the training input
+  (tf.data, packed store, cached features or ImageDataGenerator), so the
+  time each step waits for its batch is measured without taking batches
+  through Python or removing the loader's prefetch
+- PerfMonitor is a callback recording per-step wall time, input wait,
+  images/sec and process RSS, and optionally captures a TensorBoard
+  profiler trace for a range of global steps
+- PerfReport collects per-epoch summaries of every phase into
+  training_perf.json (with the per-step times) and training_perf.csv
+
+Single-process only: the training scripts reject --perf for multi-worker
+runs.
+"""
+
+import os
+import csv
+import json
+import time
+import numpy as np
+import tensorflow as tf
+
+from benchmark_tflite import peak_rss_mb
+
+PERF_REPORT_PATH = '../models/training_perf.json'
+PROFILE_DIR = '../models/profile'
+
+def current_rss_mb():
+    """Current resident set size of this process in MB (Linux only)"""
+    try:
+        with open('/proc/self/statm') as f:
+            pages = int(f.read().split()[1])
+    except (OSError, ValueError, IndexError):
+        return None
+    return pages * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+
+def _round(value, digits=1):
+    return None if value is None else round(value, digits)
+
+def parse_step_range(value):
+    """'START:STOP' -> (start, stop) global training steps, stop exclusive"""
+    try:
+        start, stop = (int(part) for part in value.split(':'))
+    except ValueError:
+        raise ValueError(f"expected START:STOP, got {value!r}") from None
+    if not 0 <= start < stop:
+        raise ValueError(f"empty step range {value!r}")
+    return start, stop
+
+class TimedInput:
+    """
+    Training input that records when each batch reaches the train step
+
+    A tf.data source is passed through unchanged except for a last,
+    sequential map stage that writes tf.timestamp() into a variable as the
+    train step pulls the batch. The stage runs in the tf.data runtime, so
+    batches never go through Python and the loader's prefetch keeps
+    overlapping with compute. The input wait of a step is that timestamp
+    minus the wall time at on_train_batch_begin.
+
+    A Keras Sequence (the ImageDataGenerator iterator) is turned into a
+    from_generator dataset with prefetch first, which is what fit() itself
+    does with a Sequence.
+
+    Single process only: with MultiWorkerMirroredStrategy the stamp
+    variable would be a distributed variable (the training scripts reject
+    --perf there). With steps_per_execution > 1 only the first batch of
+    each execution is timed, so the wait is a lower bound.
+
+    Args:
+        source: tf.data.Dataset or a Keras Sequence
+    """
+
+    def __init__(self, source):
+        self.source = source
+        self.ready = tf.Variable(np.inf, dtype=tf.float64, trainable=False, name='input_ready')
+
+    def _generate(self):
+        for i in range(len(self.source)):
+            yield self.source[i]
+        if hasattr(self.source, 'on_epoch_end'):
+            self.source.on_epoch_end()
+
+    def _stamp(self, *batch):
+        # Earliest batch of the current execution (reset in reset())
+        with tf.control_dependencies([self.ready.assign(tf.minimum(self.ready, tf.timestamp()))]):
+            batch = tuple(tf.identity(part) for part in batch)
+        return batch if len(batch) > 1 else batch[0]
+
+    def reset(self):
+        """Start timing the next step; returns its wall-clock start"""
+        self.ready.assign(np.inf)
+        return time.time()
+
+    def wait_since(self, start):
+        """Seconds the step started at `start` waited for its batch"""
+        ready = float(self.ready.numpy())
+        return max(0.0, ready - start) if np.isfinite(ready) else 0.0
+
+    def dataset(self):
+        """tf.data.Dataset to pass to model.fit() instead of the source"""
+        if isinstance(self.source, tf.data.Dataset):
+            ds = self.source
+        else:
+            sample = self.source[0]
+            signature = tuple(tf.TensorSpec((None,) + np.shape(part)[1:], tf.as_dtype(np.asarray(part).dtype))
+                              for part in sample)
+            ds = tf.data.Dataset.from_generator(self._generate, output_signature=signature)
+            ds = ds.apply(tf.data.experimental.assert_cardinality(len(self.source)))
+            ds = ds.prefetch(tf.data.AUTOTUNE)
+        # Sequential (no num_parallel_calls) so it runs when the step pulls the batch
+        return ds.map(self._stamp)
+
+class PerfReport:
+    """
+    Per-epoch performance summaries of all phases of one run
+
+    Rewritten after every epoch, so an interrupted run keeps its numbers.
+    """
+
+    def __init__(self, path=PERF_REPORT_PATH, profile_steps=None, profile_dir=PROFILE_DIR):
+        self.path = path
+        self.csv_path = os.path.splitext(path)[0] + '.csv'
+        self.profile_steps = profile_steps
+        self.profile_dir = profile_dir
+        self.epochs = []
+        self.global_step = 0  # across phases, for profile_steps
+
+    def monitor(self, train_data, batch_size, label=''):
+        """
+        Wrap `train_data` and create its callback
+
+        Returns:
+            (dataset to train on, PerfMonitor)
+        """
+        timed = TimedInput(train_data)
+        return timed.dataset(), PerfMonitor(self, timed, batch_size, label)
+
+    def add(self, summary):
+        self.epochs.append(summary)
+        self.save()
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump({'epochs': self.epochs}, f, indent=2)
+        os.replace(tmp, self.path)
+
+        columns = [key for key in self.epochs[0] if key != 'step_times_ms']
+        with open(self.csv_path, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=columns, extrasaction='ignore')
+            writer.writeheader()
+            writer.writerows(self.epochs)
+
+class PerfMonitor(tf.keras.callbacks.Callback):
+    """Record step time, input wait, images/sec and RSS of one fit()"""
+
+    def __init__(self, report, timed_input, batch_size, label=''):
+        super().__init__()
+        self.report = report
+        self.timed_input = timed_input
+        self.batch_size = batch_size
+        self.label = label.strip()
+        self.profiling = False
+
+    def on_train_begin(self, logs=None):
+        self.traced = False
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self.step_times = []
+        self.waits = []
+        self.last_batch = -1
+        self.epoch_start = time.perf_counter()
+        self.train_end = self.epoch_start
+
+    def on_train_batch_begin(self, batch, logs=None):
+        self._maybe_profile()
+        self.wall_start = self.timed_input.reset()
+        self.step_start = time.perf_counter()
+
+    def on_train_batch_end(self, batch, logs=None):
+        now = time.perf_counter()
+        # With steps_per_execution > 1 one callback covers several steps
+        steps = batch - self.last_batch
+        self.last_batch = batch
+        # The first call traces the train function before it pulls a batch
+        wait = self.timed_input.wait_since(self.wall_start) if self.traced else 0.0
+        self.traced = True
+        for _ in range(steps):
+            self.step_times.append((now - self.step_start) / steps)
+            self.waits.append(wait / steps)
+        self.train_end = now
+        self.report.global_step += steps
+
+    def on_epoch_end(self, epoch, logs=None):
+        # Wall time of the training steps only, not validation
+        elapsed = self.train_end - self.epoch_start
+        step_times = np.array(self.step_times or [0.0])
+        waits = np.array(self.waits or [0.0])
+        total_wait = float(waits.sum())
+        summary = {
+            'phase': self.label,
+            'epoch': epoch + 1,
+            'steps': len(self.step_times),
+            'epoch_seconds': round(elapsed, 3),
+            'step_ms_mean': round(float(step_times.mean()) * 1000, 2),
+            'step_ms_p50': round(float(np.percentile(step_times, 50)) * 1000, 2),
+            'step_ms_p90': round(float(np.percentile(step_times, 90)) * 1000, 2),
+            'input_wait_ms_mean': round(float(waits.mean()) * 1000, 2),
+            'compute_ms_mean': round(float((step_times - waits).mean()) * 1000, 2),
+            'input_stall_pct': round(100 * total_wait / elapsed, 1) if elapsed > 0 else 0.0,
+            'images_per_sec': round(len(self.step_times) * self.batch_size / elapsed, 1) if elapsed > 0 else 0.0,
+            'rss_mb': _round(current_rss_mb()),
+            'peak_rss_mb': _round(peak_rss_mb()),
+            'step_times_ms': [round(t * 1000, 2) for t in self.step_times],
+        }
+        self.report.add(summary)
+        print(f"   - {self.label} epoch {epoch + 1}: step {summary['step_ms_mean']:.0f}ms "
+              f"(input wait {summary['input_wait_ms_mean']:.0f}ms, {summary['input_stall_pct']:.0f}% stalled), "
+              f"{summary['images_per_sec']:.1f} images/sec, RSS {summary['rss_mb'] or 0:.0f}MB")
+
+    def on_train_end(self, logs=None):
+        if self.profiling:
+            self._stop_profile()
+
+    def _maybe_profile(self):
+        if not self.report.profile_steps:
+            return
+        start, stop = self.report.profile_steps
+        step = self.report.global_step
+        if not self.profiling and start <= step < stop:
+            os.makedirs(self.report.profile_dir, exist_ok=True)
+            tf.profiler.experimental.start(self.report.profile_dir)
+            self.profiling = True
+        elif self.profiling and step >= stop:
+            self._stop_profile()
+
+    def _stop_profile(self):
+        tf.profiler.experimental.stop()
+        self.profiling = False
+        print(f" Profiler trace saved to: {self.report.profile_dir} (open with TensorBoard)")
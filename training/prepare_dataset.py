@@ -4,21 +4,28 @@ Organizes SROIE2019 receipts and downloads non-receipt images
 """
 
 import os
-import shutil
 import random
-from pathlib import Path
-import requests
-from PIL import Image
-from io import BytesIO
+import argparse
+
+from image_downloader import download_images
+from file_organizer import LINK_MODES, find_images, stable_split, organize_files, format_stats
+from dataset_scanner import scan_dataset, print_report
+from dataset_manifest import update_manifest, manifest_path
+from near_duplicates import dedupe_paths
 
 # Paths
 SROIE_TRAIN = '../training_data/receipts/SROIE2019/train/img'
 SROIE_TEST = '../training_data/receipts/SROIE2019/test/img'
 DATASET_DIR = '../dataset'
+DOWNLOAD_MANIFEST_PATH = f'{DATASET_DIR}/.downloads/unsplash_manifest.jsonl'
+ORGANIZE_STATE_PATH = f'{DATASET_DIR}/.organize/receipts.json'
+DEDUPE_CACHE_PATH = f'{DATASET_DIR}/.dedupe/hash_cache.json'
+UNSPLASH_URL = 'https://source.unsplash.com/224x224/?{category}&sig={sig}'
 
 # Configuration
 TRAIN_SPLIT = 0.8
 RANDOM_SEED = 42
+IMG_SIZE = 224
 
 def create_directory_structure():
     """Create dataset directory structure"""
@@ -36,102 +43,118 @@ def create_directory_structure():
     
     print("✅ Directory structure created")
 
-def organize_receipt_images():
+def organize_receipt_images(mode='auto', keep_duplicates=False):
     """
     Organize SROIE receipt images into train/val splits
+    
+    Images are hardlinked/reflinked when possible (copied otherwise) and
+    re-runs only touch receipts that are new or changed. Near-duplicates
+    are reduced to one receipt per cluster (or kept together in one split
+    with keep_duplicates).
     """
     print("\n📸 Organizing receipt images...")
     
     # Get all receipt images
-    train_images = list(Path(SROIE_TRAIN).glob('*.jpg'))
-    test_images = list(Path(SROIE_TEST).glob('*.jpg'))
-    all_receipts = train_images + test_images
+    all_receipts = find_images(SROIE_TRAIN) + find_images(SROIE_TEST)
     
     print(f"   - Found {len(all_receipts)} receipt images")
     
-    # Shuffle
-    random.seed(RANDOM_SEED)
-    random.shuffle(all_receipts)
-    
-    # Split
-    split_idx = int(len(all_receipts) * TRAIN_SPLIT)
-    train_receipts = all_receipts[:split_idx]
-    val_receipts = all_receipts[split_idx:]
+    receipts, group_of, clusters = dedupe_paths(all_receipts, keep_duplicates, DEDUPE_CACHE_PATH)
+    print(f"   - {len(clusters)} near-duplicate clusters, "
+          f"{len(all_receipts) - len(receipts)} duplicates dropped")
     
-    # Copy to dataset folders
-    for img_path in train_receipts:
-        shutil.copy(img_path, f'{DATASET_DIR}/train/receipt/{img_path.name}')
+    # Stable split keyed by cluster: adding receipts never moves existing
+    # ones between splits, and near-duplicates never straddle train/val
+    train_receipts, val_receipts = stable_split(
+        receipts, TRAIN_SPLIT, RANDOM_SEED, key=lambda p: os.path.basename(group_of[p])
+    )
     
-    for img_path in val_receipts:
-        shutil.copy(img_path, f'{DATASET_DIR}/val/receipt/{img_path.name}')
+    pairs = [(p, f'{DATASET_DIR}/train/receipt/{os.path.basename(p)}') for p in train_receipts]
+    pairs += [(p, f'{DATASET_DIR}/val/receipt/{os.path.basename(p)}') for p in val_receipts]
+    stats = organize_files(pairs, ORGANIZE_STATE_PATH, mode=mode)
     
     print(f"✅ Receipt images organized:")
     print(f"   - Train: {len(train_receipts)}")
     print(f"   - Val: {len(val_receipts)}")
+    print(f"   - {format_stats(stats)}")
     
     return len(train_receipts), len(val_receipts)
 
-def download_non_receipt_images(num_train, num_val):
+def download_non_receipt_images(num_train, num_val, url_template=UNSPLASH_URL):
     """
     Download random non-receipt images from Unsplash
+    
+    Runs concurrently and resumes from DOWNLOAD_MANIFEST_PATH, so images
+    that already made it to disk are not fetched again.
     """
     print("\n🌐 Downloading non-receipt images...")
     print("   (This may take a few minutes...)")
     
     # Unsplash random image API
     categories = ['nature', 'people', 'animals', 'architecture', 'food', 'technology']
+    rng = random.Random(RANDOM_SEED)
+    
+    jobs = []
+    for split, count in (('train', num_train), ('val', num_val)):
+        for i in range(count):
+            category = rng.choice(categories)
+            # Cache-buster keeps URLs unique so the random endpoint isn't memoized
+            url = url_template.format(category=category, sig=f'{split}{i}')
+            save_path = f'{DATASET_DIR}/{split}/not_receipt/img_{i:04d}.jpg'
+            jobs.append((f'{split}-{i:04d}', url, save_path))
     
-    def download_image(save_path, category):
-        try:
-            url = f'https://source.unsplash.com/224x224/?{category}'
-            response = requests.get(url, timeout=10)
-            if response.status_code == 200:
-                img = Image.open(BytesIO(response.content))
-                img = img.convert('RGB')
-                img.save(save_path)
-                return True
-        except:
-            pass
-        return False
-    
-    # Download training images
-    print(f"   - Downloading {num_train} training images...")
-    for i in range(num_train):
-        category = random.choice(categories)
-        save_path = f'{DATASET_DIR}/train/not_receipt/img_{i:04d}.jpg'
-        if download_image(save_path, category):
-            if (i + 1) % 50 == 0:
-                print(f"     Downloaded {i + 1}/{num_train}")
-    
-    # Download validation images
-    print(f"   - Downloading {num_val} validation images...")
-    for i in range(num_val):
-        category = random.choice(categories)
-        save_path = f'{DATASET_DIR}/val/not_receipt/img_{i:04d}.jpg'
-        download_image(save_path, category)
+    print(f"   - Downloading {num_train} training and {num_val} validation images...")
+    download_images(jobs, DOWNLOAD_MANIFEST_PATH)
     
     print("✅ Non-receipt images downloaded")
 
-def verify_dataset():
-    """Verify dataset is ready"""
+def index_dataset():
+    """Sync the dataset manifest (only new or changed files are hashed)"""
+    print("\n🗂️ Updating dataset manifest...")
+    
+    stats = update_manifest(DATASET_DIR)
+    print(f"   - {stats['added']} added, {stats['changed']} changed, "
+          f"{stats['removed']} removed, {stats['unchanged']} unchanged")
+    print(f"   - Manifest: {manifest_path(DATASET_DIR)}")
+    
+    return stats
+
+def verify_dataset(quarantine=True):
+    """
+    Verify dataset is ready
+
+    Scans every image (all supported extensions) for corrupt and
+    unsupported files, moving them to dataset/.quarantine/ so packing and
+    training never see them. Unchanged files are served from the scan cache.
+    """
     print("\n🔍 Verifying dataset...")
     
+    report = scan_dataset(DATASET_DIR, quarantine=quarantine)
+    print_report(report)
+    
     counts = {
-        'train/receipt': len(list(Path(f'{DATASET_DIR}/train/receipt').glob('*.jpg'))),
-        'train/not_receipt': len(list(Path(f'{DATASET_DIR}/train/not_receipt').glob('*.jpg'))),
-        'val/receipt': len(list(Path(f'{DATASET_DIR}/val/receipt').glob('*.jpg'))),
-        'val/not_receipt': len(list(Path(f'{DATASET_DIR}/val/not_receipt').glob('*.jpg')))
+        f'{split}/{label}': report['counts'].get(os.path.join(split, label), 0)
+        for split in ('train', 'val') for label in ('receipt', 'not_receipt')
     }
-    
-    for key, count in counts.items():
-        print(f"   - {key}: {count} images")
-    
     total = sum(counts.values())
     print(f"\n✅ Dataset ready with {total} total images")
     
     return counts
 
+def parse_args():
+    """Parse command line options"""
+    parser = argparse.ArgumentParser(description='Prepare the receipt detection dataset')
+    parser.add_argument('--mode', default='auto', choices=('auto',) + LINK_MODES,
+                        help='How receipts are placed in the dataset')
+    parser.add_argument('--keep-duplicates', action='store_true',
+                        help='Keep near-duplicate receipts (still placed in the same split)')
+    parser.add_argument('--no-quarantine', action='store_true',
+                        help='Only report corrupt/unsupported images, leave them in place')
+    return parser.parse_args()
+
 def main():
+    args = parse_args()
+    
     print("=" * 60)
     print("Receipt Detection Dataset Preparation")
     print("=" * 60)
@@ -140,13 +163,19 @@ def main():
     create_directory_structure()
     
     # Organize receipts
-    num_train, num_val = organize_receipt_images()
+    num_train, num_val = organize_receipt_images(args.mode, args.keep_duplicates)
     
     # Download non-receipts
     download_non_receipt_images(num_train, num_val)
     
-    # Verify
-    verify_dataset()
+    # Index + verify (training scripts list files from the manifest)
+    index_dataset()
+    verify_dataset(quarantine=not args.no_quarantine)
+    
+    # Pack pre-resized uint8 store for fast training (the only step that
+    # needs TensorFlow, imported here so the other steps stay light)
+    from packed_dataset import pack_dataset
+    pack_dataset(DATASET_DIR, IMG_SIZE)
     
     print("\n✅ Dataset preparation complete!")
     print(f"   Dataset location: {DATASET_DIR}")
@@ -4,10 +4,18 @@ Uses the best model from Phase 1 and does quick fine-tuning
 """
 
 import os
+import argparse
 import tensorflow as tf
 from tensorflow.keras.models import load_model
 from tensorflow.keras.preprocessing.image import ImageDataGenerator
 
+from input_pipeline import create_dataset, create_dataset_from_files
+from packed_dataset import create_packed_dataset, pack_before_training
+from distributed import barrier, create_strategy, is_multi_worker, is_chief, shard_spec, steps_for, worker_path
+from tflite_export import EXPORT_MODES, convert_model, export_with_report
+from incremental import REPLAY_RATIO, load_manifest, save_manifest, select_incremental
+from perf_monitor import PERF_REPORT_PATH, PerfReport, parse_step_range
+
 # Configuration
 IMG_SIZE = 224
 BATCH_SIZE = 32
@@ -20,85 +28,214 @@ TFLITE_PATH = '../assets/tflite/receipt_detector.tflite'
 TRAIN_DIR = '../dataset/train'
 VAL_DIR = '../dataset/val'
 
-print("=" * 60)
-print("Quick Fine-tuning and TFLite Conversion")
-print("=" * 60)
-
-# Check if model exists
-if not os.path.exists(MODEL_PATH):
-    print("❌ No saved model found. Using MobileNetV2 directly...")
-    from tensorflow.keras.applications import MobileNetV2
-    from tensorflow.keras.layers import GlobalAveragePooling2D, Dense, Dropout
-    from tensorflow.keras.models import Model
-    
-    base_model = MobileNetV2(weights='imagenet', include_top=False, input_shape=(IMG_SIZE, IMG_SIZE, 3))
-    x = base_model.output
-    x = GlobalAveragePooling2D()(x)
-    x = Dense(128, activation='relu')(x)
-    x = Dropout(0.5)(x)
-    output = Dense(1, activation='sigmoid')(x)
-    model = Model(inputs=base_model.input, outputs=output)
-else:
-    print(" Loading saved model...")
-    model = load_model(MODEL_PATH)
-
-# Prepare data
-print("\n Loading data...")
-train_datagen = ImageDataGenerator(rescale=1./255)
-val_datagen = ImageDataGenerator(rescale=1./255)
-
-train_gen = train_datagen.flow_from_directory(
-    TRAIN_DIR, target_size=(IMG_SIZE, IMG_SIZE), batch_size=BATCH_SIZE, class_mode='binary'
-)
-val_gen = val_datagen.flow_from_directory(
-    VAL_DIR, target_size=(IMG_SIZE, IMG_SIZE), batch_size=BATCH_SIZE, class_mode='binary'
-)
-
-# Evaluate current performance
-print("\n Evaluating current model...")
-results = model.evaluate(val_gen, verbose=0)
-print(f"   - Validation Loss: {results[0]:.4f}")
-print(f"   - Validation Accuracy: {results[1]:.4f}")
-
-if results[1] >= 0.95:
-    print("\n Model already performing excellently (>95% accuracy)!")
-    print("   Skipping fine-tuning, proceeding to TFLite conversion...")
-else:
-    print(f"\n Fine-tuning for {EPOCHS_FINETUNE} epochs...")
-    
-    # Unfreeze and compile
-    for layer in model.layers:
-        layer.trainable = True
-    
-    model.compile(
-        optimizer=tf.keras.optimizers.Adam(learning_rate=LEARNING_RATE),
-        loss='binary_crossentropy',
-        metrics=['accuracy']
+def parse_args():
+    """Parse command line options"""
+    parser = argparse.ArgumentParser(description='Quick fine-tuning and TFLite conversion')
+    parser.add_argument(
+        '--loader', choices=['tfdata', 'packed', 'generator'], default='tfdata',
+        help='Input pipeline: parallel tf.data (default), pre-resized packed '
+             'store, or legacy ImageDataGenerator'
     )
+    parser.add_argument(
+        '--tflite-mode', choices=EXPORT_MODES, default='dynamic',
+        help='TFLite quantization: dynamic-range (default), float16, full-integer int8 or float32'
+    )
+    parser.add_argument(
+        '--export-report', action='store_true',
+        help='Compare the exported TFLite model against float32 on the val set'
+    )
+    parser.add_argument(
+        '--incremental', action='store_true',
+        help='Fine-tune only on images added since the saved model (plus a replay sample)'
+    )
+    parser.add_argument(
+        '--replay-ratio', type=float, default=REPLAY_RATIO,
+        help='Previously seen images replayed per new image with --incremental'
+    )
+    parser.add_argument(
+        '--max-regression', type=float, default=0.0,
+        help='Largest val accuracy drop at which an incremental update is still accepted'
+    )
+    parser.add_argument(
+        '--perf', action='store_true',
+        help=f'Record step time, input wait, images/sec and RSS per epoch to {PERF_REPORT_PATH}'
+    )
+    parser.add_argument(
+        '--profile-steps', type=parse_step_range, metavar='START:STOP',
+        help='Capture a TensorBoard profiler trace of these training steps (implies --perf)'
+    )
+    args = parser.parse_args()
+    if args.profile_steps:
+        args.perf = True
+    if is_multi_worker() and args.loader == 'generator':
+        parser.error('multi-worker training needs --loader tfdata or packed')
+    if is_multi_worker() and args.perf:
+        parser.error('--perf/--profile-steps are not supported with multi-worker training')
+    if args.incremental and args.loader == 'generator':
+        parser.error('--incremental needs --loader tfdata or packed')
+    return args
+
+def main():
+    """Fine-tune the saved model (or MobileNetV2) and export it to TFLite"""
+    args = parse_args()
     
-    # Quick fine-tune
-    model.fit(train_gen, epochs=EPOCHS_FINETUNE, validation_data=val_gen, verbose=1)
-    
-    # Save
-    model.save(MODEL_PATH)
-    print(f"✅ Model saved to {MODEL_PATH}")
+    # Single-process unless TF_CONFIG describes a cluster (see distributed.py)
+    strategy = create_strategy()
+    tf.distribute.experimental_set_strategy(strategy)
+
+    print("=" * 60)
+    print("Quick Fine-tuning and TFLite Conversion")
+    print("=" * 60)
+
+    # Check if model exists
+    if not os.path.exists(MODEL_PATH):
+        print("❌ No saved model found. Using MobileNetV2 directly...")
+        from tensorflow.keras.applications import MobileNetV2
+        from tensorflow.keras.layers import GlobalAveragePooling2D, Dense, Dropout
+        from tensorflow.keras.models import Model
+        
+        base_model = MobileNetV2(weights='imagenet', include_top=False, input_shape=(IMG_SIZE, IMG_SIZE, 3))
+        x = base_model.output
+        x = GlobalAveragePooling2D()(x)
+        x = Dense(128, activation='relu')(x)
+        x = Dropout(0.5)(x)
+        output = Dense(1, activation='sigmoid')(x)
+        model = Model(inputs=base_model.input, outputs=output)
+    else:
+        print(" Loading saved model...")
+        model = load_model(MODEL_PATH)
+
+    # Prepare data
+    print("\n Loading data...")
+    steps = (None, None)
+    if args.loader in ('tfdata', 'packed'):
+        # No augmentation here, same as the generators below
+        make_dataset = create_packed_dataset if args.loader == 'packed' else create_dataset
+        if args.loader == 'packed':
+            pack_before_training([TRAIN_DIR, VAL_DIR], strategy, IMG_SIZE)
+        # BATCH_SIZE is per replica; each worker reads its shard at the global batch size
+        global_batch = BATCH_SIZE * strategy.num_replicas_in_sync
+        shard = shard_spec()
+        train_gen, train_info = make_dataset(TRAIN_DIR, global_batch, IMG_SIZE, training=False,
+                                             shuffle=True, shard=shard, repeat=shard is not None)
+        val_gen, val_info = make_dataset(VAL_DIR, global_batch, IMG_SIZE, training=False,
+                                         shard=shard, repeat=shard is not None)
+        if shard:
+            steps = (steps_for(train_info['samples'], global_batch),
+                     steps_for(val_info['samples'], global_batch))
+    else:
+        train_datagen = ImageDataGenerator(rescale=1./255)
+        val_datagen = ImageDataGenerator(rescale=1./255)
+
+        train_gen = train_datagen.flow_from_directory(
+            TRAIN_DIR, target_size=(IMG_SIZE, IMG_SIZE), batch_size=BATCH_SIZE, class_mode='binary'
+        )
+        val_gen = val_datagen.flow_from_directory(
+            VAL_DIR, target_size=(IMG_SIZE, IMG_SIZE), batch_size=BATCH_SIZE, class_mode='binary'
+        )
+
+    # Evaluate current performance
+    print("\n Evaluating current model...")
+    results = model.evaluate(val_gen, steps=steps[1], verbose=0)
+    print(f"   - Validation Loss: {results[0]:.4f}")
+    print(f"   - Validation Accuracy: {results[1]:.4f}")
+
+    # Incremental mode: only images added since the saved model + replay sample
+    selection = None
+    if args.incremental:
+        selection = select_incremental(TRAIN_DIR, load_manifest(MODEL_PATH), args.replay_ratio)
+        if selection is None:
+            print("\n No training manifest matches the saved model, doing a full fine-tune")
+
+    if selection is not None and not selection['new']:
+        print("\n No new training images since the saved model")
+        print("   Skipping fine-tuning, proceeding to TFLite conversion...")
+    elif selection is None and results[1] >= 0.95:
+        print("\n Model already performing excellently (>95% accuracy)!")
+        print("   Skipping fine-tuning, proceeding to TFLite conversion...")
+        # The model is kept as is for the current training set, so later
+        # incremental runs start from here
+        if is_chief() and os.path.exists(MODEL_PATH) and load_manifest(MODEL_PATH) is None:
+            save_manifest(TRAIN_DIR, MODEL_PATH, metrics={'val_accuracy': results[1]})
+    else:
+        if selection is not None:
+            print(f"\n Incremental fine-tuning on {selection['new']} new + "
+                  f"{selection['replay']} replayed images...")
+            # Same settings as the full train pipeline above (no augmentation)
+            train_gen = create_dataset_from_files(
+                selection['paths'], selection['labels'], global_batch, IMG_SIZE,
+                training=False, shuffle=True, shard=shard, repeat=shard is not None
+            )
+            if shard:
+                steps = (steps_for(len(selection['paths']), global_batch), steps[1])
+        print(f"\n Fine-tuning for {EPOCHS_FINETUNE} epochs...")
+        
+        # Unfreeze and compile
+        for layer in model.layers:
+            layer.trainable = True
+        previous_weights = model.get_weights()
+        
+        model.compile(
+            optimizer=tf.keras.optimizers.Adam(learning_rate=LEARNING_RATE),
+            loss='binary_crossentropy',
+            metrics=['accuracy']
+        )
+        
+        callbacks = []
+        if args.perf:
+            perf = PerfReport(worker_path(PERF_REPORT_PATH), args.profile_steps)
+            batch_size = BATCH_SIZE * strategy.num_replicas_in_sync
+            train_gen, monitor = perf.monitor(train_gen, batch_size, 'Quick fine-tune')
+            callbacks.append(monitor)
+        
+        # Quick fine-tune
+        model.fit(train_gen, epochs=EPOCHS_FINETUNE, steps_per_epoch=steps[0],
+                  validation_data=val_gen, validation_steps=steps[1], callbacks=callbacks, verbose=1)
+        
+        # Accept an incremental update only if val accuracy did not regress
+        accepted = True
+        if selection is not None:
+            new_results = model.evaluate(val_gen, steps=steps[1], verbose=0)
+            print(f"   - Validation Accuracy: {results[1]:.4f} -> {new_results[1]:.4f}")
+            accepted = new_results[1] >= results[1] - args.max_regression
+            if not accepted:
+                print("❌ Validation accuracy regressed, keeping the previous model")
+                model.set_weights(previous_weights)
+        
+        if accepted:
+            # Save (non-chief workers write to a temp dir)
+            model.save(worker_path(MODEL_PATH))
+            print(f"✅ Model saved to {worker_path(MODEL_PATH)}")
+            if is_chief():
+                save_manifest(TRAIN_DIR, MODEL_PATH)
+
+    if not is_chief():
+        print("\n Worker done (the chief writes the TFLite export)")
+        barrier(strategy)
+        return
+
+    # Convert to TFLite
+    print(f"\n📱 Converting to TensorFlow Lite ({args.tflite_mode})...")
+    os.makedirs(os.path.dirname(TFLITE_PATH), exist_ok=True)
 
-# Convert to TFLite
-print("\n📱 Converting to TensorFlow Lite...")
-os.makedirs(os.path.dirname(TFLITE_PATH), exist_ok=True)
+    if args.export_report:
+        variants, _ = export_with_report(model, [args.tflite_mode], VAL_DIR)
+        tflite_model = variants[args.tflite_mode]
+    else:
+        tflite_model = convert_model(model, args.tflite_mode, VAL_DIR)
 
-converter = tf.lite.TFLiteConverter.from_keras_model(model)
-converter.optimizations = [tf.lite.Optimize.DEFAULT]
-tflite_model = converter.convert()
+    with open(TFLITE_PATH, 'wb') as f:
+        f.write(tflite_model)
 
-with open(TFLITE_PATH, 'wb') as f:
-    f.write(tflite_model)
+    size_mb = len(tflite_model) / (1024 * 1024)
+    print(f" TFLite model saved: {TFLITE_PATH}")
+    print(f"   - Size: {size_mb:.2f} MB")
+    barrier(strategy)
 
-size_mb = len(tflite_model) / (1024 * 1024)
-print(f" TFLite model saved: {TFLITE_PATH}")
-print(f"   - Size: {size_mb:.2f} MB")
+    print("\n Training complete!")
+    print(f"   - Model: {MODEL_PATH}")
+    print(f"   - TFLite: {TFLITE_PATH}")
+    print("\n Next: Integrate into Flutter app and test!")
 
-print("\n Training complete!")
-print(f"   - Model: {MODEL_PATH}")
-print(f"   - TFLite: {TFLITE_PATH}")
-print("\n Next: Integrate into Flutter app and test!")
+if __name__ == '__main__':
+    main()
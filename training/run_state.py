@@ -0,0 +1,227 @@
+"""
+Resumable, stage-cached training runs
+
+Every training configuration gets its own run directory keyed by a hash of
+everything that changes the trained weights (hyperparameters, loader, dtype
+policy, dataset files):
+
+    ../models/runs/<config hash>/
+        run.json                      config + completed stages
+        phase1/checkpoint.weights.h5  last finished epoch (weights)
+        phase1/optimizer.npz          last finished epoch (optimizer state)
+        phase1/progress.json          epoch number + history so far
+        phase1/final.weights.h5       weights when the stage completed
+        phase2/...
+
+Each stage has its own key chained from the stages it depends on, so
+changing only the TFLite mode re-runs the export without retraining, and
+an interrupted fit() resumes from its last finished epoch.
+"""
+
+import os
+import json
+import shutil
+import hashlib
+import numpy as np
+from tensorflow.keras.callbacks import Callback, History, ModelCheckpoint
+
+from input_pipeline import list_image_files
+from packed_dataset import compute_fingerprint
+
+RUNS_DIR = '../models/runs'
+RUN_FORMAT_VERSION = 1
+
+def config_hash(config):
+    """Short stable hash of a JSON-serializable config"""
+    payload = json.dumps(config, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()[:16]
+
+def dataset_fingerprint(split_dirs, img_size):
+    """Hash of the image files (paths, sizes, mtimes, labels) of several splits"""
+    digest = hashlib.sha256()
+    for split_dir in split_dirs:
+        paths, labels, _ = list_image_files(split_dir)
+        digest.update(compute_fingerprint(paths, labels, img_size).encode())
+    return digest.hexdigest()
+
+def _write_json(path, data):
+    """Write JSON atomically (temp file + rename)"""
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(data, f, indent=2, default=float)
+    os.replace(tmp, path)
+
+def _read_json(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def make_history(history):
+    """History object (like model.fit returns) from a plain dict"""
+    result = History()
+    result.history = {key: list(values) for key, values in history.items()}
+    result.epoch = list(range(len(next(iter(history.values()), []))))
+    return result
+
+class TrainingRun:
+    """
+    Run directory for one training configuration
+
+    Args:
+        config: dict of everything that affects the trained weights
+        restart: discard any saved state for this config first
+        resume: False to ignore saved stages and epoch checkpoints without
+            deleting them (every stage runs; results are still saved)
+    """
+
+    def __init__(self, config, runs_dir=RUNS_DIR, restart=False, resume=True):
+        self.config = config
+        self.key = config_hash({'version': RUN_FORMAT_VERSION, **config})
+        self.run_dir = os.path.join(runs_dir, self.key)
+        self.resume = resume
+        if restart:
+            shutil.rmtree(self.run_dir, ignore_errors=True)
+        os.makedirs(self.run_dir, exist_ok=True)
+
+        self.state = (_read_json(os.path.join(self.run_dir, 'run.json')) if resume else None) or {}
+        self.state.setdefault('config', config)
+        self.state.setdefault('stages', {})
+
+    def stage(self, name, inputs):
+        """Stage handle; `inputs` is anything that should invalidate it when changed"""
+        return Stage(self, name, config_hash(inputs))
+
+    def save(self):
+        _write_json(os.path.join(self.run_dir, 'run.json'), self.state)
+
+class Stage:
+    """One step of the pipeline (training phase, evaluation, export, ...)"""
+
+    def __init__(self, run, name, key):
+        self.run = run
+        self.name = name
+        self.key = key
+        self.dir = os.path.join(run.run_dir, name)
+
+    @property
+    def done(self):
+        """True if this stage already completed with the same inputs"""
+        record = self.run.state['stages'].get(self.name)
+        return bool(record) and record['key'] == self.key
+
+    @property
+    def outputs(self):
+        return self.run.state['stages'][self.name]['outputs']
+
+    def path(self, filename):
+        os.makedirs(self.dir, exist_ok=True)
+        return os.path.join(self.dir, filename)
+
+    def complete(self, outputs=None, model=None, history=None):
+        """
+        Record the stage as done
+
+        Args:
+            model: save its weights as the stage result (final.weights.h5)
+            history: fit() history dict to keep with the stage
+        """
+        outputs = dict(outputs or {})
+        if model is not None:
+            model.save_weights(self.path('final.weights.h5'))
+            outputs['weights'] = self.path('final.weights.h5')
+        if history is not None:
+            _write_json(self.path('history.json'), history)
+            outputs['history'] = self.path('history.json')
+
+        self.run.state['stages'][self.name] = {'key': self.key, 'outputs': outputs}
+        self.run.save()
+
+        # The per-epoch checkpoint is superseded by the final result
+        for filename in ('checkpoint.weights.h5', 'optimizer.npz', 'progress.json'):
+            if os.path.exists(os.path.join(self.dir, filename)):
+                os.remove(os.path.join(self.dir, filename))
+
+    def load_weights(self, model):
+        """Load the weights this stage produced"""
+        model.load_weights(self.outputs['weights'])
+
+    def load_history(self):
+        """History object of this stage's fit()"""
+        return make_history(_read_json(self.outputs['history']) or {})
+
+    def resume(self, model):
+        """
+        Restore weights and optimizer state from the last finished epoch
+
+        Call after model.compile(). Returns (initial_epoch, history dict),
+        (0, {}) when there is nothing to resume.
+        """
+        if not self.run.resume:
+            return 0, {}
+        progress = _read_json(os.path.join(self.dir, 'progress.json'))
+        if not progress or progress.get('key') != self.key:
+            return 0, {}
+
+        # Build the optimizer first so its slots exist to restore into
+        model.optimizer.build(model.trainable_variables)
+        model.load_weights(os.path.join(self.dir, 'checkpoint.weights.h5'))
+        with np.load(os.path.join(self.dir, 'optimizer.npz')) as saved:
+            store = {name: saved[name] for name in saved.files}
+        model.optimizer.load_own_variables(store)
+
+        print(f"   - Resuming {self.name} after epoch {progress['epoch'] + 1}")
+        return progress['epoch'] + 1, progress['history']
+
+class EpochCheckpoint(Callback):
+    """Save weights, optimizer state and history after every epoch"""
+
+    def __init__(self, stage, history=None):
+        super().__init__()
+        self.stage = stage
+        self.history = {key: list(values) for key, values in (history or {}).items()}
+
+    def on_epoch_end(self, epoch, logs=None):
+        for key, value in (logs or {}).items():
+            self.history.setdefault(key, []).append(float(value))
+
+        weights_tmp = self.stage.path('checkpoint.tmp.weights.h5')
+        self.model.save_weights(weights_tmp)
+        store = {}
+        self.model.optimizer.save_own_variables(store)
+        optimizer_tmp = self.stage.path('optimizer.tmp.npz')
+        np.savez(optimizer_tmp, **store)
+
+        os.replace(weights_tmp, self.stage.path('checkpoint.weights.h5'))
+        os.replace(optimizer_tmp, self.stage.path('optimizer.npz'))
+        # Written last: a checkpoint only counts once progress.json points at it
+        _write_json(self.stage.path('progress.json'), {
+            'key': self.stage.key, 'epoch': epoch, 'history': self.history
+        })
+
+def fit_resumable(model, stage, *args, callbacks=None, **kwargs):
+    """
+    model.fit() that resumes from and checkpoints into `stage`
+
+    The model must already be compiled. Returns a History covering all
+    epochs, including the ones finished before a restart. EarlyStopping and
+    ReduceLROnPlateau patience counters start over after a resume.
+    """
+    callbacks = list(callbacks or [])
+    if stage is None:
+        return model.fit(*args, callbacks=callbacks, **kwargs)
+
+    initial_epoch, previous = stage.resume(model)
+    for callback in callbacks:
+        # Don't let the first resumed epoch overwrite a better saved model
+        if isinstance(callback, ModelCheckpoint) and previous.get(callback.monitor):
+            values = previous[callback.monitor]
+            lower_is_better = callback.mode == 'min' or (
+                callback.mode == 'auto' and 'loss' in callback.monitor)
+            callback.best = min(values) if lower_is_better else max(values)
+
+    checkpoint = EpochCheckpoint(stage, previous)
+    model.fit(*args, callbacks=callbacks + [checkpoint],
+              initial_epoch=initial_epoch, **kwargs)
+    return make_history(checkpoint.history)
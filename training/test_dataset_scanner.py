@@ -0,0 +1,39 @@
+"""
+Checks of dataset_scanner.py's format support against tf.io.decode_image
+
+Usage:
+    python -m pytest training/test_dataset_scanner.py
+"""
+
+import pytest
+from PIL import Image
+
+from dataset_scanner import check_image
+
+def make_image(path, image_format, **options):
+    image = Image.new('RGB', (128, 128), 'red')
+    image.save(path, format=image_format, **options)
+    return str(path)
+
+def test_mpo_is_supported(tmp_path):
+    # Multi-picture JPEG as written by many phone cameras
+    path = make_image(tmp_path / 'phone.jpg', 'MPO', save_all=True,
+                      append_images=[Image.new('RGB', (128, 128), 'blue')])
+    result = check_image(path)
+    assert result['format'] == 'MPO'
+    assert result['issues'] == []
+
+def test_mpo_decodes_with_tensorflow(tmp_path):
+    tf = pytest.importorskip('tensorflow')
+    path = make_image(tmp_path / 'phone.jpg', 'MPO', save_all=True,
+                      append_images=[Image.new('RGB', (128, 128), 'blue')])
+    assert tf.io.decode_image(tf.io.read_file(path)).shape == (128, 128, 3)
+
+@pytest.mark.parametrize('image_format, name', [('TIFF', 'scan.tif'), ('PPM', 'frame.ppm')])
+def test_formats_tensorflow_cannot_decode_are_unsupported(tmp_path, image_format, name):
+    result = check_image(make_image(tmp_path / name, image_format))
+    assert 'unsupported' in result['issues']
+
+@pytest.mark.parametrize('image_format, name', [('JPEG', 'a.jpg'), ('PNG', 'a.png'), ('BMP', 'a.bmp')])
+def test_tensorflow_formats_are_supported(tmp_path, image_format, name):
+    assert check_image(make_image(tmp_path / name, image_format))['issues'] == []
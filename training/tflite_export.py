@@ -0,0 +1,227 @@
+"""
+TFLite export variants for the receipt detector
+
+Modes:
+- float32: no optimization (reference)
+- dynamic: dynamic-range quantization (Optimize.DEFAULT, previous default)
+- float16: float16 weights, float32 compute/IO
+- int8:    full-integer quantization calibrated on the validation split,
+           with uint8 (default) or int8 input/output
+
+export_with_report() converts the requested variants, evaluates each one
+with the TFLite interpreter on the validation split and writes a JSON
+report comparing size, accuracy and latency against float32.
+
+Usage (re-export a saved model without retraining):
+    python tflite_export.py --mode int8 --report
+"""
+
+import os
+import json
+import time
+import argparse
+import itertools
+import numpy as np
+import tensorflow as tf
+
+from input_pipeline import IMG_SIZE, RANDOM_SEED, create_dataset, create_dataset_from_files, list_image_files
+
+EXPORT_MODES = ('float32', 'dynamic', 'float16', 'int8')
+REPRESENTATIVE_SAMPLES = 200
+REPORT_PATH = '../models/tflite_export_report.json'
+VARIANTS_DIR = '../models/tflite'
+MODEL_PATH = '../models/receipt_detector.h5'
+TFLITE_PATH = '../assets/tflite/receipt_detector.tflite'
+VAL_DIR = '../dataset/val'
+
+def calibration_files(val_dir, num_samples=REPRESENTATIVE_SAMPLES, seed=RANDOM_SEED):
+    """
+    Seeded sample of a split with the classes interleaved
+
+    The split is listed class by class, so its first images are all
+    not_receipt. Each class is shuffled with a fixed seed and the classes
+    are taken in turn, so the sample is balanced (as far as the smaller
+    class allows) and the same on every export.
+
+    Returns:
+        (paths, labels)
+    """
+    paths, labels, _ = list_image_files(val_dir)
+    rng = np.random.default_rng(seed)
+    by_class = {}
+    for i in rng.permutation(len(paths)):
+        by_class.setdefault(labels[i], []).append(i)
+    order = [i for group in itertools.zip_longest(*by_class.values())
+             for i in group if i is not None][:num_samples]
+    return [paths[i] for i in order], [labels[i] for i in order]
+
+def representative_dataset(val_dir, num_samples=REPRESENTATIVE_SAMPLES, img_size=IMG_SIZE):
+    """Calibration data for int8: rescaled validation images from both classes, one per step"""
+    def generator():
+        paths, labels = calibration_files(val_dir, num_samples)
+        ds = create_dataset_from_files(paths, labels, batch_size=1, img_size=img_size, cache=False)
+        for images, _ in ds:
+            yield [images]
+    return generator
+
+def convert_model(model, mode='dynamic', val_dir=None, io_type='uint8', img_size=IMG_SIZE):
+    """
+    Convert a Keras model to TFLite bytes
+
+    Args:
+        mode: one of EXPORT_MODES
+        val_dir: validation split, required for 'int8' calibration
+        io_type: 'uint8', 'int8' or 'float32' input/output for 'int8' mode
+    """
+    if mode not in EXPORT_MODES:
+        raise ValueError(f"Unknown export mode '{mode}', expected one of {EXPORT_MODES}")
+
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+
+    if mode == 'dynamic':
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    elif mode == 'float16':
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.target_spec.supported_types = [tf.float16]
+    elif mode == 'int8':
+        if val_dir is None:
+            raise ValueError("int8 export needs val_dir for the representative dataset")
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.representative_dataset = representative_dataset(val_dir, img_size=img_size)
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+        if io_type != 'float32':
+            io_dtype = tf.uint8 if io_type == 'uint8' else tf.int8
+            converter.inference_input_type = io_dtype
+            converter.inference_output_type = io_dtype
+
+    return converter.convert()
+
+def quantize_input(images, detail):
+    """Map float [0, 1] images to the interpreter's input dtype"""
+    if detail['dtype'] == np.float32:
+        return images.astype(np.float32)
+    scale, zero_point = detail['quantization']
+    info = np.iinfo(detail['dtype'])
+    quantized = np.round(images / scale + zero_point)
+    return np.clip(quantized, info.min, info.max).astype(detail['dtype'])
+
+def dequantize_output(values, detail):
+    """Map interpreter output back to a float probability"""
+    if detail['dtype'] == np.float32:
+        return values.astype(np.float32)
+    scale, zero_point = detail['quantization']
+    return (values.astype(np.float32) - zero_point) * scale
+
+def evaluate_tflite(tflite_model, val_dir, img_size=IMG_SIZE, num_threads=None):
+    """
+    Accuracy and per-image latency of a TFLite model on a split
+
+    Returns:
+        dict with accuracy, class_accuracy (class name -> accuracy),
+        latency_ms_mean, latency_ms_p50 and samples
+    """
+    interpreter = tf.lite.Interpreter(model_content=tflite_model, num_threads=num_threads)
+    interpreter.allocate_tensors()
+    input_detail = interpreter.get_input_details()[0]
+    output_detail = interpreter.get_output_details()[0]
+
+    ds, info = create_dataset(val_dir, batch_size=1, img_size=img_size, cache=False)
+    class_names = {index: name for name, index in info['class_indices'].items()}
+    class_correct, class_total = {}, {}
+    correct, latencies = 0, []
+    for image, label in ds:
+        interpreter.set_tensor(input_detail['index'], quantize_input(image.numpy(), input_detail))
+        start = time.perf_counter()
+        interpreter.invoke()
+        latencies.append((time.perf_counter() - start) * 1000)
+        prob = dequantize_output(interpreter.get_tensor(output_detail['index']), output_detail)
+        label = int(label.numpy()[0])
+        hit = int((prob.ravel()[0] >= 0.5) == bool(label))
+        correct += hit
+        class_correct[label] = class_correct.get(label, 0) + hit
+        class_total[label] = class_total.get(label, 0) + 1
+
+    return {
+        'samples': len(latencies),
+        'accuracy': correct / len(latencies) if latencies else 0.0,
+        'class_accuracy': {class_names.get(label, str(label)): class_correct[label] / total
+                           for label, total in sorted(class_total.items())},
+        'latency_ms_mean': float(np.mean(latencies)) if latencies else 0.0,
+        'latency_ms_p50': float(np.percentile(latencies, 50)) if latencies else 0.0,
+    }
+
+def export_with_report(model, modes, val_dir, variants_dir=VARIANTS_DIR,
+                       report_path=REPORT_PATH, io_type='uint8', img_size=IMG_SIZE):
+    """
+    Export several variants and compare them against float32
+
+    Returns:
+        (variants, report) where variants maps mode -> TFLite bytes
+    """
+    modes = list(dict.fromkeys(['float32'] + list(modes)))  # float32 is the baseline
+    os.makedirs(variants_dir, exist_ok=True)
+
+    variants, report = {}, {'val_dir': os.path.abspath(val_dir), 'io_type': io_type, 'variants': {}}
+    for mode in modes:
+        print(f"   - Converting {mode}...")
+        tflite_model = convert_model(model, mode, val_dir, io_type, img_size)
+        path = os.path.join(variants_dir, f'receipt_detector_{mode}.tflite')
+        with open(path, 'wb') as f:
+            f.write(tflite_model)
+
+        metrics = evaluate_tflite(tflite_model, val_dir, img_size)
+        metrics.update({'path': path, 'size_bytes': len(tflite_model)})
+        variants[mode] = tflite_model
+        report['variants'][mode] = metrics
+
+    baseline = report['variants']['float32']
+    print(f"\n   {'mode':<8} {'size MB':>8} {'x smaller':>9} {'accuracy':>9} {'Δacc':>7} {'ms/img':>7}")
+    for mode, metrics in report['variants'].items():
+        metrics['size_ratio'] = baseline['size_bytes'] / metrics['size_bytes']
+        metrics['accuracy_delta'] = metrics['accuracy'] - baseline['accuracy']
+        metrics['speedup'] = (baseline['latency_ms_mean'] / metrics['latency_ms_mean']
+                              if metrics['latency_ms_mean'] else 0.0)
+        print(f"   {mode:<8} {metrics['size_bytes'] / 2**20:>8.2f} {metrics['size_ratio']:>9.2f} "
+              f"{metrics['accuracy']:>9.4f} {metrics['accuracy_delta']:>+7.4f} "
+              f"{metrics['latency_ms_mean']:>7.2f}")
+        print("     " + ", ".join(f"{name}: {acc:.4f}" for name, acc in metrics['class_accuracy'].items()))
+
+    os.makedirs(os.path.dirname(report_path) or '.', exist_ok=True)
+    with open(report_path, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f" Export report saved: {report_path}")
+
+    return variants, report
+
+def main():
+    parser = argparse.ArgumentParser(description='Convert a saved Keras model to TFLite')
+    parser.add_argument('--model', default=MODEL_PATH, help='.h5 or .keras model')
+    parser.add_argument('--mode', choices=EXPORT_MODES, default='dynamic')
+    parser.add_argument('--io-type', choices=['uint8', 'int8', 'float32'], default='uint8',
+                        help='Input/output type with --mode int8')
+    parser.add_argument('--val-dir', default=VAL_DIR, help='Calibration (int8) and report data')
+    parser.add_argument('--output', default=TFLITE_PATH)
+    parser.add_argument('--report', action='store_true',
+                        help=f'Also export float32 and compare both on the val set ({REPORT_PATH})')
+    args = parser.parse_args()
+
+    print(f" Loading {args.model}...")
+    model = tf.keras.models.load_model(args.model, compile=False)
+    img_size = model.input_shape[1]
+
+    print(f"\n Converting to TensorFlow Lite ({args.mode})...")
+    if args.report:
+        variants, _ = export_with_report(model, [args.mode], args.val_dir,
+                                         io_type=args.io_type, img_size=img_size)
+        tflite_model = variants[args.mode]
+    else:
+        tflite_model = convert_model(model, args.mode, args.val_dir, args.io_type, img_size)
+
+    os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+    with open(args.output, 'wb') as f:
+        f.write(tflite_model)
+    print(f" TFLite model saved: {args.output}")
+    print(f"   - Size: {len(tflite_model) / (1024 * 1024):.2f} MB")
+
+if __name__ == '__main__':
+    main()
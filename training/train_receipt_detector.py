@@ -7,21 +7,43 @@ Dataset: SROIE2019 + Random non-receipt images
 """
 
 import os
+import shutil
+import argparse
 import tensorflow as tf
 from tensorflow.keras.applications import MobileNetV2
 from tensorflow.keras.layers import GlobalAveragePooling2D, Dense, Dropout
-from tensorflow.keras.models import Model
+from tensorflow.keras.models import Model, load_model
 from tensorflow.keras.preprocessing.image import ImageDataGenerator
 from tensorflow.keras.callbacks import EarlyStopping, ModelCheckpoint, ReduceLROnPlateau
-import matplotlib.pyplot as plt
+
+from input_pipeline import create_dataset
+from packed_dataset import create_packed_dataset, pack_before_training
+from training_modes import (
+    enable_fast_training, compile_options, to_float32_model, ThroughputLogger
+)
+from distributed import barrier, create_strategy, is_multi_worker, is_chief, shard_spec, steps_for, worker_path
+from run_state import RUNS_DIR, TrainingRun, dataset_fingerprint, fit_resumable
+from file_organizer import file_sha256
+from incremental import save_manifest
+from tflite_export import EXPORT_MODES, convert_model, export_with_report
+from perf_monitor import PERF_REPORT_PATH, PerfReport, parse_step_range
+from pruning import PRUNE_EPOCHS, PRUNED_MODEL_PATH, REPORT_PATH as PRUNING_REPORT_PATH, prune_model, save_report
+from feature_cache import (
+    create_feature_extractor, create_head, copy_head_weights,
+    load_or_extract_features, create_feature_dataset, weights_fingerprint
+)
 
 # Configuration
 IMG_SIZE = 224
+ALPHA = 1.0  # MobileNetV2 width multiplier (0.35, 0.5, 0.75, 1.0); see model_sweep.py
 BATCH_SIZE = 32
 EPOCHS_INITIAL = 20
 EPOCHS_FINETUNE = 10
 LEARNING_RATE_INITIAL = 0.001
 LEARNING_RATE_FINETUNE = 0.0001
+DENSE_UNITS = 128
+DROPOUT = 0.5
+UNFREEZE_LAYERS = 20  # top base model layers trained in Phase 2
 
 # Paths
 DATASET_DIR = '../dataset'
@@ -29,25 +51,28 @@ TRAIN_DIR = os.path.join(DATASET_DIR, 'train')
 VAL_DIR = os.path.join(DATASET_DIR, 'val')
 MODEL_SAVE_PATH = '../models/receipt_detector.h5'
 TFLITE_SAVE_PATH = '../assets/tflite/receipt_detector.tflite'
+HISTORY_PLOT_PATH = '../models/training_history.png'
 
-def create_model():
+def create_model(dense_units=DENSE_UNITS, dropout=DROPOUT, weights='imagenet', img_size=IMG_SIZE,
+                 alpha=ALPHA):
     """
     Create MobileNetV2-based receipt detector
     
     Architecture:
     - MobileNetV2 (pre-trained on ImageNet) - Feature extraction
     - GlobalAveragePooling2D - Reduce spatial dimensions
-    - Dense(128, ReLU) - Classification layer
-    - Dropout(0.5) - Regularization
+    - Dense(DENSE_UNITS, ReLU) - Classification layer
+    - Dropout(DROPOUT) - Regularization
     - Dense(1, Sigmoid) - Binary output (receipt/not-receipt)
     """
     print("🏗️ Building model architecture...")
     
     # Load pre-trained MobileNetV2 (without top classification layer)
     base_model = MobileNetV2(
-        weights='imagenet',
+        weights=weights,
         include_top=False,
-        input_shape=(IMG_SIZE, IMG_SIZE, 3)
+        input_shape=(img_size, img_size, 3),
+        alpha=alpha
     )
     
     # Freeze base model for initial training (transfer learning)
@@ -56,9 +81,10 @@ def create_model():
     # Add custom classification head
     x = base_model.output
     x = GlobalAveragePooling2D(name='global_avg_pool')(x)
-    x = Dense(128, activation='relu', name='dense_128')(x)
-    x = Dropout(0.5, name='dropout')(x)
-    output = Dense(1, activation='sigmoid', name='output')(x)
+    x = Dense(dense_units, activation='relu', name='dense_128')(x)
+    x = Dropout(dropout, name='dropout')(x)
+    # Keep the sigmoid in float32 under mixed precision
+    output = Dense(1, activation='sigmoid', name='output', dtype='float32')(x)
     
     model = Model(inputs=base_model.input, outputs=output, name='receipt_detector')
     
@@ -68,7 +94,11 @@ def create_model():
     
     return model, base_model
 
-def create_data_generators():
+def global_batch_size():
+    """Images per training step across all replicas of the current strategy"""
+    return BATCH_SIZE * tf.distribute.get_strategy().num_replicas_in_sync
+
+def create_data_generators(loader='tfdata', shard=None):
     """
     Create data generators with augmentation
     
@@ -77,7 +107,43 @@ def create_data_generators():
     - Width/Height shift: 10% (account for cropping variations)
     - Zoom: 10% (different camera distances)
     - NO horizontal flip (receipts have orientation)
+    
+    Args:
+        loader: 'tfdata' for the parallel tf.data pipeline (default),
+                'packed' for the pre-resized mmap store (see packed_dataset.py),
+                'generator' for the legacy ImageDataGenerator
+        shard: (num_workers, index) for multi-worker training; each worker
+               reads its shard of the files, batches at the global batch
+               size and repeats so all workers run the same number of steps
+    
+    Returns:
+        (train, val, steps) where steps is (steps_per_epoch, validation_steps)
+        for sharded input and (None, None) otherwise
     """
+    if loader in ('tfdata', 'packed'):
+        print(" Creating tf.data pipelines...")
+        make_dataset = create_packed_dataset if loader == 'packed' else create_dataset
+        # BATCH_SIZE is per replica; the strategy splits each global batch
+        batch_size = global_batch_size()
+        repeat = shard is not None
+        train_ds, train_info = make_dataset(TRAIN_DIR, batch_size, IMG_SIZE, training=True,
+                                            shard=shard, repeat=repeat)
+        val_ds, val_info = make_dataset(VAL_DIR, batch_size, IMG_SIZE, training=False,
+                                        shard=shard, repeat=repeat)
+        
+        print(f" Data pipelines created")
+        print(f"   - Training samples: {train_info['samples']}")
+        print(f"   - Validation samples: {val_info['samples']}")
+        print(f"   - Classes: {train_info['class_indices']}")
+        
+        steps = (None, None)
+        if shard:
+            steps = (steps_for(train_info['samples'], batch_size),
+                     steps_for(val_info['samples'], batch_size))
+            print(f"   - Global batch: {batch_size}, steps/epoch: {steps[0]}, val steps: {steps[1]}")
+        
+        return train_ds, val_ds, steps
+    
     print(" Creating data generators...")
     
     # Training data augmentation
@@ -117,11 +183,19 @@ def create_data_generators():
     print(f"   - Validation samples: {val_generator.samples}")
     print(f"   - Classes: {train_generator.class_indices}")
     
-    return train_generator, val_generator
+    return train_generator, val_generator, (None, None)
 
-def train_initial(model, train_gen, val_gen):
+def train_initial(model, train_gen, val_gen, xla=False, steps_per_execution=1, steps=(None, None),
+                  stage=None, perf=None):
     """
     Initial training with frozen base model
+    
+    Args:
+        xla: compile with XLA (jit_compile); see training_modes.py
+        steps_per_execution: training steps per compiled call
+        steps: (steps_per_epoch, validation_steps) for repeated sharded input
+        stage: run_state.Stage to checkpoint every epoch and resume from
+        perf: perf_monitor.PerfReport to record step/input timings into
     """
     print("\n Phase 1: Initial Training (frozen base)")
     
@@ -129,11 +203,13 @@ def train_initial(model, train_gen, val_gen):
     model.compile(
         optimizer=tf.keras.optimizers.Adam(learning_rate=LEARNING_RATE_INITIAL),
         loss='binary_crossentropy',
-        metrics=['accuracy', tf.keras.metrics.Precision(), tf.keras.metrics.Recall()]
+        metrics=['accuracy', tf.keras.metrics.Precision(), tf.keras.metrics.Recall()],
+        **compile_options(xla, steps_per_execution)
     )
     
     # Callbacks
     callbacks = [
+        ThroughputLogger(global_batch_size(), label='Phase 1 '),
         EarlyStopping(
             monitor='val_loss',
             patience=5,
@@ -141,7 +217,7 @@ def train_initial(model, train_gen, val_gen):
             verbose=1
         ),
         ModelCheckpoint(
-            MODEL_SAVE_PATH,
+            worker_path(MODEL_SAVE_PATH),
             monitor='val_accuracy',
             save_best_only=True,
             verbose=1
@@ -154,19 +230,87 @@ def train_initial(model, train_gen, val_gen):
             verbose=1
         )
     ]
+    if perf:
+        train_gen, monitor = perf.monitor(train_gen, global_batch_size(), 'Phase 1')
+        callbacks.append(monitor)
     
     # Train
-    history = model.fit(
+    history = fit_resumable(
+        model, stage,
         train_gen,
         epochs=EPOCHS_INITIAL,
+        steps_per_epoch=steps[0],
         validation_data=val_gen,
+        validation_steps=steps[1],
         callbacks=callbacks,
         verbose=1
     )
     
     return history
 
-def fine_tune(model, base_model, train_gen, val_gen):
+def train_initial_cached(model, loader='tfdata', variants=2, xla=False, steps_per_execution=1,
+                         stage=None, perf=None):
+    """
+    Phase 1 on cached embeddings
+
+    Runs the frozen base once per image (plus `variants` augmented copies of
+    the training set), caches the pooled features on disk and trains only
+    the Dense/Dropout/Dense head on them. The trained head weights are then
+    copied into `model`, so fine_tune continues from them as usual.
+    """
+    print("\n Phase 1: Initial Training (cached features)")
+    
+    make_dataset = create_packed_dataset if loader == 'packed' else create_dataset
+    feature_model = create_feature_extractor(model)
+    weights_hash = weights_fingerprint(feature_model)
+    
+    train_x, train_y = load_or_extract_features(
+        feature_model, TRAIN_DIR, make_dataset, IMG_SIZE, BATCH_SIZE,
+        variants=variants, weights_hash=weights_hash
+    )
+    val_x, val_y = load_or_extract_features(
+        feature_model, VAL_DIR, make_dataset, IMG_SIZE, BATCH_SIZE,
+        weights_hash=weights_hash
+    )
+    print(f"   - Train features: {train_x.shape}, Val features: {val_x.shape}")
+    
+    head = create_head(train_x.shape[1], DENSE_UNITS, DROPOUT)
+    head.compile(
+        optimizer=tf.keras.optimizers.Adam(learning_rate=LEARNING_RATE_INITIAL),
+        loss='binary_crossentropy',
+        metrics=['accuracy', tf.keras.metrics.Precision(), tf.keras.metrics.Recall()],
+        **compile_options(xla, steps_per_execution)
+    )
+    
+    train_features = create_feature_dataset(train_x, train_y, BATCH_SIZE, shuffle=True)
+    callbacks = [
+        ThroughputLogger(BATCH_SIZE, samples=len(train_y), label='Phase 1 (cached) '),
+        EarlyStopping(monitor='val_loss', patience=5, restore_best_weights=True, verbose=1),
+        ReduceLROnPlateau(monitor='val_loss', factor=0.5, patience=3, min_lr=1e-7, verbose=1)
+    ]
+    if perf:
+        train_features, monitor = perf.monitor(train_features, BATCH_SIZE, 'Phase 1 (cached)')
+        callbacks.append(monitor)
+    
+    history = fit_resumable(
+        head, stage,
+        train_features,
+        epochs=EPOCHS_INITIAL,
+        validation_data=create_feature_dataset(val_x, val_y, BATCH_SIZE),
+        callbacks=callbacks,
+        verbose=1
+    )
+    
+    # Move the trained head into the full model and save it
+    copy_head_weights(head, model)
+    os.makedirs(os.path.dirname(MODEL_SAVE_PATH), exist_ok=True)
+    model.save(MODEL_SAVE_PATH)
+    print(f" Model with trained head saved: {MODEL_SAVE_PATH}")
+    
+    return history
+
+def fine_tune(model, base_model, train_gen, val_gen, xla=False, steps_per_execution=1, steps=(None, None),
+              stage=None, perf=None):
     """
     Fine-tuning: Unfreeze top layers and train with lower learning rate
     """
@@ -175,8 +319,8 @@ def fine_tune(model, base_model, train_gen, val_gen):
     # Unfreeze base model
     base_model.trainable = True
     
-    # Freeze all layers except the last 20
-    for layer in base_model.layers[:-20]:
+    # Freeze all layers except the last UNFREEZE_LAYERS
+    for layer in base_model.layers[:-UNFREEZE_LAYERS]:
         layer.trainable = False
     
     print(f"   - Trainable parameters: {sum([tf.keras.backend.count_params(w) for w in model.trainable_weights]):,}")
@@ -185,42 +329,66 @@ def fine_tune(model, base_model, train_gen, val_gen):
     model.compile(
         optimizer=tf.keras.optimizers.Adam(learning_rate=LEARNING_RATE_FINETUNE),
         loss='binary_crossentropy',
-        metrics=['accuracy', tf.keras.metrics.Precision(), tf.keras.metrics.Recall()]
+        metrics=['accuracy', tf.keras.metrics.Precision(), tf.keras.metrics.Recall()],
+        **compile_options(xla, steps_per_execution)
     )
     
+    callbacks = [
+        ThroughputLogger(global_batch_size(), label='Phase 2 '),
+        EarlyStopping(monitor='val_loss', patience=3, restore_best_weights=True),
+        ModelCheckpoint(worker_path(MODEL_SAVE_PATH), monitor='val_accuracy', save_best_only=True)
+    ]
+    if perf:
+        train_gen, monitor = perf.monitor(train_gen, global_batch_size(), 'Phase 2')
+        callbacks.append(monitor)
+    
     # Fine-tune
-    history_fine = model.fit(
+    history_fine = fit_resumable(
+        model, stage,
         train_gen,
         epochs=EPOCHS_FINETUNE,
+        steps_per_epoch=steps[0],
         validation_data=val_gen,
-        callbacks=[
-            EarlyStopping(monitor='val_loss', patience=3, restore_best_weights=True),
-            ModelCheckpoint(MODEL_SAVE_PATH, monitor='val_accuracy', save_best_only=True)
-        ],
+        validation_steps=steps[1],
+        callbacks=callbacks,
         verbose=1
     )
     
     return history_fine
 
-def convert_to_tflite(model):
+def convert_to_tflite(model, mode='dynamic', report=False, path=None):
     """
     Convert Keras model to TensorFlow Lite for mobile deployment
+    
+    Args:
+        mode: 'dynamic' (dynamic-range, default), 'float16', 'int8'
+              (full-integer, uint8 I/O, calibrated on the val split) or 'float32'
+        report: also export float32 and write a size/accuracy/latency
+                comparison to models/tflite_export_report.json
+        path: where to write the .tflite file (default TFLITE_SAVE_PATH)
     """
-    print("\n Converting to TensorFlow Lite...")
+    print(f"\n Converting to TensorFlow Lite ({mode})...")
+    path = path or TFLITE_SAVE_PATH
+    
+    # Export float32 weights/compute even after mixed-precision training
+    model = to_float32_model(model)
+    img_size = model.input_shape[1]  # e.g. a smaller distilled student
     
     # Convert
-    converter = tf.lite.TFLiteConverter.from_keras_model(model)
-    converter.optimizations = [tf.lite.Optimize.DEFAULT]  # Optimize for size and speed
-    tflite_model = converter.convert()
+    if report:
+        variants, _ = export_with_report(model, [mode], VAL_DIR, img_size=img_size)
+        tflite_model = variants[mode]
+    else:
+        tflite_model = convert_model(model, mode, VAL_DIR, img_size=img_size)
     
     # Save
-    os.makedirs(os.path.dirname(TFLITE_SAVE_PATH), exist_ok=True)
-    with open(TFLITE_SAVE_PATH, 'wb') as f:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
         f.write(tflite_model)
     
     # Get size
     size_mb = len(tflite_model) / (1024 * 1024)
-    print(f" TFLite model saved: {TFLITE_SAVE_PATH}")
+    print(f" TFLite model saved: {path}")
     print(f"   - Size: {size_mb:.2f} MB")
     
     return tflite_model
@@ -229,6 +397,9 @@ def plot_training_history(history, history_fine=None):
     """
     Plot training metrics
     """
+    # Imported here: only needed once training is done
+    import matplotlib.pyplot as plt
+    
     plt.figure(figsize=(12, 4))
     
     # Accuracy
@@ -264,46 +435,254 @@ def plot_training_history(history, history_fine=None):
     plt.grid(True)
     
     plt.tight_layout()
-    plt.savefig('../models/training_history.png')
-    print(" Training history saved to: ../models/training_history.png")
+    plt.savefig(HISTORY_PLOT_PATH)
+    print(f" Training history saved to: {HISTORY_PLOT_PATH}")
+
+def parse_args():
+    """Parse command line options"""
+    parser = argparse.ArgumentParser(description='Train the receipt detector')
+    parser.add_argument(
+        '--loader', choices=['tfdata', 'packed', 'generator'], default='tfdata',
+        help='Input pipeline: parallel tf.data (default), pre-resized packed '
+             'store, or legacy ImageDataGenerator'
+    )
+    parser.add_argument(
+        '--cached-features', action='store_true',
+        help='Phase 1: train the head on cached MobileNetV2 embeddings'
+    )
+    parser.add_argument(
+        '--feature-variants', type=int, default=2,
+        help='Augmented copies of the training set to embed with --cached-features'
+    )
+    parser.add_argument(
+        '--tflite-mode', choices=EXPORT_MODES, default='dynamic',
+        help='TFLite quantization: dynamic-range (default), float16, full-integer int8 or float32'
+    )
+    parser.add_argument(
+        '--export-report', action='store_true',
+        help='Compare the exported TFLite model against float32 on the val set'
+    )
+    parser.add_argument(
+        '--fast', action='store_true',
+        help='Shorthand for --xla --mixed-precision'
+    )
+    parser.add_argument(
+        '--xla', action='store_true',
+        help='Compile the train step with XLA (jit_compile)'
+    )
+    parser.add_argument(
+        '--mixed-precision', action='store_true',
+        help='bfloat16 mixed precision when the CPU supports it (sigmoid stays float32)'
+    )
+    parser.add_argument(
+        '--steps-per-execution', type=int, default=1,
+        help='Training steps per compiled call'
+    )
+    parser.add_argument(
+        '--restart', action='store_true',
+        help='Ignore saved stages and checkpoints for this configuration'
+    )
+    parser.add_argument(
+        '--perf', action='store_true',
+        help=f'Record step time, input wait, images/sec and RSS per epoch to {PERF_REPORT_PATH}'
+    )
+    parser.add_argument(
+        '--profile-steps', type=parse_step_range, metavar='START:STOP',
+        help='Capture a TensorBoard profiler trace of these global training steps (implies --perf)'
+    )
+    parser.add_argument(
+        '--prune', type=float, metavar='SPARSITY',
+        help='After Phase 2, remove this fraction of MobileNetV2 expansion channels '
+             '(see pruning.py) and export the pruned model'
+    )
+    args = parser.parse_args()
+    if args.prune is not None and not 0 < args.prune < 1:
+        parser.error('--prune must be between 0 and 1')
+    if args.prune and args.loader == 'generator':
+        parser.error('--prune needs --loader tfdata or packed')
+    if args.fast:
+        args.xla = args.mixed_precision = True
+    if args.profile_steps:
+        args.perf = True
+    if is_multi_worker():
+        if args.loader == 'generator':
+            parser.error('multi-worker training needs --loader tfdata or packed')
+        if args.cached_features:
+            parser.error('--cached-features is not supported with multi-worker training')
+        if args.prune:
+            parser.error('--prune is not supported with multi-worker training')
+        if args.perf:
+            parser.error('--perf/--profile-steps are not supported with multi-worker training')
+    return args
 
 def main():
     """
     Main training pipeline
+    
+    Every stage persists its result under models/runs/<config hash>/ (see
+    run_state.py): re-running resumes an interrupted phase from its last
+    epoch and skips stages whose inputs have not changed.
     """
+    args = parse_args()
+    
+    # Single-process unless TF_CONFIG describes a cluster (see distributed.py);
+    # must exist before any other TensorFlow op
+    strategy = create_strategy()
+    
     print("=" * 60)
     print("Receipt Detection CNN - Training Pipeline")
     print("=" * 60)
     
-    # Create model
-    model, base_model = create_model()
-    
-    # Create data generators
-    train_gen, val_gen = create_data_generators()
-    
-    # Phase 1: Initial training
-    history = train_initial(model, train_gen, val_gen)
-    
-    # Phase 2: Fine-tuning
-    history_fine = fine_tune(model, base_model, train_gen, val_gen)
-    
-    # Evaluate
-    print("\n Final Evaluation:")
-    results = model.evaluate(val_gen, verbose=0)
+    # Training mode (must be set before the model is built)
+    policy = enable_fast_training(args.mixed_precision)
+    print(f" Training mode: XLA {'on' if args.xla else 'off'}, dtype policy {policy}, "
+          f"steps_per_execution={args.steps_per_execution}")
+    
+    # Everything that changes the trained weights; XLA and
+    # steps_per_execution only change speed, so runs can resume across them.
+    # Workers keep separate state (the chief's under RUNS_DIR, the others in
+    # temp dirs) that can disagree on which stages or epochs are done, and a
+    # worker that skips a fit() the others run hangs their collectives, so a
+    # multi-worker run starts every stage fresh on all workers
+    run = TrainingRun({
+        'img_size': IMG_SIZE,
+        'alpha': ALPHA,
+        'batch_size': BATCH_SIZE * strategy.num_replicas_in_sync,
+        'learning_rates': [LEARNING_RATE_INITIAL, LEARNING_RATE_FINETUNE],
+        'head': [DENSE_UNITS, DROPOUT],
+        'unfreeze_layers': UNFREEZE_LAYERS,
+        'loader': args.loader,
+        'dtype_policy': policy,
+        'dataset': dataset_fingerprint([TRAIN_DIR, VAL_DIR], IMG_SIZE),
+    }, runs_dir=worker_path(RUNS_DIR), restart=args.restart, resume=not is_multi_worker())
+    print(f" Run directory: {run.run_dir}")
+    if not run.resume:
+        print(" Multi-worker run: saved stages and epoch checkpoints are not resumed")
+    
+    phase1 = run.stage('phase1', {
+        'epochs': EPOCHS_INITIAL,
+        'cached_features': args.cached_features,
+        'feature_variants': args.feature_variants if args.cached_features else None,
+    })
+    phase2 = run.stage('phase2', {'phase1': phase1.key, 'epochs': EPOCHS_FINETUNE})
+    prune = run.stage('prune', {'phase2': phase2.key, 'sparsity': args.prune, 'epochs': PRUNE_EPOCHS})
+    # Later stages depend on the pruned model when pruning is on
+    trained = prune.key if args.prune else phase2.key
+    evaluation = run.stage('evaluate', {'phase2': trained})
+    export = run.stage('export', {'phase2': trained, 'mode': args.tflite_mode,
+                                  'report': args.export_report})
+    plot = run.stage('plot', {'phase2': phase2.key})
+    perf = PerfReport(worker_path(PERF_REPORT_PATH), args.profile_steps) if args.perf else None
+    
+    if args.loader == 'packed':
+        pack_before_training([TRAIN_DIR, VAL_DIR], strategy, IMG_SIZE)
+    
+    with strategy.scope():
+        # Create model
+        model, base_model = create_model()
+        
+        # Create data generators
+        train_gen, val_gen, steps = create_data_generators(args.loader, shard_spec())
+        
+        # Phase 1: Initial training
+        if phase1.done:
+            print("\n Phase 1: already complete, skipping")
+            history = phase1.load_history()
+            if not phase2.done:
+                phase1.load_weights(model)
+        else:
+            if args.cached_features:
+                history = train_initial_cached(model, args.loader, args.feature_variants,
+                                               args.xla, args.steps_per_execution, phase1, perf)
+            else:
+                history = train_initial(model, train_gen, val_gen, args.xla,
+                                        args.steps_per_execution, steps, phase1, perf)
+            phase1.complete(model=model, history=history.history)
+        
+        # Phase 2: Fine-tuning
+        if phase2.done:
+            print(" Phase 2: already complete, skipping")
+            history_fine = phase2.load_history()
+            phase2.load_weights(model)
+        else:
+            history_fine = fine_tune(model, base_model, train_gen, val_gen,
+                                     args.xla, args.steps_per_execution, steps, phase2, perf)
+            phase2.complete(model=model, history=history_fine.history)
+        
+        # Optional: structured channel pruning (changes the architecture,
+        # so the stage keeps a full model file instead of weights). The
+        # stage owns its copy; PRUNED_MODEL_PATH is only written on export
+        if args.prune:
+            if prune.done and os.path.exists(prune.outputs['model']):
+                print(" Pruning: already complete, skipping")
+                model = load_model(prune.outputs['model'])
+            else:
+                model, prune_report = prune_model(model, train_gen, val_gen, args.prune, PRUNE_EPOCHS)
+                model.save(prune.path('model.keras'))
+                save_report(prune_report, prune.path('pruning_report.json'))
+                prune.complete({'model': prune.path('model.keras'),
+                                'report': prune.path('pruning_report.json')})
+        
+        # Evaluate
+        print("\n Final Evaluation:")
+        if evaluation.done:
+            results = evaluation.outputs['results']
+        else:
+            if not model.compiled:
+                model.compile(
+                    loss='binary_crossentropy',
+                    metrics=['accuracy', tf.keras.metrics.Precision(), tf.keras.metrics.Recall()]
+                )
+            results = model.evaluate(val_gen, steps=steps[1], verbose=0)
+            evaluation.complete({'results': [float(value) for value in results]})
     print(f"   - Loss: {results[0]:.4f}")
     print(f"   - Accuracy: {results[1]:.4f}")
     print(f"   - Precision: {results[2]:.4f}")
     print(f"   - Recall: {results[3]:.4f}")
     
-    # Convert to TFLite
-    convert_to_tflite(model)
+    # Throughput summary (compare runs with and without --fast/--xla/--mixed-precision)
+    for name, hist in (('Phase 1', history), ('Phase 2', history_fine)):
+        rates = hist.history.get('images_per_sec')
+        if rates:
+            print(f"   - {name} throughput: {sum(rates) / len(rates):.1f} images/sec")
+    
+    if not is_chief():
+        print("\n Worker done (the chief writes the model and TFLite export)")
+        barrier(strategy)
+        return
+    
+    # Export the pruned model and its report next to the other models
+    if args.prune:
+        model.save(PRUNED_MODEL_PATH)
+        shutil.copyfile(prune.outputs['report'], PRUNING_REPORT_PATH)
+    
+    # Convert to TFLite (skipped if this exact export is already in place)
+    if export.done and os.path.exists(TFLITE_SAVE_PATH) \
+            and file_sha256(TFLITE_SAVE_PATH) == export.outputs['sha256']:
+        print(f"\n TFLite model up to date: {TFLITE_SAVE_PATH}")
+    else:
+        convert_to_tflite(model, args.tflite_mode, args.export_report)
+        export.complete({'path': TFLITE_SAVE_PATH, 'sha256': file_sha256(TFLITE_SAVE_PATH)})
     
     # Plot history
-    plot_training_history(history, history_fine)
+    if not (plot.done and os.path.exists(HISTORY_PLOT_PATH)):
+        plot_training_history(history, history_fine)
+        plot.complete({'path': HISTORY_PLOT_PATH})
+    
+    # Record the training images so quick_finetune.py --incremental can
+    # pick up only the ones added later, for the model that was evaluated
+    # and exported (the pruned one with --prune)
+    save_manifest(TRAIN_DIR, PRUNED_MODEL_PATH if args.prune else MODEL_SAVE_PATH,
+                  metrics={'val_accuracy': results[1]})
+    barrier(strategy)
     
     print("\n Training complete!")
     print(f"   - Model saved: {MODEL_SAVE_PATH}")
+    if args.prune:
+        print(f"   - Pruned model: {PRUNED_MODEL_PATH} (report: {PRUNING_REPORT_PATH})")
     print(f"   - TFLite model: {TFLITE_SAVE_PATH}")
+    if perf and perf.epochs:
+        print(f"   - Performance report: {perf.path}")
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,100 @@
+"""
+Fast-training options: XLA + bfloat16 mixed precision
+
+- enable_fast_training() turns on mixed_bfloat16 when the CPU has native
+  bf16 support (AVX512_BF16 / AMX), otherwise keeps float32
+- compile_options() adds jit_compile (XLA) and steps_per_execution
+- ThroughputLogger prints images/sec per epoch so both modes can be compared
+- to_float32_model() rebuilds a mixed-precision model in float32 for export
+"""
+
+import time
+import tensorflow as tf
+
+BF16_CPU_FLAGS = ('avx512_bf16', 'amx_bf16')
+
+def cpu_supports_bf16():
+    """True if the CPU advertises native bfloat16 instructions (Linux only)"""
+    try:
+        with open('/proc/cpuinfo') as f:
+            flags = f.read()
+    except OSError:
+        return False
+    return any(flag in flags for flag in BF16_CPU_FLAGS)
+
+def enable_fast_training(mixed_precision=True):
+    """
+    Set the global dtype policy for fast training
+
+    Must run before the model is built. Returns the policy name in use.
+    """
+    policy = 'float32'
+    if mixed_precision:
+        if cpu_supports_bf16() or tf.config.list_physical_devices('GPU'):
+            policy = 'mixed_bfloat16'
+        else:
+            print("   - CPU has no native bfloat16 support, keeping float32")
+    tf.keras.mixed_precision.set_global_policy(policy)
+    return policy
+
+def compile_options(xla=False, steps_per_execution=1):
+    """Extra model.compile() arguments for the chosen mode"""
+    options = {'steps_per_execution': steps_per_execution}
+    if xla:
+        options['jit_compile'] = True
+    return options
+
+def _float32_config(config):
+    """Copy of a model config with every dtype policy replaced by float32"""
+    if isinstance(config, dict):
+        if config.get('class_name') == 'DTypePolicy':
+            return {**config, 'config': {**config['config'], 'name': 'float32'}}
+        return {key: _float32_config(value) for key, value in config.items()}
+    if isinstance(config, list):
+        return [_float32_config(value) for value in config]
+    if config in ('mixed_bfloat16', 'mixed_float16'):
+        return 'float32'
+    return config
+
+def to_float32_model(model):
+    """
+    Float32 copy of a (possibly mixed-precision) model, e.g. for TFLite export
+
+    Variables are float32 under mixed precision already, so weights carry over.
+    """
+    if model.dtype_policy.name == 'float32' and all(
+            layer.dtype_policy.name == 'float32' for layer in model.layers):
+        return model
+    float_model = model.__class__.from_config(_float32_config(model.get_config()))
+    float_model.set_weights(model.get_weights())
+    return float_model
+
+class ThroughputLogger(tf.keras.callbacks.Callback):
+    """Print training images/sec at the end of every epoch"""
+
+    def __init__(self, batch_size, samples=None, label=''):
+        super().__init__()
+        self.batch_size = batch_size
+        self.samples = samples
+        self.label = label
+        self.rates = []
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self.start = time.perf_counter()
+        self.train_end = self.start
+        self.last_batch = -1
+
+    def on_train_batch_end(self, batch, logs=None):
+        # Time of the last training step, so validation is not counted
+        self.train_end = time.perf_counter()
+        self.last_batch = batch
+
+    def on_epoch_end(self, epoch, logs=None):
+        elapsed = self.train_end - self.start
+        steps = self.params.get('steps') or (self.last_batch + 1)
+        images = self.samples or steps * self.batch_size
+        rate = images / elapsed if elapsed > 0 else 0.0
+        self.rates.append(rate)
+        if logs is not None:
+            logs['images_per_sec'] = rate
+        print(f"   - {self.label}epoch {epoch + 1}: {rate:.1f} images/sec ({elapsed:.1f}s)")